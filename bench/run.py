@@ -0,0 +1,573 @@
+"""Sublime 없이 플러그인 모듈을 불러와 주요 경로의 처리량과 지연을 측정한다.
+
+    python3 bench/run.py
+    python3 bench/run.py --only streaming,diff --delta-rate 500 --json
+
+스텁 서버 옵션(--delta-rate, --chunk-size, --response-chars, --sessions,
+--messages-per-session, --terminal-latency-ms 등)은 bench/stub_server.py와 같다.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [BENCH_DIR, os.path.join(os.path.dirname(BENCH_DIR), "sublime")]
+
+import sublime  # noqa: E402
+import stub_server  # noqa: E402
+import sublime_ai_agent as agent  # noqa: E402
+
+
+def _percentiles(values):
+    if not values:
+        return {}
+    return {
+        "p50": agent._percentile(values, 0.5),
+        "p90": agent._percentile(values, 0.9),
+        "max": max(values)
+    }
+
+
+def _wait_idle(timeout=30.0):
+    deadline = time.monotonic() + timeout
+    manager = agent._get_request_manager()
+    while manager.in_flight() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    sublime.drain(max(0.0, deadline - time.monotonic()))
+
+
+def _new_view(window, text="", file_name=None):
+    view = window.new_view(text, file_name)
+    agent._view_state(view).set_terminal_policy("deny")
+    return view
+
+
+def bench_streaming(server, args):
+    payload = agent._build_rpc_request("bench", {"file": None, "selection": ""})
+    noop = lambda *a: None  # noqa: E731
+    errors = []
+    records = []
+    started = time.monotonic()
+    for _ in range(args.requests):
+        metrics = agent._RequestMetrics("bench")
+        # _send_streaming_rpc가 끝날 때 metrics.finish로 기록하므로 그 기록을 그대로 쓴다.
+        agent._send_streaming_rpc(payload, noop, noop, noop, errors.append, metrics=metrics)
+        records.append(metrics.record)
+    elapsed = time.monotonic() - started
+    deltas = sum(r["deltas"] for r in records)
+    chars = sum(r["chars"] for r in records)
+    result = {
+        "requests": args.requests,
+        "errors": len(errors),
+        "requestsPerSec": args.requests / elapsed,
+        "deltasPerSec": deltas / elapsed,
+        "charsPerSec": chars / elapsed
+    }
+    for key in ("headersMs", "firstDeltaMs", "totalMs"):
+        result[key] = _percentiles([r[key] for r in records if r[key] is not None])
+    return result
+
+
+def bench_commands(server, args):
+    window = sublime.active_window()
+    view = _new_view(window, "def bench():\n    return 1\n", "/tmp/bench.py")
+    recorder = agent._get_metrics_recorder()
+    before = len(recorder.records("chat"))
+    started = time.monotonic()
+    for _ in range(args.requests):
+        agent.AiAgentChatCommand(window).on_done("bench")
+        _wait_idle()
+    elapsed = time.monotonic() - started
+    records = recorder.records("chat")[before:]
+    result = {"requests": len(records), "requestsPerSec": len(records) / elapsed}
+    for key in ("firstDeltaMs", "totalMs", "uiLagMs", "uiLagMaxMs"):
+        result[key] = _percentiles([r[key] for r in records if r[key] is not None])
+    result["renderer"] = agent._get_renderer(window).stats()
+    return result
+
+
+def bench_extraction(server, args):
+    text = server.state.response
+    size = max(1, args.chunk_size)
+    chunks = [text[i:i + size] for i in range(0, len(text), size)]
+    window = sublime.active_window()
+    rounds = max(1, args.requests)
+    found = 0
+    started = time.monotonic()
+    for _ in range(rounds):
+        view = _new_view(window)
+        state = agent._view_state(view)
+        for chunk in chunks:
+            agent._maybe_trigger_terminal(view, chunk)
+        agent._maybe_trigger_terminal(view, "", final=True)
+        found += len(state.terminal_seen)
+        agent._drop_view_state(view)
+    streamed = time.monotonic() - started
+    started = time.monotonic()
+    for _ in range(rounds):
+        whole = agent._extract_terminal_commands(text)
+    batch = time.monotonic() - started
+    megabytes = len(text.encode("utf-8")) * rounds / 1e6
+    return {
+        "chunks": len(chunks),
+        "commandsPerResponse": found // rounds,
+        "wholeTextCommands": len(whole),
+        "streamedMBPerSec": megabytes / streamed,
+        "streamedChunksPerSec": len(chunks) * rounds / streamed,
+        "wholeTextMBPerSec": megabytes / batch if batch else None
+    }
+
+
+def bench_history(server, args):
+    total = len(server.state.sessions)
+    agent._get_session_cache().clear()
+    result = {"sessions": total}
+    for label in ("cold", "warm"):
+        started = time.monotonic()
+        offset = 0
+        while offset < total:
+            data, error = agent._fetch_session_index(offset)
+            if error:
+                raise RuntimeError(error)
+            offset += len(data["sessions"]) or total
+        result[label + "IndexMs"] = (time.monotonic() - started) * 1000
+
+    window = sublime.active_window()
+    view = _new_view(window)
+    browser = agent._HistoryBrowser(view)
+    data, _ = agent._fetch_session_index(0)
+    browser.sessions = data["sessions"]
+    browser.total = data["total"]
+    started = time.monotonic()
+    for summary in browser.sessions[:args.expand]:
+        page, error = agent._fetch_session_page(summary["id"])
+        if error:
+            raise RuntimeError(error)
+        browser.expanded[summary["id"]] = {
+            "start": 0, "messages": page["messages"], "total": page["total"]
+        }
+    result["expandFetchMs"] = (time.monotonic() - started) * 1000
+    timings = []
+    for _ in range(max(1, args.requests)):
+        started = time.monotonic()
+        browser.render()
+        timings.append((time.monotonic() - started) * 1000)
+    result["renderMs"] = _percentiles(timings)
+    result["popupChars"] = len(view.popup[0]) if view.popup else 0
+    return result
+
+
+def _edited_copy(lines, fraction, rng):
+    edited = list(lines)
+    for _ in range(max(1, int(len(lines) * fraction))):
+        index = rng.randrange(len(edited))
+        action = rng.random()
+        if action < 0.4:
+            edited[index] = edited[index] + "  # changed"
+        elif action < 0.7:
+            edited.insert(index, "    inserted = {}".format(index))
+        elif len(edited) > 1:
+            del edited[index]
+    return edited
+
+
+def bench_diff(server, args):
+    rng = random.Random(17)
+    results = {}
+    for count in args.diff_lines:
+        lines = ["    value_{0} = compute({0}, {1})".format(i, i % 7) for i in range(count)]
+        edited = _edited_copy(lines, args.diff_fraction, rng)
+        original, new = "\n".join(lines), "\n".join(edited)
+        started = time.monotonic()
+        opcodes = agent._diff_opcodes(lines, edited)
+        diff_ms = (time.monotonic() - started) * 1000
+        started = time.monotonic()
+        html_text = agent._build_diff_html(original, new, opcodes)
+        html_ms = (time.monotonic() - started) * 1000
+        view = _new_view(sublime.active_window(), original)
+        started = time.monotonic()
+        preview = agent._DiffPreview(
+            view, sublime.Region(0, len(original)), original, new, opcodes
+        )
+        preview.render()
+        render_ms = (time.monotonic() - started) * 1000
+        results[str(count)] = {
+            "hunks": len(preview.hunks),
+            "diffMs": diff_ms,
+            "popupHtmlMs": html_ms,
+            "popupChars": len(html_text),
+            "previewRenderMs": render_ms
+        }
+        preview.close()
+    return results
+
+
+def bench_terminal(server, args):
+    window = sublime.active_window()
+    view = window.new_view()
+    state = agent._view_state(view)
+    state.set_terminal_policy("allow")
+    commands = ["echo terminal-{}".format(i) for i in range(args.terminal_commands)]
+    started = time.monotonic()
+    agent._enqueue_terminal_commands(view, commands)
+    sublime.set_timeout(lambda: agent._process_terminal_queue(view), 0)
+    sublime.drain()
+    deadline = time.monotonic() + 60
+    while state.terminal_batch is not None and time.monotonic() < deadline:
+        time.sleep(0.005)
+    elapsed = time.monotonic() - started
+    serial = args.terminal_commands * server.state.config["terminal_latency_ms"] / 1000.0
+    return {
+        "commands": args.terminal_commands,
+        "elapsedMs": elapsed * 1000,
+        "serialEstimateMs": serial * 1000,
+        "speedup": serial / elapsed if elapsed else None
+    }
+
+
+def bench_edit(server, args):
+    rng = random.Random(21)
+    lines = ["    value_{0} = compute({0}, {1})".format(i, i % 7) for i in range(args.edit_lines)]
+    original = "\n".join(lines)
+    proposed = "\n".join(_edited_copy(lines, args.diff_fraction, rng))
+    window = sublime.active_window()
+    view = _new_view(window, original + "\n", "/tmp/bench_edit.py")
+    view.sel()[0] = sublime.Region(0, len(original))
+    previous = server.state.response, server.state.config["delta_rate"]
+    server.state.response = "선택 영역을 정리했습니다.\n```python\n{}\n```\n".format(proposed)
+    server.state.config["delta_rate"] = args.edit_delta_rate
+    recorder = agent._get_metrics_recorder()
+    before = len(recorder.records("edit"))
+    settings = sublime.load_settings(agent.SETTINGS_FILE)
+    try:
+        runs = max(1, args.requests // 4)
+        for index in range(runs + 1):
+            if index == runs:
+                settings.set("edit_streaming_preview", False)
+            agent.AiAgentEditCommand(view).run(None, refresh=True)
+            deadline = time.monotonic() + 60
+            while len(recorder.records("edit")) <= before + index and time.monotonic() < deadline:
+                time.sleep(0.005)
+            _wait_idle()
+            preview = agent._view_state(view).diff_preview
+            if preview is not None:
+                preview.close()
+    finally:
+        settings.erase("edit_streaming_preview")
+        server.state.response, server.state.config["delta_rate"] = previous
+    records = recorder.records("edit")[before:]
+    streamed, plain = records[:-1], records[-1]
+    result = {"lines": args.edit_lines, "requests": len(streamed)}
+    for key in ("firstDeltaMs", "firstPreviewMs", "totalMs", "uiLagMaxMs"):
+        result[key] = _percentiles([r[key] for r in streamed if r[key] is not None])
+    result["withoutPreviewFirstActionableMs"] = plain["totalMs"]
+    return result
+
+
+def bench_project(server, args):
+    folder = tempfile.mkdtemp(prefix="ai-agent-project-")
+    for index in range(args.project_files):
+        with open(os.path.join(folder, "module_{:03d}.py".format(index)), "w") as f:
+            f.write("def handler_{0}(value):\n    return value * {0}\n".format(index))
+    window = sublime.active_window()
+    window.set_folders([folder])
+    settings = sublime.load_settings(agent.SETTINGS_FILE)
+    settings.set("project_review_include", ["*.py"])
+    previous_rate = server.state.config["delta_rate"]
+    server.state.config["delta_rate"] = args.project_delta_rate
+    results = {"files": args.project_files}
+    try:
+        for concurrency in args.project_concurrency:
+            settings.set("project_review_concurrency", concurrency)
+            review = agent._ProjectReview(window, refresh=True)
+            reports = len(window.views())
+            started = time.monotonic()
+            review.start()
+            deadline = started + 120
+            while len(window.views()) == reports and time.monotonic() < deadline:
+                time.sleep(0.005)
+            elapsed = time.monotonic() - started
+            results["concurrency{}".format(concurrency)] = {
+                "elapsedMs": elapsed * 1000,
+                "filesPerSec": review.done / elapsed
+            }
+        review = agent._ProjectReview(window)
+        reports = len(window.views())
+        started = time.monotonic()
+        review.start()
+        while len(window.views()) == reports and time.monotonic() < started + 30:
+            time.sleep(0.005)
+        results["unchangedRerunMs"] = (time.monotonic() - started) * 1000
+    finally:
+        server.state.config["delta_rate"] = previous_rate
+        window.set_folders([])
+        shutil.rmtree(folder, ignore_errors=True)
+    return results
+
+
+def _reset_transport():
+    if agent._backends is not None:
+        agent._backends.close()
+    agent._backends = None
+
+
+def bench_transport(server, args):
+    payload = agent._build_rpc_request("bench", {"file": None, "selection": ""})
+    noop = lambda *a: None  # noqa: E731
+    settings = sublime.load_settings(agent.SETTINGS_FILE)
+    socket_path = server.unix_server.server_address if server.unix_server else None
+    previous = server.state.response
+    server.state.response = previous[:args.transport_response_chars]
+    modes = (("http", ""), ("http", socket_path), ("mux", ""), ("mux", socket_path))
+    results = {}
+    try:
+        for transport, path in modes:
+            if path is None:
+                continue
+            _reset_transport()
+            settings.set("transport", transport)
+            settings.set("server_socket", path)
+            records = []
+            started = time.monotonic()
+            for _ in range(args.requests):
+                metrics = agent._RequestMetrics("bench")
+                agent._send_streaming_rpc(payload, noop, noop, noop, noop, metrics=metrics)
+                records.append(metrics.record)
+            sequential = time.monotonic() - started
+
+            def burst():
+                for _ in range(args.requests):
+                    agent._send_streaming_rpc(payload, noop, noop, noop, noop)
+
+            threads = [threading.Thread(target=burst) for _ in range(args.transport_threads)]
+            started = time.monotonic()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            concurrent = time.monotonic() - started
+            name = "{}-{}".format(transport, "unix" if path else "tcp")
+            results[name] = {
+                "requestsPerSec": args.requests / sequential,
+                "concurrentRequestsPerSec": args.requests * args.transport_threads / concurrent,
+                "headersMs": _percentiles([r["headersMs"] for r in records]),
+                "totalMs": _percentiles([r["totalMs"] for r in records])
+            }
+    finally:
+        server.state.response = previous
+        settings.erase("transport")
+        settings.erase("server_socket")
+        _reset_transport()
+    return results
+
+
+def _run_threads(target, count):
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.monotonic() - started
+
+
+def bench_backends(server, args):
+    settings = sublime.load_settings(agent.SETTINGS_FILE)
+    config = dict(server.state.config, response_chars=args.backend_response_chars)
+    # 첫 번째 백엔드는 절반 속도로 응답해 진행 중 요청이 쌓이도록 한다.
+    rates = [args.backend_delta_rate / 2] + [args.backend_delta_rate] * (args.backends - 1)
+    servers = [stub_server.serve(dict(config, delta_rate=rate)) for rate in rates]
+    running = list(servers)
+    noop = lambda *a: None  # noqa: E731
+    lock = threading.Lock()
+    sessions = []
+    errors = []
+
+    def burst():
+        for _ in range(args.requests):
+            started = []
+            payload = agent._build_rpc_request("bench", {"file": None, "selection": ""})
+            agent._send_streaming_rpc(payload, started.append, noop, noop, errors.append)
+            with lock:
+                sessions.extend(started)
+
+    def routed(backends):
+        return {backend.name: backend.routed for backend in backends.backends}
+
+    results = {}
+    try:
+        _reset_transport()
+        settings.set("servers", ["127.0.0.1:{}".format(s.server_address[1]) for s in servers])
+        backends = agent._get_backends()
+        elapsed = _run_threads(burst, args.transport_threads)
+        total = args.requests * args.transport_threads
+        results["balanced"] = {
+            "requests": total,
+            "errors": len(errors),
+            "requestsPerSec": total / elapsed,
+            "routed": routed(backends),
+            "latencyMs": {b.name: round(b.latency_ms or 0.0, 1) for b in backends.backends}
+        }
+
+        resumed = sum(s.state.counts.get("rpc resumed", 0) for s in servers)
+        continued = sessions[:args.requests]
+        for session_id in continued:
+            payload = agent._build_rpc_request("continue", {"file": None, "selection": ""})
+            payload["params"]["sessionId"] = session_id
+            agent._send_streaming_rpc(payload, noop, noop, noop, errors.append)
+        results["affinity"] = {
+            "continued": len(continued),
+            "resumedOnOwner": sum(s.state.counts.get("rpc resumed", 0) for s in servers) - resumed
+        }
+
+        # 백엔드 하나를 내리고 같은 부하를 다시 보낸다.
+        stopped = running.pop()
+        stub_server.stop(stopped)
+        stopped.server_close()
+        backends.backends[-1].close()
+        del errors[:]
+        before = routed(backends)
+        elapsed = _run_threads(burst, args.transport_threads)
+        after = routed(backends)
+        results["failover"] = {
+            "requests": total,
+            "errors": len(errors),
+            "requestsPerSec": total / elapsed,
+            "routed": {name: after[name] - before[name] for name in after},
+            "failovers": backends.stats().get("failovers", 0),
+            "ejected": ",".join(
+                b.name for b in backends.backends if b.breaker.state != b.breaker.CLOSED
+            ) or "-"
+        }
+    finally:
+        settings.erase("servers")
+        _reset_transport()
+        for stub in running:
+            stub_server.stop(stub)
+    return results
+
+
+def bench_conversation(server, args):
+    settings = sublime.load_settings(agent.SETTINGS_FILE)
+    window = sublime.active_window()
+    text = "".join("line {} = compute({})\n".format(i, i) for i in range(args.conversation_lines))
+    previous = server.state.response
+    server.state.response = previous[:args.transport_response_chars]
+    results = {}
+    try:
+        for mode, enabled in (("fresh", False), ("continue", True)):
+            settings.set("chat_continue_session", enabled)
+            view = _new_view(window, text, "/tmp/bench_conversation.py")
+            counts = dict(server.state.counts)
+            started = time.monotonic()
+            for turn in range(args.requests):
+                if turn % 4 == 3:
+                    # 가끔 파일을 고쳐 바뀐 컨텍스트만 보내는 경로도 지나가게 한다.
+                    view.run_command("append", {"characters": "extra_{} = 1\n".format(turn)})
+                agent.AiAgentChatCommand(window).on_done("turn {}".format(turn))
+                _wait_idle()
+            elapsed = time.monotonic() - started
+            sent = {
+                key: server.state.counts.get(key, 0) - counts.get(key, 0)
+                for key in ("rpc context chars", "rpc new session", "rpc resumed")
+            }
+            results[mode] = {
+                "turns": args.requests,
+                "turnsPerSec": args.requests / elapsed,
+                "contextCharsPerTurn": sent["rpc context chars"] / args.requests,
+                "newSessions": sent["rpc new session"],
+                "resumed": sent["rpc resumed"]
+            }
+        results["sessionContext"] = agent._session_contexts.stats()
+    finally:
+        server.state.response = previous
+        settings.erase("chat_continue_session")
+    return results
+
+
+BENCHMARKS = (
+    ("streaming", bench_streaming),
+    ("commands", bench_commands),
+    ("extraction", bench_extraction),
+    ("history", bench_history),
+    ("diff", bench_diff),
+    ("terminal", bench_terminal),
+    ("edit", bench_edit),
+    ("project", bench_project),
+    ("transport", bench_transport),
+    ("backends", bench_backends),
+    ("conversation", bench_conversation)
+)
+
+
+def _print_result(name, result, indent="  "):
+    print("[{}]".format(name) if indent == "  " else "{}{}".format(indent[:-2], name))
+    for key, value in result.items():
+        if isinstance(value, dict):
+            _print_result(key, value, indent + "  ")
+        elif isinstance(value, float):
+            print("{}{:<22}{:>14.2f}".format(indent, key, value))
+        else:
+            print("{}{:<22}{:>14}".format(indent, key, value))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AI Agent 플러그인 벤치마크")
+    parser.add_argument("--only", default="", help="쉼표로 구분한 벤치마크 이름")
+    parser.add_argument("--requests", type=int, default=20, help="반복 횟수")
+    parser.add_argument("--expand", type=int, default=5, help="history: 펼칠 세션 수")
+    parser.add_argument(
+        "--diff-lines", type=lambda s: [int(x) for x in s.split(",")], default=[1000, 10000]
+    )
+    parser.add_argument("--diff-fraction", type=float, default=0.02)
+    parser.add_argument("--terminal-commands", type=int, default=8)
+    parser.add_argument("--edit-lines", type=int, default=400)
+    parser.add_argument("--edit-delta-rate", type=float, default=1000.0)
+    parser.add_argument("--project-files", type=int, default=24)
+    parser.add_argument(
+        "--project-concurrency", type=lambda s: [int(x) for x in s.split(",")], default=[1, 4]
+    )
+    parser.add_argument("--project-delta-rate", type=float, default=2000.0)
+    parser.add_argument("--transport-threads", type=int, default=8)
+    parser.add_argument("--transport-response-chars", type=int, default=400)
+    parser.add_argument("--backends", type=int, default=3)
+    parser.add_argument("--backend-delta-rate", type=float, default=400.0)
+    parser.add_argument("--backend-response-chars", type=int, default=960)
+    parser.add_argument("--conversation-lines", type=int, default=600)
+    parser.add_argument("--json", action="store_true", help="결과를 JSON으로 출력")
+    stub_server.add_config_arguments(parser)
+    args = parser.parse_args()
+
+    config = {key: getattr(args, key) for key in stub_server.DEFAULT_CONFIG}
+    socket_dir = tempfile.mkdtemp(prefix="ai-agent-bench-")
+    socket_path = os.path.join(socket_dir, "stub.sock") if hasattr(socket, "AF_UNIX") else None
+    server = stub_server.serve(config, socket_path=socket_path)
+    agent.SERVER_HOST, agent.SERVER_PORT = server.server_address[:2]
+    selected = set(filter(None, args.only.split(",")))
+
+    results = {}
+    for name, bench in BENCHMARKS:
+        if selected and name not in selected:
+            continue
+        results[name] = bench(server, args)
+        if not args.json:
+            _print_result(name, results[name])
+    results["serverRequests"] = server.state.counts
+    if args.json:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+    else:
+        _print_result("serverRequests", results["serverRequests"])
+    agent.plugin_unloaded()
+    stub_server.stop(server)
+    shutil.rmtree(socket_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,580 @@
+"""벤치마크용 에이전트 서버 스텁.
+
+/rpc NDJSON 스트리밍, /api/agent/sessions*, /api/agent/terminal/* 와
+멀티플렉스 채널(GET /mux Upgrade)을 흉내 낸다. --socket을 주면 Unix 소켓에서도 받는다.
+단독으로 실행하면 실제 Sublime 플러그인을 스텁에 붙여 볼 수 있다.
+
+    python3 bench/stub_server.py --port 3000 --delta-rate 200
+    python3 bench/stub_server.py --socket /tmp/ai-agent.sock
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+MUX_PROTOCOL = "ai-agent-mux"
+
+
+DEFAULT_CONFIG = {
+    # 초당 보낼 delta 수 (0이면 대기 없이 전송)
+    "delta_rate": 0.0,
+    # delta 하나의 문자 수
+    "chunk_size": 24,
+    # 응답 본문 길이(문자 수)
+    "response_chars": 8000,
+    # 응답 본문에 넣을 bash 코드 블록 수
+    "terminal_blocks": 3,
+    # 세션 수와 세션당 메시지 수
+    "sessions": 200,
+    "messages_per_session": 40,
+    # 터미널 명령 하나의 실행 시간(ms)과 출력 줄 수
+    "terminal_latency_ms": 50,
+    "terminal_output_lines": 20,
+    # 멀티플렉스 채널(GET /mux Upgrade) 지원 여부 (0이면 HTTP만 지원하는 서버처럼 동작)
+    "mux": 1,
+    # 세션에 저장한 컨텍스트와 합치는 요청(context.inherit) 지원 여부
+    "session_context": 1,
+    # 선택 영역을 해시나 줄 단위 델타(context.selectionHash/selectionDelta)로 받는지 여부
+    "context_cache": 1,
+    # 1이면 세션 색인, 일괄 API, 멀티플렉스 채널, capabilities가 없는 이전 서버처럼 동작한다
+    "legacy": 0
+}
+
+WORDS = (
+    "agent", "stream", "buffer", "session", "render", "window", "panel", "context",
+    "선택", "영역", "응답", "세션", "파일", "명령", "결과", "검색"
+)
+
+
+def build_response(config):
+    size = int(config["response_chars"])
+    blocks = int(config["terminal_blocks"])
+    words = itertools.cycle(WORDS)
+    parts = []
+    length = 0
+    line = []
+    while length < size:
+        word = next(words)
+        line.append(word)
+        length += len(word) + 1
+        if len(line) == 12:
+            parts.append(" ".join(line))
+            line = []
+    if line:
+        parts.append(" ".join(line))
+    step = max(1, len(parts) // (blocks + 1))
+    for index in range(blocks, 0, -1):
+        parts.insert(index * step, "```bash\necho bench-{}\n```".format(index))
+    return "\n".join(parts)
+
+
+def build_sessions(config):
+    sessions = {}
+    words = itertools.cycle(WORDS)
+    for index in range(int(config["sessions"])):
+        session_id = "bench-{:05d}".format(index)
+        messages = []
+        for position in range(int(config["messages_per_session"])):
+            content = " ".join(next(words) for _ in range(20 + position % 40))
+            messages.append({
+                "role": ("user", "assistant", "tool")[position % 3],
+                "content": content,
+                "createdAt": "2026-01-01T00:{:02d}:{:02d}.000Z".format(position // 60 % 60, position % 60)
+            })
+        sessions[session_id] = {
+            "id": session_id,
+            "createdAt": "2026-01-01T00:00:00.000Z",
+            "updatedAt": "2026-01-02T00:00:{:02d}.000Z".format(index % 60),
+            "messages": messages
+        }
+    return sessions
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def apply_line_delta(base, ops):
+    base_lines = base.split("\n")
+    lines = []
+    cursor = 0
+    for start, end, replacement in ops:
+        lines.extend(base_lines[cursor:start])
+        lines.extend(replacement)
+        cursor = end
+    lines.extend(base_lines[cursor:])
+    return "\n".join(lines)
+
+
+def summarize(session):
+    first = next((m["content"] for m in session["messages"] if m["role"] == "user"), "")
+    return {
+        "id": session["id"],
+        "createdAt": session["createdAt"],
+        "updatedAt": session["updatedAt"],
+        "messageCount": len(session["messages"]),
+        "firstPrompt": first[:120]
+    }
+
+
+class StubState(object):
+    def __init__(self, config):
+        self.config = dict(DEFAULT_CONFIG, **(config or {}))
+        self.response = build_response(self.config)
+        self.sessions = build_sessions(self.config)
+        self.terminal_requests = {}
+        self.rpc_sessions = {}
+        self.contexts = {}
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def count(self, key, amount=1):
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + amount
+
+
+class StubRoutes(object):
+    """/rpc와 터미널 엔드포인트. HTTP 처리기와 멀티플렉스 채널이 함께 쓴다."""
+
+    cancelled = False
+
+    def post(self, path, body):
+        self.state.count("POST " + path)
+        if self.state.config["legacy"] and (
+            path == "/api/agent/terminal/request-batch" or path.endswith("/messages/batch")
+        ):
+            return self._no_route("POST", path)
+        if path == "/rpc":
+            return self._rpc(body)
+        if path.startswith("/api/agent/sessions/"):
+            session_id = path.split("/")[4]
+            with self.state.lock:
+                known = session_id in self.state.sessions or session_id in self.state.rpc_sessions
+            if not known:
+                return self._json(404, {"error": "세션을 찾을 수 없습니다."})
+            return self._json(200, {"ok": True})
+        if path == "/api/agent/terminal/request":
+            return self._json(200, self._terminal_request(body.get("command", "")))
+        if path == "/api/agent/terminal/request-batch":
+            requests = [self._terminal_request(command) for command in body.get("commands", [])]
+            return self._json(200, {"requests": requests})
+        if path == "/api/agent/terminal/execute":
+            return self._terminal_execute(body)
+        if path == "/api/agent/terminal/execute-stream":
+            return self._terminal_execute_stream(body)
+        return self._json(404, {"error": "not found"})
+
+    def _rpc(self, body):
+        config = self.state.config
+        text = self.state.response
+        size = max(1, int(config["chunk_size"]))
+        rate = float(config["delta_rate"])
+        request_id = body.get("id")
+        params = body.get("params") or {}
+        context = dict(params.get("context") or {})
+        self.state.count("rpc context chars", len(json.dumps(context, ensure_ascii=False)))
+        if self.state.config["context_cache"] and not self.state.config["legacy"]:
+            context = self._resolve_context(context)
+            if context is None:
+                self.state.count("rpc context missing")
+                return self._json(409, {
+                    "jsonrpc": "2.0",
+                    "error": {"code": -32010, "message": "컨텍스트를 찾을 수 없습니다."},
+                    "id": request_id
+                })
+
+        # 실제 서버처럼 이 서버가 만든 세션이면 이어 쓰고, 아니면 새 세션을 만든다.
+        # inherit 요청은 세션에 저장한 컨텍스트에 바뀐 항목만 덮어쓴다.
+        session_id = params.get("sessionId")
+        inherit = context.pop("inherit", False)
+        with self.state.lock:
+            resumed = session_id in self.state.rpc_sessions
+            if inherit and resumed:
+                context = dict(self.state.rpc_sessions[session_id], **context)
+            if not resumed:
+                session_id = uuid.uuid4().hex
+            if not inherit or resumed:
+                self.state.rpc_sessions[session_id] = {
+                    key: value for key, value in context.items() if value is not None
+                }
+        if inherit and not resumed:
+            self.state.count("rpc context missing")
+            return self._json(409, {
+                "jsonrpc": "2.0",
+                "error": {"code": -32010, "message": "이어 쓸 세션의 컨텍스트를 찾을 수 없습니다."},
+                "id": request_id
+            })
+        self.state.count("rpc resumed" if resumed else "rpc new session")
+        self._start_ndjson()
+
+        def send(result):
+            self._write_record({"jsonrpc": "2.0", "result": result, "id": request_id})
+
+        send({"type": "start", "sessionId": session_id})
+        started = time.monotonic()
+        for index, offset in enumerate(range(0, len(text), size)):
+            if rate > 0:
+                delay = started + index / rate - time.monotonic()
+                if delay > 0:
+                    self._flush()
+                    time.sleep(delay)
+            if self.cancelled:
+                return
+            send({"type": "delta", "content": text[offset:offset + size]})
+        send({"type": "final", "result": {"type": "message", "content": ""}})
+        self._end_ndjson()
+
+    def _terminal_request(self, command):
+        request = {"id": uuid.uuid4().hex, "command": command}
+        with self.state.lock:
+            self.state.terminal_requests[request["id"]] = command
+        return request
+
+    def _resolve_context(self, context):
+        # 실제 서버(context-store.ts)처럼 전체 선택 영역은 해시로 기억해 두고,
+        # 해시나 델타만 온 요청은 기억한 내용으로 되살린다. 모르는 해시면 None.
+        digest = context.pop("selectionHash", None)
+        delta = context.pop("selectionDelta", None)
+        contexts = self.state.contexts
+        with self.state.lock:
+            if isinstance(context.get("selection"), str):
+                contexts[content_hash(context["selection"])] = context["selection"]
+                return context
+            if not digest:
+                return context
+            if delta:
+                base = contexts.get(delta.get("baseHash"))
+                if base is None:
+                    return None
+                text = apply_line_delta(base, delta.get("ops", []))
+                if content_hash(text) != digest:
+                    return None
+                contexts[digest] = text
+            else:
+                text = contexts.get(digest)
+                if text is None:
+                    return None
+        self.state.count("rpc context resolved")
+        context["selection"] = text
+        return context
+
+    def _take_terminal_request(self, body):
+        with self.state.lock:
+            return self.state.terminal_requests.pop(body.get("requestId"), None)
+
+    def _terminal_output(self, command):
+        lines = int(self.state.config["terminal_output_lines"])
+        return ["{} output line {}\n".format(command, index) for index in range(lines)]
+
+    def _terminal_execute(self, body):
+        command = self._take_terminal_request(body)
+        if command is None:
+            return self._json(404, {"error": "요청을 찾을 수 없습니다."})
+        if not body.get("approve"):
+            self.state.count("terminal rejected")
+            return self._json(200, {"ok": False, "message": "사용자가 실행을 거부했습니다."})
+        time.sleep(float(self.state.config["terminal_latency_ms"]) / 1000.0)
+        stdout = "".join(self._terminal_output(command))
+        self._json(200, {"ok": True, "result": {"stdout": stdout, "stderr": "", "exitCode": 0}})
+
+    def _terminal_execute_stream(self, body):
+        command = self._take_terminal_request(body)
+        if command is None:
+            return self._json(404, {"error": "요청을 찾을 수 없습니다."})
+        if not body.get("approve"):
+            self.state.count("terminal rejected")
+            return self._json(200, {"ok": False, "message": "사용자가 실행을 거부했습니다."})
+        output = self._terminal_output(command)
+        pause = float(self.state.config["terminal_latency_ms"]) / 1000.0 / max(1, len(output))
+        self._start_ndjson()
+        self._write_record({"type": "start", "command": command})
+        for line in output:
+            time.sleep(pause)
+            self._write_record({"type": "stdout", "data": line})
+            self._flush()
+        self._write_record({"type": "exit", "exitCode": 0})
+        self._end_ndjson()
+
+
+class StubHandler(StubRoutes, BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        # Node의 http 서버처럼 작은 청크를 지연 없이 보낸다.
+        if self.request.family in (socket.AF_INET, socket.AF_INET6):
+            self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, *args):
+        pass
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def _json(self, status, payload, etag=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        if etag and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        if etag:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _no_route(self, method, path):
+        # Express처럼 없는 라우트는 JSON이 아닌 본문으로 404를 돌려준다.
+        body = "Cannot {} {}".format(method, path).encode("utf-8")
+        self.send_response(404)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _start_ndjson(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _write_record(self, record):
+        data = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+    def _end_ndjson(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _flush(self):
+        self.wfile.flush()
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        return json.loads(raw.decode("utf-8")) if raw else {}
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = url.path.strip("/").split("/")
+        self.state.count("GET " + "/".join(parts[:4]))
+        config = self.state.config
+        if url.path == "/mux" and self.headers.get("Upgrade") == MUX_PROTOCOL:
+            if config["mux"] and not config["legacy"]:
+                return self._upgrade_mux()
+            return self._no_route("GET", url.path)
+        if url.path == "/health":
+            if config["legacy"]:
+                return self._json(200, {"ok": True})
+            return self._json(200, {
+                "ok": True,
+                "capabilities": {
+                    "contextCache": bool(config["context_cache"]),
+                    "sessionContext": bool(config["session_context"])
+                }
+            })
+        if parts[:3] != ["api", "agent", "sessions"]:
+            return self._json(404, {"error": "not found"})
+        if config["legacy"] and len(parts) >= 4 and (parts[3] == "index" or parts[4:] == ["messages"]):
+            return self._no_route("GET", url.path)
+        offset = int(query.get("offset", ["0"])[0])
+        # 실제 서버(pageParams)처럼 한 번에 200개까지만 돌려준다.
+        limit = min(200, max(1, int(query.get("limit", ["20"])[0])))
+        sessions = self.state.sessions
+        if len(parts) == 3:
+            return self._json(200, list(sessions.values()))
+        if len(parts) == 4 and parts[3] == "index":
+            # 실제 서버처럼 최근에 바뀐 세션부터 돌려준다.
+            summaries = sorted(
+                (summarize(s) for s in sessions.values()), key=lambda s: s["updatedAt"], reverse=True
+            )
+            latest = summaries[0]["updatedAt"] if summaries else ""
+            return self._json(
+                200,
+                {"total": len(summaries), "offset": offset, "sessions": summaries[offset:offset + limit]},
+                etag='W/"{}-{}-{}-{}"'.format(len(summaries), latest, offset, limit)
+            )
+        session = sessions.get(parts[3])
+        if session is None:
+            return self._json(404, {"error": "세션을 찾을 수 없습니다."})
+        if len(parts) == 5 and parts[4] == "messages":
+            return self._json(
+                200,
+                {
+                    "id": session["id"],
+                    "updatedAt": session["updatedAt"],
+                    "total": len(session["messages"]),
+                    "offset": offset,
+                    "messages": session["messages"][offset:offset + limit]
+                },
+                etag='W/"{}-{}-{}"'.format(session["updatedAt"], offset, limit)
+            )
+        return self._json(200, session, etag='W/"{}"'.format(session["updatedAt"]))
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        self.post(url.path, self._body())
+
+    def _upgrade_mux(self):
+        self.send_response(101)
+        self.send_header("Upgrade", MUX_PROTOCOL)
+        self.send_header("Connection", "Upgrade")
+        self.end_headers()
+        self.wfile.flush()
+        MuxChannel(self).serve()
+        self.close_connection = True
+
+
+class MuxExchange(StubRoutes):
+    """멀티플렉스 채널의 스트림 하나. 응답을 {"stream": id, ...} 프레임으로 보낸다."""
+
+    def __init__(self, channel, stream_id):
+        self.channel = channel
+        self.stream_id = stream_id
+        self.state = channel.state
+
+    def _frame(self, **fields):
+        if not self.cancelled:
+            fields["stream"] = self.stream_id
+            self.channel.send(fields)
+
+    def _json(self, status, payload, etag=None):
+        self._frame(status=status, type="application/json; charset=utf-8")
+        self._frame(data=payload)
+        self._frame(end=True)
+
+    def _start_ndjson(self):
+        self._frame(status=200, type="application/x-ndjson; charset=utf-8")
+
+    def _write_record(self, record):
+        self._frame(data=record)
+
+    def _end_ndjson(self):
+        self._frame(end=True)
+
+    def _flush(self):
+        pass
+
+
+class MuxChannel(object):
+    """src/server/mux.ts와 같은 프레임 형식으로 한 연결 위의 여러 스트림을 처리한다."""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.state = handler.state
+        self.exchanges = {}
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def send(self, frame):
+        line = (json.dumps(frame, ensure_ascii=False) + "\n").encode("utf-8")
+        with self.lock:
+            if self.closed:
+                return
+            try:
+                self.handler.wfile.write(line)
+            except OSError:
+                self.closed = True
+
+    def serve(self):
+        self.state.count("MUX channel")
+        for line in self.handler.rfile:
+            if not line.strip():
+                continue
+            frame = json.loads(line)
+            stream_id = frame.get("stream")
+            if frame.get("cancel"):
+                exchange = self.exchanges.pop(stream_id, None)
+                if exchange is not None:
+                    exchange.cancelled = True
+                continue
+            exchange = MuxExchange(self, stream_id)
+            self.exchanges[stream_id] = exchange
+            threading.Thread(target=self._run, args=(exchange, frame), daemon=True).start()
+        with self.lock:
+            self.closed = True
+        for exchange in list(self.exchanges.values()):
+            exchange.cancelled = True
+
+    def _run(self, exchange, frame):
+        try:
+            exchange.post(frame.get("path", ""), frame.get("body") or {})
+        finally:
+            self.exchanges.pop(exchange.stream_id, None)
+
+
+class UnixStubServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def serve(config=None, host="127.0.0.1", port=0, socket_path=None):
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.state = StubState(config)
+    thread = threading.Thread(target=server.serve_forever, name="stub-server", daemon=True)
+    thread.start()
+    server.unix_server = None
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        unix_server = UnixStubServer(socket_path, StubHandler)
+        unix_server.state = server.state
+        thread = threading.Thread(target=unix_server.serve_forever, name="stub-unix", daemon=True)
+        thread.start()
+        server.unix_server = unix_server
+    return server
+
+
+def stop(server):
+    server.shutdown()
+    if server.unix_server is not None:
+        server.unix_server.shutdown()
+        path = server.unix_server.server_address
+        server.unix_server.server_close()
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+def add_config_arguments(parser):
+    for key, default in DEFAULT_CONFIG.items():
+        parser.add_argument(
+            "--" + key.replace("_", "-"), dest=key, type=type(default), default=default
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AI Agent 스텁 서버")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3000)
+    parser.add_argument("--socket", default=None, help="Unix 소켓 경로")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    config = {key: getattr(args, key) for key in DEFAULT_CONFIG}
+    server = serve(config, args.host, args.port, args.socket)
+    print("stub server listening on {}:{}".format(*server.server_address))
+    if args.socket:
+        print("stub server listening on unix:{}".format(args.socket))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stop(server)
+
+
+if __name__ == "__main__":
+    main()
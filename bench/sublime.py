@@ -0,0 +1,367 @@
+"""벤치마크용 최소 sublime 모듈.
+
+플러그인이 사용하는 API만 흉내 낸다. set_timeout 콜백은 Sublime의 UI 스레드처럼
+하나의 스레드에서 순서대로 실행된다.
+"""
+import bisect
+import heapq
+import itertools
+import os
+import tempfile
+import threading
+import time
+
+
+LAYOUT_INLINE = 0
+LAYOUT_BLOCK = 1
+LAYOUT_BELOW = 2
+HIDE_ON_MOUSE_MOVE_AWAY = 2
+ENCODED_POSITION = 1
+TRANSIENT = 4
+PERSISTENT = 16
+DRAW_NO_FILL = 32
+HIDDEN = 128
+DRAW_NO_OUTLINE = 256
+
+_CACHE_DIR = tempfile.mkdtemp(prefix="ai-agent-bench-")
+
+
+def cache_path():
+    return _CACHE_DIR
+
+
+def packages_path():
+    return os.path.join(_CACHE_DIR, "Packages")
+
+
+def status_message(message):
+    pass
+
+
+class Settings(object):
+    def __init__(self, values=None):
+        self._values = dict(values or {})
+
+    def get(self, key, default=None):
+        return self._values.get(key, default)
+
+    def set(self, key, value):
+        self._values[key] = value
+
+    def erase(self, key):
+        self._values.pop(key, None)
+
+    def has(self, key):
+        return key in self._values
+
+
+_settings = {}
+
+
+def load_settings(name):
+    return _settings.setdefault(name, Settings())
+
+
+def save_settings(name):
+    pass
+
+
+class _MainLoop(object):
+    def __init__(self):
+        self._queue = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._busy = 0
+        thread = threading.Thread(target=self._run, name="sublime-main", daemon=True)
+        thread.start()
+
+    def schedule(self, fn, delay_ms):
+        with self._cond:
+            due = time.monotonic() + max(0, delay_ms) / 1000.0
+            heapq.heappush(self._queue, (due, next(self._counter), fn))
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue or self._queue[0][0] > time.monotonic():
+                    timeout = self._queue[0][0] - time.monotonic() if self._queue else None
+                    self._cond.wait(timeout)
+                _, _, fn = heapq.heappop(self._queue)
+                self._busy += 1
+            try:
+                fn()
+            except Exception as e:
+                print("[sublime] 콜백 오류: {!r}".format(e))
+            finally:
+                with self._cond:
+                    self._busy -= 1
+                    self._cond.notify_all()
+
+    def drain(self, timeout=10.0):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._queue or self._busy:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(min(remaining, 0.01))
+        return True
+
+
+_main_loop = _MainLoop()
+
+
+def set_timeout(fn, delay=0):
+    _main_loop.schedule(fn, delay)
+
+
+def set_timeout_async(fn, delay=0):
+    threading.Timer(max(0, delay) / 1000.0, fn).start()
+
+
+def drain(timeout=10.0):
+    """예약된 set_timeout 콜백이 모두 실행될 때까지 기다린다(벤치마크 전용)."""
+    return _main_loop.drain(timeout)
+
+
+class Region(object):
+    def __init__(self, a, b=None):
+        self.a = a
+        self.b = a if b is None else b
+
+    def begin(self):
+        return min(self.a, self.b)
+
+    def end(self):
+        return max(self.a, self.b)
+
+    def size(self):
+        return self.end() - self.begin()
+
+    def empty(self):
+        return self.a == self.b
+
+    def contains(self, other):
+        if isinstance(other, Region):
+            return self.begin() <= other.begin() and other.end() <= self.end()
+        return self.begin() <= other <= self.end()
+
+    def cover(self, other):
+        return Region(min(self.begin(), other.begin()), max(self.end(), other.end()))
+
+    def __eq__(self, other):
+        return isinstance(other, Region) and (self.a, self.b) == (other.a, other.b)
+
+    def __repr__(self):
+        return "Region({}, {})".format(self.a, self.b)
+
+
+_ids = itertools.count(1)
+
+
+class View(object):
+    def __init__(self, text="", file_name=None, window=None):
+        self._id = next(_ids)
+        self.text = text
+        self._file_name = file_name
+        self._window = window
+        self._settings = Settings()
+        self._sel = [Region(0, 0)]
+        self._change_count = 0
+        self.phantoms = {}
+        self.regions = {}
+        self.popup = None
+        self.folded = []
+        self.name = ""
+        self.status = {}
+        self._line_index = (None, [0])
+
+    def id(self):
+        return self._id
+
+    def buffer_id(self):
+        return self._id
+
+    def is_valid(self):
+        return True
+
+    def window(self):
+        return self._window
+
+    def file_name(self):
+        return self._file_name
+
+    def settings(self):
+        return self._settings
+
+    def sel(self):
+        return self._sel
+
+    def size(self):
+        return len(self.text)
+
+    def change_count(self):
+        return self._change_count
+
+    def substr(self, region):
+        if isinstance(region, int):
+            return self.text[region:region + 1]
+        return self.text[region.begin():region.end()]
+
+    def replace(self, edit, region, text):
+        self.text = self.text[:region.begin()] + text + self.text[region.end():]
+        self._change_count += 1
+
+    def run_command(self, command, args=None):
+        if command == "append":
+            self.text += args["characters"]
+            self._change_count += 1
+
+    def _line_starts(self):
+        key, starts = self._line_index
+        if key != self._change_count:
+            starts = [0]
+            find = self.text.find
+            newline = find("\n")
+            while newline >= 0:
+                starts.append(newline + 1)
+                newline = find("\n", newline + 1)
+            self._line_index = (self._change_count, starts)
+        return starts
+
+    def rowcol(self, point):
+        starts = self._line_starts()
+        row = bisect.bisect_right(starts, point) - 1
+        return row, point - starts[row]
+
+    def text_point(self, row, col):
+        starts = self._line_starts()
+        if row >= len(starts):
+            return len(self.text)
+        return starts[row] + col
+
+    def line(self, point):
+        if isinstance(point, Region):
+            point = point.begin()
+        starts = self._line_starts()
+        row = bisect.bisect_right(starts, point) - 1
+        end = starts[row + 1] - 1 if row + 1 < len(starts) else len(self.text)
+        return Region(starts[row], end)
+
+    def symbols(self):
+        return []
+
+    def add_phantom(self, key, region, content, layout, on_navigate=None):
+        self.phantoms[key] = (content, on_navigate)
+        return 1
+
+    def erase_phantoms(self, key):
+        self.phantoms.pop(key, None)
+
+    def add_regions(self, key, regions, *args, **kwargs):
+        self.regions[key] = list(regions)
+
+    def get_regions(self, key):
+        return self.regions.get(key, [])
+
+    def erase_regions(self, key):
+        self.regions.pop(key, None)
+
+    def show_popup(self, content, **kwargs):
+        self.popup = (content, kwargs)
+
+    def update_popup(self, content):
+        if self.popup is not None:
+            self.popup = (content, self.popup[1])
+
+    def is_popup_visible(self):
+        return self.popup is not None
+
+    def hide_popup(self):
+        self.popup = None
+
+    def set_status(self, key, value):
+        self.status[key] = value
+
+    def erase_status(self, key):
+        self.status.pop(key, None)
+
+    def set_name(self, name):
+        self.name = name
+
+    def set_scratch(self, scratch):
+        pass
+
+    def set_read_only(self, read_only):
+        pass
+
+    def fold(self, regions):
+        self.folded = list(regions)
+
+    def unfold(self, regions):
+        self.folded = []
+
+
+class Window(object):
+    def __init__(self):
+        self._id = next(_ids)
+        self._views = []
+        self._panels = {}
+        self._active_panel = None
+        self._folders = []
+
+    def id(self):
+        return self._id
+
+    def new_view(self, text="", file_name=None):
+        view = View(text, file_name, window=self)
+        self._views.append(view)
+        return view
+
+    def new_file(self):
+        return self.new_view()
+
+    def views(self):
+        return list(self._views)
+
+    def active_view(self):
+        return self._views[-1] if self._views else None
+
+    def create_output_panel(self, name):
+        panel = View(window=self)
+        self._panels[name] = panel
+        return panel
+
+    def find_output_panel(self, name):
+        return self._panels.get(name)
+
+    def active_panel(self):
+        return self._active_panel
+
+    def run_command(self, command, args=None):
+        if command == "show_panel":
+            self._active_panel = args["panel"]
+
+    def show_input_panel(self, caption, initial, on_done, on_change, on_cancel):
+        pass
+
+    def show_quick_panel(self, items, on_select, *args, **kwargs):
+        pass
+
+    def folders(self):
+        return list(self._folders)
+
+    def set_folders(self, folders):
+        self._folders = list(folders)
+
+
+_windows = [Window()]
+
+
+def windows():
+    return list(_windows)
+
+
+def active_window():
+    return _windows[0]
@@ -0,0 +1,24 @@
+"""벤치마크용 최소 sublime_plugin 모듈."""
+
+
+class WindowCommand(object):
+    def __init__(self, window):
+        self.window = window
+
+
+class TextCommand(object):
+    def __init__(self, view):
+        self.view = view
+
+
+class ApplicationCommand(object):
+    pass
+
+
+class EventListener(object):
+    pass
+
+
+class ViewEventListener(object):
+    def __init__(self, view):
+        self.view = view
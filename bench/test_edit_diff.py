@@ -0,0 +1,96 @@
+"""줄 단위 diff와 편집 재배치(_rebase_changes)를 확인한다.
+
+    python3 -m pytest bench/test_edit_diff.py
+"""
+import os
+import random
+import sys
+import unittest
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [BENCH_DIR, os.path.join(os.path.dirname(BENCH_DIR), "sublime")]
+
+import sublime  # noqa: E402
+import sublime_ai_agent as agent  # noqa: E402
+
+
+def apply_opcodes(a_lines, b_lines, opcodes):
+    out = []
+    for tag, a0, a1, b0, b1 in opcodes:
+        if tag == "equal":
+            assert a_lines[a0:a1] == b_lines[b0:b1], (a0, a1, b0, b1)
+            out.extend(a_lines[a0:a1])
+        else:
+            out.extend(b_lines[b0:b1])
+    return out
+
+
+class DiffOpcodesTest(unittest.TestCase):
+    def test_random_edits_reconstruct_new_lines(self):
+        rng = random.Random(20261018)
+        for _ in range(200):
+            a_lines = ["line {}".format(rng.randint(0, 20)) for _ in range(rng.randint(0, 60))]
+            b_lines = list(a_lines)
+            for _ in range(rng.randint(0, 6)):
+                position = rng.randint(0, len(b_lines))
+                if b_lines and rng.random() < 0.5:
+                    del b_lines[min(position, len(b_lines) - 1)]
+                else:
+                    b_lines.insert(position, "new {}".format(rng.randint(0, 5)))
+            opcodes = agent._diff_opcodes(a_lines, b_lines, budget_ms=1000)
+            self.assertEqual(apply_opcodes(a_lines, b_lines, opcodes), b_lines)
+
+    def test_identical_lines_have_no_hunks(self):
+        lines = ["a", "b", "c"]
+        self.assertEqual(agent._diff_hunks(agent._diff_opcodes(lines, lines, budget_ms=1000)), [])
+
+    def test_single_replacement(self):
+        opcodes = agent._diff_opcodes(["a", "b", "c"], ["a", "x", "c"], budget_ms=1000)
+        self.assertEqual(agent._diff_hunks(opcodes), [("replace", 1, 2, 1, 2)])
+
+
+class RebaseChangesTest(unittest.TestCase):
+    def setUp(self):
+        self.view = sublime.View("0123456789abcdef")
+        self.addCleanup(agent._edit_journals.pop, self.view.buffer_id(), None)
+
+    def edit(self, begin, end, text):
+        self.view.replace(None, sublime.Region(begin, end), text)
+        agent._record_text_changes(
+            self.view.buffer_id(), self.view.change_count(), [(begin, end, len(text))]
+        )
+
+    def test_unchanged_buffer_keeps_changes(self):
+        changes = [{"range": [2, 4], "newText": "X"}]
+        self.assertEqual(agent._rebase_changes(self.view, changes, 0), (changes, []))
+
+    def test_changes_after_an_earlier_edit_are_shifted(self):
+        self.edit(0, 2, "abcd")
+        changes = [{"range": [10, 12], "newText": "X"}]
+        rebased, problems = agent._rebase_changes(self.view, changes, 0)
+        self.assertEqual(problems, [])
+        self.assertEqual(rebased, [{"range": [12, 14], "newText": "X"}])
+        self.assertEqual(self.view.substr(sublime.Region(12, 14)), "ab")
+
+    def test_changes_before_a_later_edit_are_kept(self):
+        self.edit(12, 14, "")
+        changes = [{"range": [2, 4], "newText": "X"}]
+        self.assertEqual(agent._rebase_changes(self.view, changes, 0), (changes, []))
+
+    def test_overlapping_edit_is_reported(self):
+        self.edit(3, 5, "zz")
+        rebased, problems = agent._rebase_changes(
+            self.view, [{"range": [2, 4], "newText": "X"}, {"range": [8, 9], "newText": "Y"}], 0
+        )
+        self.assertEqual(rebased, [{"range": [8, 9], "newText": "Y"}])
+        self.assertEqual(len(problems), 1)
+
+    def test_missing_journal_rejects_all_changes(self):
+        self.view.replace(None, sublime.Region(0, 1), "x")
+        rebased, problems = agent._rebase_changes(self.view, [{"range": [2, 4], "newText": "X"}], 0)
+        self.assertEqual(rebased, [])
+        self.assertEqual(len(problems), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,226 @@
+"""스텁 서버를 상대로 기능 협상과 이전 서버 대체 경로를 확인한다.
+
+    python3 -m pytest bench/test_negotiation.py
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [BENCH_DIR, os.path.join(os.path.dirname(BENCH_DIR), "sublime")]
+
+import sublime  # noqa: E402
+import stub_server  # noqa: E402
+import sublime_ai_agent as agent  # noqa: E402
+
+
+def _reset_backends():
+    if agent._backends is not None:
+        agent._backends.close()
+    agent._backends = None
+
+
+class StubServerTest(unittest.TestCase):
+    CONFIG = {}
+
+    def setUp(self):
+        self.server = stub_server.serve(dict(self.CONFIG, terminal_latency_ms=0))
+        self.settings = sublime.load_settings(agent.SETTINGS_FILE)
+        self.settings.set("transport", "http")
+        self.previous_address = agent.SERVER_HOST, agent.SERVER_PORT
+        agent.SERVER_HOST, agent.SERVER_PORT = self.server.server_address[:2]
+        _reset_backends()
+        agent._context_uploader = agent._ContextUploader()
+        agent._session_contexts = agent._SessionContexts()
+
+    def tearDown(self):
+        _reset_backends()
+        self.settings.set("transport", "http")
+        agent.SERVER_HOST, agent.SERVER_PORT = self.previous_address
+        stub_server.stop(self.server)
+
+    @property
+    def counts(self):
+        return self.server.state.counts
+
+    def send(self, selection, session_id=None, context_key="bench/file.py"):
+        payload = agent._build_rpc_request(
+            "bench", {"file": context_key, "selection": selection}, session_id=session_id
+        )
+        started = []
+        errors = []
+        noop = lambda *a: None  # noqa: E731
+        agent._send_streaming_rpc(
+            payload, started.append, noop, noop, errors.append, context_key=context_key
+        )
+        self.assertEqual(errors, [])
+        return started[0]
+
+    def stored_context(self, session_id):
+        return self.server.state.rpc_sessions[session_id]
+
+
+def _lines(count, changed=None):
+    return "\n".join(
+        "line {} {}".format(index, "changed" if index == changed else "original") for index in range(count)
+    )
+
+
+class ContextCacheNegotiationTest(StubServerTest):
+    CONFIG = {"context_cache": 1}
+
+    def test_sends_hash_then_delta_when_advertised(self):
+        original = _lines(200)
+        edited = _lines(200, changed=50)
+        sessions = [self.send(original), self.send(original), self.send(edited)]
+        stats = agent._context_uploader.stats()
+        self.assertTrue(stats["serverSupport"])
+        self.assertEqual((stats["full"], stats["hashOnly"], stats["delta"]), (1, 1, 1))
+        self.assertEqual(self.counts["rpc context resolved"], 2)
+        # 서버는 해시와 델타로부터 원래 선택 영역을 되살린다.
+        for session_id, text in zip(sessions, (original, original, edited)):
+            self.assertEqual(self.stored_context(session_id)["selection"], text)
+
+    def test_lost_context_falls_back_to_full_upload(self):
+        text = _lines(50)
+        self.send(text)
+        self.server.state.contexts.clear()
+        session_id = self.send(text)
+        self.assertEqual(self.counts["rpc context missing"], 1)
+        self.assertEqual(agent._context_uploader.stats()["fallbacks"], 1)
+        self.assertEqual(self.stored_context(session_id)["selection"], text)
+
+
+class FullUploadTest(StubServerTest):
+    CONFIG = {"context_cache": 0}
+
+    def test_sends_full_selection_when_not_advertised(self):
+        text = _lines(50)
+        sessions = [self.send(text), self.send(text)]
+        self.assertFalse(agent._context_uploader.stats()["serverSupport"])
+        for session_id in sessions:
+            context = self.stored_context(session_id)
+            self.assertEqual(context["selection"], text)
+            self.assertNotIn("selectionHash", context)
+
+
+class SessionContextNegotiationTest(StubServerTest):
+    CONFIG = {"session_context": 1}
+
+    def test_follow_up_inherits_session_context(self):
+        session_id = self.send("first")
+        self.assertEqual(self.send("first", session_id=session_id), session_id)
+        stats = agent._session_contexts.stats()
+        self.assertEqual((stats["full"], stats["inherited"]), (0, 1))
+        self.assertEqual(self.counts["rpc resumed"], 1)
+        self.assertEqual(self.stored_context(session_id)["selection"], "first")
+
+    def test_unknown_session_falls_back_to_full_context(self):
+        session_id = self.send("first")
+        self.server.state.rpc_sessions.clear()
+        new_session = self.send("first", session_id=session_id)
+        self.assertNotEqual(new_session, session_id)
+        self.assertEqual(agent._session_contexts.stats()["fallbacks"], 1)
+        self.assertEqual(self.stored_context(new_session)["selection"], "first")
+
+
+class NoSessionContextTest(StubServerTest):
+    CONFIG = {"session_context": 0}
+
+    def test_follow_up_sends_full_context(self):
+        session_id = self.send("first")
+        self.send("first", session_id=session_id)
+        self.assertFalse(agent._session_contexts.stats()["serverSupport"])
+        self.assertEqual(agent._session_contexts.stats()["inherited"], 0)
+        self.assertNotIn("rpc context missing", self.counts)
+
+
+class MuxNegotiationTest(StubServerTest):
+    CONFIG = {"mux": 1}
+
+    def test_streams_share_the_upgraded_channel(self):
+        self.settings.set("transport", "mux")
+        self.send("a")
+        self.send("b")
+        stats = agent._get_backends().backends[0].mux_channel().stats()
+        self.assertEqual((stats["connects"], stats["streams"]), (1, 2))
+        self.assertEqual(self.counts["MUX channel"], 1)
+
+
+class MuxFallbackTest(StubServerTest):
+    CONFIG = {"mux": 0}
+
+    def test_falls_back_to_http_when_upgrade_is_refused(self):
+        self.settings.set("transport", "mux")
+        self.send("a")
+        self.send("b")
+        stats = agent._get_backends().backends[0].mux_channel().stats()
+        self.assertEqual(stats["fallbacks"], 1)
+        self.assertNotIn("connects", stats)
+        self.assertNotIn("MUX channel", self.counts)
+        self.assertEqual(self.counts["POST /rpc"], 2)
+
+
+class LegacyServerTest(StubServerTest):
+    CONFIG = {"legacy": 1, "sessions": 30, "messages_per_session": 3}
+
+    def test_rpc_sends_full_context_without_capabilities(self):
+        text = _lines(20)
+        session_id = self.send(text)
+        self.send(text, session_id=session_id)
+        self.assertFalse(agent._context_uploader.stats()["serverSupport"])
+        self.assertFalse(agent._session_contexts.stats()["serverSupport"])
+        self.assertEqual(self.stored_context(session_id)["selection"], text)
+
+    def test_session_index_falls_back_to_full_list(self):
+        backend = agent._get_backends().backends[0]
+        data, error = agent._fetch_backend_session_index(backend, 10, 5)
+        self.assertIsNone(error)
+        self.assertEqual(data["total"], 30)
+        self.assertEqual(len(data["sessions"]), 5)
+        self.assertEqual(self.counts["GET api/agent/sessions"], 1)
+
+    def test_session_page_falls_back_to_full_session(self):
+        page, error = agent._fetch_session_page("bench-00001", 1, 1)
+        self.assertIsNone(error)
+        self.assertEqual((page["total"], len(page["messages"])), (3, 1))
+
+    def test_terminal_batch_falls_back_to_single_requests(self):
+        requests, error = agent._request_terminal_batch(["echo a", "echo b"])
+        self.assertIsNone(error)
+        self.assertEqual(len(requests), 2)
+        self.assertEqual(self.counts["POST /api/agent/terminal/request"], 2)
+
+    def test_session_writer_falls_back_to_single_posts(self):
+        directory = tempfile.mkdtemp(prefix="ai-agent-test-")
+        self.addCleanup(shutil.rmtree, directory, True)
+        writer = agent._SessionWriter(os.path.join(directory, "pending-messages.jsonl"))
+        for index in range(3):
+            writer.add("bench-00002", "user", "message {}".format(index))
+        writer.flush()
+        self.assertFalse(writer._batch_supported)
+        self.assertEqual(writer.stats()["sent"], 3)
+        self.assertEqual(self.counts["POST /api/agent/sessions/bench-00002/messages"], 3)
+
+
+class SessionWriterBatchTest(StubServerTest):
+    CONFIG = {"sessions": 5, "messages_per_session": 1}
+
+    def test_sends_one_batch_and_drops_unknown_sessions(self):
+        directory = tempfile.mkdtemp(prefix="ai-agent-test-")
+        self.addCleanup(shutil.rmtree, directory, True)
+        writer = agent._SessionWriter(os.path.join(directory, "pending-messages.jsonl"))
+        for index in range(3):
+            writer.add("bench-00002", "user", "message {}".format(index))
+        writer.add("missing", "user", "lost")
+        writer.flush()
+        self.assertTrue(writer._batch_supported)
+        stats = writer.stats()
+        self.assertEqual((stats["sent"], stats["dropped"], stats["pending"]), (3, 1, 0))
+        self.assertEqual(self.counts["POST /api/agent/sessions/bench-00002/messages/batch"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+"""_RequestMetrics가 요청 하나를 한 번만 기록하는지 확인한다.
+
+    python3 -m pytest bench/test_request_metrics.py
+"""
+import os
+import sys
+import unittest
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [BENCH_DIR, os.path.join(os.path.dirname(BENCH_DIR), "sublime")]
+
+import sublime_ai_agent as agent  # noqa: E402
+
+
+class RequestMetricsTest(unittest.TestCase):
+    def test_finish_records_once(self):
+        recorder = agent._get_metrics_recorder()
+        before = len(recorder.records("test-once"))
+        metrics = agent._RequestMetrics("test-once")
+        metrics.delta("abc")
+        first = metrics.finish("ok")
+        second = metrics.finish("error")
+        self.assertIs(first, second)
+        self.assertIs(metrics.record, first)
+        self.assertEqual(first["status"], "ok")
+        self.assertEqual(len(recorder.records("test-once")), before + 1)
+
+    def test_record_is_none_until_finished(self):
+        metrics = agent._RequestMetrics("test-pending")
+        self.assertIsNone(metrics.record)
+
+
+if __name__ == "__main__":
+    unittest.main()
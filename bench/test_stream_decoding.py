@@ -0,0 +1,118 @@
+"""스트림 디코더가 바이트를 어디서 나눠 받아도 같은 레코드를 내는지 확인한다.
+
+    python3 -m pytest bench/test_stream_decoding.py
+"""
+import http.client
+import io
+import json
+import os
+import random
+import sys
+import unittest
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [BENCH_DIR, os.path.join(os.path.dirname(BENCH_DIR), "sublime")]
+
+import sublime_ai_agent as agent  # noqa: E402
+
+
+RECORDS = [
+    {"type": "start", "sessionId": "s-1"},
+    {"type": "delta", "text": "한글 설명과 이모지 🙂"},
+    {"type": "delta", "text": "```bash\necho \"a\\nb\"\n```"},
+    {"type": "final", "usage": {"input": 10, "output": 20}},
+]
+
+
+def random_split(data, rng):
+    cuts = sorted(rng.sample(range(1, len(data)), min(len(data) - 1, rng.randint(0, 16))))
+    bounds = [0] + cuts + [len(data)]
+    return [data[start:end] for start, end in zip(bounds, bounds[1:])]
+
+
+def decode(chunks):
+    decoder = agent._NdjsonDecoder()
+    records = []
+    for chunk in chunks:
+        records.extend(decoder.feed(chunk))
+    return records + decoder.finish(), decoder
+
+
+class NdjsonDecoderTest(unittest.TestCase):
+    def test_random_splits_keep_records(self):
+        rng = random.Random(20261018)
+        data = b"".join(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n" for record in RECORDS)
+        for _ in range(300):
+            chunks = random_split(data, rng)
+            records, decoder = decode(chunks)
+            self.assertEqual(records, RECORDS, chunks)
+            self.assertEqual(decoder.malformed, 0)
+
+    def test_multibyte_character_split_across_reads(self):
+        data = json.dumps({"text": "가"}, ensure_ascii=False).encode("utf-8") + b"\n"
+        middle = data.index("가".encode("utf-8")) + 1
+        records, _ = decode([data[:middle], data[middle:]])
+        self.assertEqual(records, [{"text": "가"}])
+
+    def test_last_line_without_newline(self):
+        records, _ = decode([b'{"a": 1}\n{"b"', b": 2}"])
+        self.assertEqual(records, [{"a": 1}, {"b": 2}])
+
+    def test_malformed_lines_are_skipped_and_counted(self):
+        records, decoder = decode([b'{"a": 1}\nnot json\n[1, 2]\n\n{"b": 2}\n'])
+        self.assertEqual(records, [{"a": 1}, {"b": 2}])
+        self.assertEqual(decoder.malformed, 2)
+
+
+class FakeResponse(object):
+    def __init__(self, chunks):
+        self.fp = self
+        self._chunks = list(chunks)
+        self.closed = False
+
+    def read1(self, size):
+        return self._chunks.pop(0) if self._chunks else b""
+
+    def close(self):
+        self.closed = True
+
+
+def chunked(pieces):
+    out = io.BytesIO()
+    for index, piece in enumerate(pieces):
+        extension = b";ext=1" if index % 2 else b""
+        out.write(b"%x%s\r\n%s\r\n" % (len(piece), extension, piece))
+    out.write(b"0\r\n\r\n")
+    return out.getvalue()
+
+
+def read_all(body):
+    out = []
+    while True:
+        data = body.read1(8192)
+        out.append(data)
+        if body._done:
+            return b"".join(out)
+
+
+class ChunkedBodyTest(unittest.TestCase):
+    def test_random_splits_match_payload(self):
+        rng = random.Random(20261018)
+        payload = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in RECORDS).encode("utf-8")
+        for _ in range(300):
+            raw = chunked(random_split(payload, rng))
+            resp = FakeResponse(random_split(raw, rng))
+            self.assertEqual(read_all(agent._ChunkedBody(resp)), payload)
+            self.assertTrue(resp.closed)
+
+    def test_truncated_body_raises(self):
+        raw = chunked([b"hello", b"world"])
+        resp = FakeResponse([raw[:-7]])
+        body = agent._ChunkedBody(resp)
+        with self.assertRaises(http.client.IncompleteRead):
+            read_all(body)
+        self.assertFalse(resp.closed)
+
+
+if __name__ == "__main__":
+    unittest.main()
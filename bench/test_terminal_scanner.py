@@ -0,0 +1,81 @@
+"""_TerminalCommandScanner가 청크를 어떻게 나눠 받아도 한 번에 파싱한 결과와 같은지 확인한다.
+
+    python3 -m pytest bench/test_terminal_scanner.py
+"""
+import os
+import random
+import sys
+import unittest
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [BENCH_DIR, os.path.join(os.path.dirname(BENCH_DIR), "sublime")]
+
+import stub_server  # noqa: E402
+import sublime_ai_agent as agent  # noqa: E402
+
+
+SAMPLES = (
+    "설명입니다.\n```bash\nls -la\n```\n그리고\nterminal: pwd\n",
+    "x ``` y\n```bash\nA\n```",
+    "```python\nprint('```bash')\n```\n```sh\necho a\necho b\n```\r\nTERMINAL: make\r\n",
+    "terminal: first\n```shell\nsecond\n```\nterminal: third",
+    "```bash\necho ``` inside\n```\n",
+    "   ```bash\nindented\n   ```\n    ```bash\nnot a fence\n```\n",
+    "```bash\nunclosed\n",
+    "```\nterminal: in plain fence\n```\n```bash\n\n```\n",
+    "terminal:\nterminal:   spaced   \n",
+)
+
+
+def scan(chunks):
+    scanner = agent._TerminalCommandScanner()
+    found = []
+    for chunk in chunks:
+        found.extend(scanner.feed(chunk))
+    return found + scanner.finish()
+
+
+def random_split(text, rng):
+    cuts = sorted(rng.sample(range(1, len(text)), min(len(text) - 1, rng.randint(0, 12))))
+    bounds = [0] + cuts + [len(text)]
+    return [text[start:end] for start, end in zip(bounds, bounds[1:])]
+
+
+class TerminalScannerTest(unittest.TestCase):
+    def test_random_splits_match_one_shot_parse(self):
+        rng = random.Random(20261018)
+        texts = list(SAMPLES) + [stub_server.build_response(dict(stub_server.DEFAULT_CONFIG))]
+        for text in texts:
+            expected = agent._extract_terminal_commands(text)
+            for _ in range(200):
+                chunks = random_split(text, rng)
+                self.assertEqual(scan(chunks), expected, chunks)
+
+    def test_single_character_chunks(self):
+        for text in SAMPLES:
+            self.assertEqual(scan(list(text)), agent._extract_terminal_commands(text))
+
+    def test_fences_only_at_line_start(self):
+        self.assertEqual(agent._extract_terminal_commands("x ``` y\n```bash\nA\n```"), ["A"])
+        self.assertEqual(agent._extract_terminal_commands("```bash\necho ``` inside\n```\n"), [
+            "echo ``` inside"
+        ])
+
+    def test_commands_in_stream_order(self):
+        self.assertEqual(
+            agent._extract_terminal_commands(SAMPLES[3]), ["first", "second", "third"]
+        )
+
+    def test_shell_languages_and_line_endings(self):
+        self.assertEqual(
+            agent._extract_terminal_commands(SAMPLES[2]), ["echo a\necho b", "make"]
+        )
+
+    def test_unclosed_and_empty_blocks_are_ignored(self):
+        self.assertEqual(agent._extract_terminal_commands(SAMPLES[6]), [])
+        self.assertEqual(agent._extract_terminal_commands(SAMPLES[7]), ["in plain fence"])
+        self.assertEqual(agent._extract_terminal_commands(SAMPLES[8]), ["spaced"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,30 @@
-import { createApp } from "./server/app.js";
+import { lstatSync, unlinkSync } from "node:fs";
+import { createApp, muxRoutes } from "./server/app.js";
+import { attachMuxChannel } from "./server/mux.js";
 
 const port = Number(process.env.PORT ?? 3000);
+const socketPath = process.env.AGENT_SOCKET;
 const app = createApp();
 
-app.listen(port, () => {
+const server = app.listen(port, () => {
   console.log(`Pi 미니멀 에이전트 서버 실행 중: http://localhost:${port}`);
 });
+attachMuxChannel(server, muxRoutes);
+
+function removeStaleSocket(path: string): void {
+  // 이전 실행이 남긴 소켓 파일이 있으면 listen이 EADDRINUSE로 실패한다.
+  // 소켓이 아닌 파일은 지우지 않고 listen이 실패하게 둔다.
+  try {
+    if (lstatSync(path).isSocket()) unlinkSync(path);
+  } catch (error) {
+    if ((error as NodeJS.ErrnoException).code !== "ENOENT") throw error;
+  }
+}
+
+if (socketPath) {
+  removeStaleSocket(socketPath);
+  const unixServer = app.listen(socketPath, () => {
+    console.log(`Unix 소켓에서도 대기 중: ${socketPath}`);
+  });
+  attachMuxChannel(unixServer, muxRoutes);
+}
@@ -1,11 +1,54 @@
-import { AgentRequestContext } from "../types.js";
+import { AgentRequestContext, SessionMessage } from "../types.js";
 
-export function buildPrompt(prompt: string, context?: AgentRequestContext): string {
-  if (!context) return prompt;
+// 이어지는 대화에 넣는 이전 메시지의 최대 길이. 넘으면 오래된 메시지부터 빼고, 한 메시지가 넘으면 자른다.
+const MAX_HISTORY_CHARS = 48 * 1024;
+
+const ROLE_LABELS: Record<SessionMessage["role"], string> = {
+  user: "사용자",
+  assistant: "에이전트",
+  tool: "도구 결과"
+};
+
+const OMITTED = "…(생략)…";
+
+// 메시지 하나가 한도를 넘으면 잘라 넣는다. 도구 결과는 명령과 종료 코드가 있는 앞부분과
+// 마지막 출력을 남기고 가운데를 뺀다.
+function formatMessage(message: SessionMessage): string {
+  const label = `[${ROLE_LABELS[message.role] ?? message.role}] `;
+  const room = MAX_HISTORY_CHARS - label.length;
+  const { content } = message;
+  if (content.length <= room) return label + content;
+  const keep = room - OMITTED.length - 2;
+  const head = message.role === "tool" ? Math.floor(keep / 4) : keep;
+  const tail = keep - head;
+  return `${label}${content.slice(0, head)}\n${OMITTED}\n${tail > 0 ? content.slice(-tail) : ""}`;
+}
+
+function formatHistory(history: SessionMessage[]): string {
+  const lines: string[] = [];
+  let size = 0;
+  for (let index = history.length - 1; index >= 0; index -= 1) {
+    const line = formatMessage(history[index]);
+    if (size + line.length > MAX_HISTORY_CHARS) break;
+    lines.unshift(line);
+    size += line.length;
+  }
+  return lines.join("\n\n");
+}
+
+export function buildPrompt(
+  prompt: string,
+  context?: AgentRequestContext,
+  history: SessionMessage[] = []
+): string {
   const parts: string[] = [];
-  if (context.file) parts.push(`파일: ${context.file}`);
-  if (context.range) parts.push(`범위: ${context.range[0]}-${context.range[1]}`);
-  if (context.selection) {
+  if (history.length > 0) parts.push(`이전 대화:\n${formatHistory(history)}\n`);
+  if (context?.file) parts.push(`파일: ${context.file}`);
+  if (context?.range) parts.push(`범위: ${context.range[0]}-${context.range[1]}`);
+  if (context?.segments && context.segments.length > 1) {
+    parts.push(`포함 구간: ${context.segments.map(([start, end]) => `${start}-${end}`).join(", ")}`);
+  }
+  if (context?.selection) {
     parts.push("선택 코드:\n" + context.selection);
   }
   if (parts.length === 0) return prompt;
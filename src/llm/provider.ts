@@ -1,4 +1,4 @@
-import { AgentProcessRequest, AgentResult, LLMConfig } from "../types.js";
+import { AgentProcessRequest, AgentResult, LLMConfig, SessionMessage } from "../types.js";
 import { buildPrompt } from "./prompt.js";
 import { callOpenAI, callOpenAIStream } from "./providers/openai.js";
 import { callAnthropic, callAnthropicStream } from "./providers/anthropic.js";
@@ -6,22 +6,32 @@ import { callGoogle, callGoogleStream } from "./providers/google.js";
 import { streamText } from "./stream.js";
 
 export interface LLMClient {
-  generate(request: AgentProcessRequest, model: LLMConfig): Promise<AgentResult>;
+  generate(
+    request: AgentProcessRequest,
+    model: LLMConfig,
+    history?: SessionMessage[]
+  ): Promise<AgentResult>;
   generateStream(
     request: AgentProcessRequest,
     model: LLMConfig,
     onDelta: (chunk: string) => void,
-    onTool: (name: string, args: string) => void
+    onTool: (name: string, args: string) => void,
+    history?: SessionMessage[]
   ): Promise<AgentResult>;
 }
 
 export class DefaultLLMClient implements LLMClient {
-  async generate(request: AgentProcessRequest, model: LLMConfig): Promise<AgentResult> {
+  async generate(
+    request: AgentProcessRequest,
+    model: LLMConfig,
+    history: SessionMessage[] = []
+  ): Promise<AgentResult> {
     if (model.provider === "mock") {
       const summary = [
         "요청을 수신했어요.",
         `모델: ${model.provider}/${model.model}`,
-        request.context?.file ? `파일: ${request.context.file}` : "파일: 없음"
+        request.context?.file ? `파일: ${request.context.file}` : "파일: 없음",
+        `이전 메시지: ${history.length}개`
       ].join(" ");
       return {
         type: "message",
@@ -29,7 +39,7 @@ export class DefaultLLMClient implements LLMClient {
       };
     }
 
-    const prompt = buildPrompt(request.prompt, request.context);
+    const prompt = buildPrompt(request.prompt, request.context, history);
     let text = "";
     if (model.provider === "openai") {
       text = await callOpenAI(prompt, model);
@@ -48,17 +58,18 @@ export class DefaultLLMClient implements LLMClient {
     request: AgentProcessRequest,
     model: LLMConfig,
     onDelta: (chunk: string) => void,
-    onTool: (name: string, args: string) => void
+    onTool: (name: string, args: string) => void,
+    history: SessionMessage[] = []
   ): Promise<AgentResult> {
     if (model.provider === "mock") {
-      const result = await this.generate(request, model);
+      const result = await this.generate(request, model, history);
       if (result.type === "message") {
         streamText(result.content, onDelta);
       }
       return result;
     }
 
-    const prompt = buildPrompt(request.prompt, request.context);
+    const prompt = buildPrompt(request.prompt, request.context, history);
     let text = "";
     if (model.provider === "openai") {
       text = await callOpenAIStream(prompt, model, onDelta, onTool);
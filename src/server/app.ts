@@ -3,103 +3,341 @@ import cors from "cors";
 import {
   AgentProcessRequest,
   AgentProcessResponse,
+  AgentRequestContext,
   AgentStreamChunk,
   JsonRpcError,
   JsonRpcRequest,
   JsonRpcSuccess,
-  SessionMessage
+  LLMConfig,
+  SessionMessage,
+  SessionRecord,
+  TerminalStreamChunk
 } from "../types.js";
 import { resolveModelConfig } from "../llm/config.js";
 import { DefaultLLMClient } from "../llm/provider.js";
-import { appendMessage, createSession, listSessions, loadSession } from "../session/store.js";
+import {
+  appendMessage,
+  appendMessages,
+  createSession,
+  listSessionSummaries,
+  listSessions,
+  loadSession
+} from "../session/store.js";
+import {
+  rememberSessionContext,
+  resolveContext,
+  sessionContext
+} from "../session/context-store.js";
 import {
   clearTerminalRequest,
   createTerminalRequest,
   executeTerminalCommand,
+  executeTerminalCommandStream,
   getTerminalRequest
 } from "./terminal.js";
 
 const llm = new DefaultLLMClient();
 
-export function createApp() {
-  const app = express();
-  app.use(cors());
-  app.use(express.json({ limit: "2mb" }));
-
-  app.get("/health", (_req, res) => {
-    res.json({ ok: true });
-  });
+function pageParams(query: Record<string, unknown>, defaultLimit: number) {
+  const offset = Math.max(0, Number(query.offset ?? 0) || 0);
+  const limit = Math.min(200, Math.max(1, Number(query.limit ?? defaultLimit) || defaultLimit));
+  return { offset, limit };
+}
 
-  app.post("/api/agent/process", async (req, res) => {
-    const payload = req.body as AgentProcessRequest;
-    if (!payload?.prompt) {
-      res.status(400).json({ error: "prompt가 필요합니다." });
-      return;
+// 세션을 이어 쓰는 요청은 바뀐 컨텍스트 항목만 보내므로 세션의 마지막 컨텍스트와 합친다.
+// 합칠 컨텍스트가 없으면(서버 재시작 등) null을 돌려주고, 클라이언트는 전체 컨텍스트로 다시 보낸다.
+function openSession(payload: AgentProcessRequest, model: LLMConfig): SessionRecord | null {
+  const existing = payload.sessionId ? loadSession(payload.sessionId) : null;
+  if (payload.context) {
+    const { inherit, ...changed } = payload.context;
+    const base = inherit && existing ? sessionContext(existing.id) : null;
+    if (inherit && !base) return null;
+    const merged: Record<string, unknown> = { ...base, ...changed };
+    for (const key of Object.keys(merged)) {
+      if (merged[key] === null || merged[key] === undefined) delete merged[key];
     }
+    payload.context = merged as AgentRequestContext;
+  }
+  const session = existing ?? createSession(model);
+  if (payload.context) rememberSessionContext(session.id, payload.context);
+  return session;
+}
 
-    const model = resolveModelConfig(payload.model);
-    const session =
-      (payload.sessionId && loadSession(payload.sessionId)) ?? createSession(model);
+function promptHistory(payload: AgentProcessRequest, session: SessionRecord): SessionMessage[] {
+  return payload.mode === "chat" ? session.messages.slice() : [];
+}
 
-    const userMessage: SessionMessage = {
-      role: "user",
-      content: payload.prompt,
-      createdAt: new Date().toISOString()
+export interface RouteRequest {
+  body: unknown;
+}
+
+export interface RouteResponse {
+  status(code: number): RouteResponse;
+  setHeader(name: string, value: string): unknown;
+  json(body: unknown): unknown;
+  write(chunk: string): boolean;
+  end(): unknown;
+  on(event: "close", listener: () => void): unknown;
+  readonly writableFinished: boolean;
+}
+
+export type RouteHandler = (req: RouteRequest, res: RouteResponse) => void | Promise<void>;
+
+async function handleRpc(req: RouteRequest, res: RouteResponse) {
+  const rpc = req.body as JsonRpcRequest<AgentProcessRequest>;
+  if (!rpc || rpc.jsonrpc !== "2.0") {
+    const error: JsonRpcError = {
+      jsonrpc: "2.0",
+      error: { code: -32600, message: "Invalid Request" },
+      id: null
     };
-    appendMessage(session, userMessage);
+    res.status(400).json(error);
+    return;
+  }
+
+  if (rpc.method !== "agent.process") {
+    const error: JsonRpcError = {
+      jsonrpc: "2.0",
+      error: { code: -32601, message: "Method not found" },
+      id: rpc.id ?? null
+    };
+    res.status(404).json(error);
+    return;
+  }
+
+  const payload = rpc.params;
+  if (!payload?.prompt) {
+    const error: JsonRpcError = {
+      jsonrpc: "2.0",
+      error: { code: -32602, message: "prompt가 필요합니다." },
+      id: rpc.id ?? null
+    };
+    res.status(400).json(error);
+    return;
+  }
+
+  const context = resolveContext(payload.context);
+  if (context === null) {
+    const error: JsonRpcError = {
+      jsonrpc: "2.0",
+      error: { code: -32010, message: "컨텍스트를 찾을 수 없습니다." },
+      id: rpc.id ?? null
+    };
+    res.status(409).json(error);
+    return;
+  }
+  payload.context = context;
+
+  const model = resolveModelConfig(payload.model);
+  const session = openSession(payload, model);
+  if (!session) {
+    const error: JsonRpcError = {
+      jsonrpc: "2.0",
+      error: { code: -32010, message: "이어 쓸 세션의 컨텍스트를 찾을 수 없습니다." },
+      id: rpc.id ?? null
+    };
+    res.status(409).json(error);
+    return;
+  }
+  const history = promptHistory(payload, session);
+
+  const userMessage: SessionMessage = {
+    role: "user",
+    content: payload.prompt,
+    createdAt: new Date().toISOString()
+  };
+  appendMessage(session, userMessage);
+
+  if (payload.stream) {
+    res.status(200);
+    res.setHeader("Content-Type", "application/json; charset=utf-8");
+    res.setHeader("Transfer-Encoding", "chunked");
+
+    const writeChunk = (chunk: AgentStreamChunk) => {
+      const data: JsonRpcSuccess<AgentStreamChunk> = {
+        jsonrpc: "2.0",
+        result: chunk,
+        id: rpc.id ?? null
+      };
+      res.write(`${JSON.stringify(data)}\n`);
+    };
+
+    writeChunk({ type: "start", sessionId: session.id });
+    const result = await llm.generateStream(
+      payload,
+      model,
+      (delta) => {
+        writeChunk({ type: "delta", content: delta });
+      },
+      (name, args) => {
+        writeChunk({ type: "tool", name, arguments: args });
+      },
+      history
+    );
 
-    const result = await llm.generate(payload, model);
     const assistantMessage: SessionMessage = {
       role: "assistant",
       content: result.type === "message" ? result.content : JSON.stringify(result),
       createdAt: new Date().toISOString()
     };
     appendMessage(session, assistantMessage);
+    writeChunk({ type: "final", result });
+    res.end();
+    return;
+  }
 
-    const response: AgentProcessResponse = {
+  const result = await llm.generate(payload, model, history);
+  const assistantMessage: SessionMessage = {
+    role: "assistant",
+    content: result.type === "message" ? result.content : JSON.stringify(result),
+    createdAt: new Date().toISOString()
+  };
+  appendMessage(session, assistantMessage);
+
+  const response: JsonRpcSuccess<AgentProcessResponse> = {
+    jsonrpc: "2.0",
+    result: {
       sessionId: session.id,
       result
-    };
+    },
+    id: rpc.id ?? null
+  };
+  res.json(response);
+}
 
-    res.json(response);
+function handleTerminalRequest(req: RouteRequest, res: RouteResponse) {
+  const { command } = req.body as { command?: string };
+  if (!command) {
+    res.status(400).json({ error: "command가 필요합니다." });
+    return;
+  }
+  const request = createTerminalRequest(command);
+  res.json(request);
+}
+
+function handleTerminalRequestBatch(req: RouteRequest, res: RouteResponse) {
+  const { commands } = req.body as { commands?: unknown };
+  if (!Array.isArray(commands) || commands.length === 0) {
+    res.status(400).json({ error: "commands가 필요합니다." });
+    return;
+  }
+  if (!commands.every((command) => typeof command === "string" && command)) {
+    res.status(400).json({ error: "command는 비어 있지 않은 문자열이어야 합니다." });
+    return;
+  }
+  res.json({ requests: (commands as string[]).map((command) => createTerminalRequest(command)) });
+}
+
+async function handleTerminalExecute(req: RouteRequest, res: RouteResponse) {
+  const { requestId, approve } = req.body as {
+    requestId?: string;
+    approve?: boolean;
+  };
+  if (!requestId) {
+    res.status(400).json({ error: "requestId가 필요합니다." });
+    return;
+  }
+  const request = getTerminalRequest(requestId);
+  if (!request) {
+    res.status(404).json({ error: "요청을 찾을 수 없습니다." });
+    return;
+  }
+  if (!approve) {
+    clearTerminalRequest(requestId);
+    res.json({ ok: false, message: "사용자가 실행을 거부했습니다." });
+    return;
+  }
+  const result = await executeTerminalCommand(request.command);
+  clearTerminalRequest(requestId);
+  res.json({ ok: true, result });
+}
+
+async function handleTerminalExecuteStream(req: RouteRequest, res: RouteResponse) {
+  const { requestId, approve } = req.body as {
+    requestId?: string;
+    approve?: boolean;
+  };
+  if (!requestId) {
+    res.status(400).json({ error: "requestId가 필요합니다." });
+    return;
+  }
+  const request = getTerminalRequest(requestId);
+  if (!request) {
+    res.status(404).json({ error: "요청을 찾을 수 없습니다." });
+    return;
+  }
+  clearTerminalRequest(requestId);
+  if (!approve) {
+    res.json({ ok: false, message: "사용자가 실행을 거부했습니다." });
+    return;
+  }
+
+  res.status(200);
+  res.setHeader("Content-Type", "application/x-ndjson; charset=utf-8");
+  res.setHeader("Transfer-Encoding", "chunked");
+  const writeChunk = (chunk: TerminalStreamChunk) => {
+    res.write(`${JSON.stringify(chunk)}\n`);
+  };
+
+  const controller = new AbortController();
+  res.on("close", () => {
+    if (!res.writableFinished) controller.abort();
   });
 
-  app.post("/rpc", async (req, res) => {
-    const rpc = req.body as JsonRpcRequest<AgentProcessRequest>;
-    if (!rpc || rpc.jsonrpc !== "2.0") {
-      const error: JsonRpcError = {
-        jsonrpc: "2.0",
-        error: { code: -32600, message: "Invalid Request" },
-        id: null
-      };
-      res.status(400).json(error);
-      return;
-    }
+  writeChunk({ type: "start", command: request.command });
+  const exitCode = await executeTerminalCommandStream(
+    request.command,
+    (stream, data) => writeChunk({ type: stream, data }),
+    controller.signal
+  );
+  writeChunk({ type: "exit", exitCode });
+  res.end();
+}
 
-    if (rpc.method !== "agent.process") {
-      const error: JsonRpcError = {
-        jsonrpc: "2.0",
-        error: { code: -32601, message: "Method not found" },
-        id: rpc.id ?? null
-      };
-      res.status(404).json(error);
+// 멀티플렉스 채널(mux.ts)에서도 같은 처리기를 쓴다.
+export const muxRoutes = new Map<string, RouteHandler>([
+  ["/rpc", handleRpc],
+  ["/api/agent/terminal/request", handleTerminalRequest],
+  ["/api/agent/terminal/request-batch", handleTerminalRequestBatch],
+  ["/api/agent/terminal/execute", handleTerminalExecute],
+  ["/api/agent/terminal/execute-stream", handleTerminalExecuteStream]
+]);
+
+export function createApp() {
+  const app = express();
+  app.use(cors());
+  app.use(express.json({ limit: "2mb" }));
+
+  app.get("/health", (_req, res) => {
+    const { provider, model } = resolveModelConfig();
+    res.json({
+      ok: true,
+      model: `${provider}/${model}`,
+      capabilities: { contextCache: true, sessionContext: true }
+    });
+  });
+
+  app.post("/api/agent/process", async (req, res) => {
+    const payload = req.body as AgentProcessRequest;
+    if (!payload?.prompt) {
+      res.status(400).json({ error: "prompt가 필요합니다." });
       return;
     }
 
-    const payload = rpc.params;
-    if (!payload?.prompt) {
-      const error: JsonRpcError = {
-        jsonrpc: "2.0",
-        error: { code: -32602, message: "prompt가 필요합니다." },
-        id: rpc.id ?? null
-      };
-      res.status(400).json(error);
+    const context = resolveContext(payload.context);
+    if (context === null) {
+      res.status(409).json({ error: "컨텍스트를 찾을 수 없습니다. 전체 내용을 다시 보내주세요." });
       return;
     }
+    payload.context = context;
 
     const model = resolveModelConfig(payload.model);
-    const session =
-      (payload.sessionId && loadSession(payload.sessionId)) ?? createSession(model);
+    const session = openSession(payload, model);
+    if (!session) {
+      res.status(409).json({ error: "이어 쓸 세션의 컨텍스트를 찾을 수 없습니다. 전체 내용을 다시 보내주세요." });
+      return;
+    }
+    const history = promptHistory(payload, session);
 
     const userMessage: SessionMessage = {
       role: "user",
@@ -108,44 +346,7 @@ export function createApp() {
     };
     appendMessage(session, userMessage);
 
-    if (payload.stream) {
-      res.status(200);
-      res.setHeader("Content-Type", "application/json; charset=utf-8");
-      res.setHeader("Transfer-Encoding", "chunked");
-
-      const writeChunk = (chunk: AgentStreamChunk) => {
-        const data: JsonRpcSuccess<AgentStreamChunk> = {
-          jsonrpc: "2.0",
-          result: chunk,
-          id: rpc.id ?? null
-        };
-        res.write(`${JSON.stringify(data)}\n`);
-      };
-
-      writeChunk({ type: "start", sessionId: session.id });
-      const result = await llm.generateStream(
-        payload,
-        model,
-        (delta) => {
-          writeChunk({ type: "delta", content: delta });
-        },
-        (name, args) => {
-          writeChunk({ type: "tool", name, arguments: args });
-        }
-      );
-
-      const assistantMessage: SessionMessage = {
-        role: "assistant",
-        content: result.type === "message" ? result.content : JSON.stringify(result),
-        createdAt: new Date().toISOString()
-      };
-      appendMessage(session, assistantMessage);
-      writeChunk({ type: "final", result });
-      res.end();
-      return;
-    }
-
-    const result = await llm.generate(payload, model);
+    const result = await llm.generate(payload, model, history);
     const assistantMessage: SessionMessage = {
       role: "assistant",
       content: result.type === "message" ? result.content : JSON.stringify(result),
@@ -153,27 +354,60 @@ export function createApp() {
     };
     appendMessage(session, assistantMessage);
 
-    const response: JsonRpcSuccess<AgentProcessResponse> = {
-      jsonrpc: "2.0",
-      result: {
-        sessionId: session.id,
-        result
-      },
-      id: rpc.id ?? null
+    const response: AgentProcessResponse = {
+      sessionId: session.id,
+      result
     };
+
     res.json(response);
   });
 
+  app.post("/rpc", handleRpc);
+
   app.get("/api/agent/sessions", (_req, res) => {
     res.json(listSessions());
   });
 
+  app.get("/api/agent/sessions/index", (req, res) => {
+    const { offset, limit } = pageParams(req.query, 20);
+    const summaries = listSessionSummaries();
+    const latest = summaries[0]?.updatedAt ?? "";
+    res.setHeader("ETag", `W/"${summaries.length}-${latest}-${offset}-${limit}"`);
+    if (req.fresh) {
+      res.status(304).end();
+      return;
+    }
+    res.json({
+      total: summaries.length,
+      offset,
+      sessions: summaries.slice(offset, offset + limit)
+    });
+  });
+
+  app.get("/api/agent/sessions/:id/messages", (req, res) => {
+    const session = loadSession(req.params.id);
+    if (!session) {
+      res.status(404).json({ error: "세션을 찾을 수 없습니다." });
+      return;
+    }
+    const { offset, limit } = pageParams(req.query, 50);
+    res.setHeader("ETag", `W/"${session.updatedAt}-${offset}-${limit}"`);
+    res.json({
+      id: session.id,
+      updatedAt: session.updatedAt,
+      total: session.messages.length,
+      offset,
+      messages: session.messages.slice(offset, offset + limit)
+    });
+  });
+
   app.get("/api/agent/sessions/:id", (req, res) => {
     const session = loadSession(req.params.id);
     if (!session) {
       res.status(404).json({ error: "세션을 찾을 수 없습니다." });
       return;
     }
+    res.setHeader("ETag", `W/"${session.updatedAt}"`);
     res.json(session);
   });
 
@@ -197,39 +431,36 @@ export function createApp() {
     res.json({ ok: true });
   });
 
-  app.post("/api/agent/terminal/request", (req, res) => {
-    const { command } = req.body as { command?: string };
-    if (!command) {
-      res.status(400).json({ error: "command가 필요합니다." });
+  app.post("/api/agent/sessions/:id/messages/batch", (req, res) => {
+    const session = loadSession(req.params.id);
+    if (!session) {
+      res.status(404).json({ error: "세션을 찾을 수 없습니다." });
       return;
     }
-    const request = createTerminalRequest(command);
-    res.json(request);
-  });
-
-  app.post("/api/agent/terminal/execute", async (req, res) => {
-    const { requestId, approve } = req.body as {
-      requestId?: string;
-      approve?: boolean;
+    const { messages } = req.body as {
+      messages?: Array<Partial<SessionMessage>>;
     };
-    if (!requestId) {
-      res.status(400).json({ error: "requestId가 필요합니다." });
-      return;
-    }
-    const request = getTerminalRequest(requestId);
-    if (!request) {
-      res.status(404).json({ error: "요청을 찾을 수 없습니다." });
+    if (!Array.isArray(messages) || messages.length === 0) {
+      res.status(400).json({ error: "messages가 필요합니다." });
       return;
     }
-    if (!approve) {
-      clearTerminalRequest(requestId);
-      res.json({ ok: false, message: "사용자가 실행을 거부했습니다." });
-      return;
-    }
-    const result = await executeTerminalCommand(request.command);
-    clearTerminalRequest(requestId);
-    res.json({ ok: true, result });
+    const now = new Date().toISOString();
+    const records: SessionMessage[] = messages
+      .filter((message) => typeof message.content === "string" && message.content)
+      .map((message) => ({
+        ...(message.id ? { id: String(message.id) } : {}),
+        role: message.role ?? "tool",
+        content: message.content as string,
+        createdAt: typeof message.createdAt === "string" ? message.createdAt : now
+      }));
+    const appended = appendMessages(session, records);
+    res.json({ ok: true, appended });
   });
 
+  app.post("/api/agent/terminal/request", handleTerminalRequest);
+  app.post("/api/agent/terminal/request-batch", handleTerminalRequestBatch);
+  app.post("/api/agent/terminal/execute", handleTerminalExecute);
+  app.post("/api/agent/terminal/execute-stream", handleTerminalExecuteStream);
+
   return app;
 }
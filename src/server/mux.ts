@@ -0,0 +1,169 @@
+import type { IncomingMessage, Server } from "node:http";
+import type { Socket } from "node:net";
+import type { Duplex } from "node:stream";
+import { StringDecoder } from "node:string_decoder";
+import type { RouteHandler, RouteResponse } from "./app.js";
+
+// 한 연결 위에서 여러 요청을 주고받는 멀티플렉스 채널.
+// HTTP Upgrade(ai-agent-mux) 후 양쪽이 한 줄에 JSON 하나씩 보낸다.
+//   클라이언트 → 서버: {"stream":1,"path":"/rpc","body":{...}} / {"stream":1,"cancel":true}
+//   서버 → 클라이언트: {"stream":1,"status":200,"type":"..."} → {"stream":1,"data":{...}}* → {"stream":1,"end":true}
+export const MUX_PROTOCOL = "ai-agent-mux";
+
+const MAX_FRAME_BYTES = 4 * 1024 * 1024;
+
+interface MuxRequestFrame {
+  stream?: unknown;
+  path?: string;
+  body?: unknown;
+  cancel?: boolean;
+}
+
+class MuxResponse implements RouteResponse {
+  writableFinished = false;
+  private statusCode = 200;
+  private contentType = "application/json; charset=utf-8";
+  private headSent = false;
+  private closed = false;
+  private partial = "";
+  private readonly listeners: Array<() => void> = [];
+
+  constructor(
+    private readonly id: number,
+    private readonly send: (line: string) => void
+  ) {}
+
+  status(code: number) {
+    this.statusCode = code;
+    return this;
+  }
+
+  setHeader(name: string, value: string) {
+    if (name.toLowerCase() === "content-type") this.contentType = value;
+    return this;
+  }
+
+  json(body: unknown) {
+    this.head();
+    this.frame(`"data":${JSON.stringify(body)}`);
+    return this.end();
+  }
+
+  write(chunk: string) {
+    this.head();
+    // 처리기는 레코드마다 JSON 한 줄을 쓰므로 다시 파싱하지 않고 그대로 프레임에 싣는다.
+    const lines = (this.partial + chunk).split("\n");
+    this.partial = lines.pop() ?? "";
+    for (const line of lines) {
+      if (line.trim()) this.frame(`"data":${line}`);
+    }
+    return !this.closed;
+  }
+
+  end() {
+    if (this.writableFinished) return this;
+    this.head();
+    if (this.partial.trim()) this.frame(`"data":${this.partial}`);
+    this.partial = "";
+    this.frame(`"end":true`);
+    this.writableFinished = true;
+    this.close();
+    return this;
+  }
+
+  on(_event: "close", listener: () => void) {
+    this.listeners.push(listener);
+    return this;
+  }
+
+  close() {
+    if (this.closed) return;
+    this.closed = true;
+    for (const listener of this.listeners) listener();
+  }
+
+  private head() {
+    if (this.headSent) return;
+    this.headSent = true;
+    this.frame(`"status":${this.statusCode},"type":${JSON.stringify(this.contentType)}`);
+  }
+
+  private frame(fields: string) {
+    if (!this.closed) this.send(`{"stream":${this.id},${fields}}\n`);
+  }
+}
+
+function serveChannel(socket: Duplex, head: Buffer, routes: Map<string, RouteHandler>) {
+  const streams = new Map<number, MuxResponse>();
+  const decoder = new StringDecoder("utf8");
+  let buffered = "";
+
+  const send = (line: string) => {
+    if (!socket.destroyed) socket.write(line);
+  };
+
+  const handleFrame = (frame: MuxRequestFrame) => {
+    const id = frame.stream;
+    if (typeof id !== "number") return;
+    if (frame.cancel) {
+      streams.get(id)?.close();
+      streams.delete(id);
+      return;
+    }
+    const res = new MuxResponse(id, send);
+    streams.set(id, res);
+    res.on("close", () => streams.delete(id));
+    const route = frame.path ? routes.get(frame.path) : undefined;
+    if (!route) {
+      res.status(404).json({ error: "not found" });
+      return;
+    }
+    Promise.resolve(route({ body: frame.body ?? {} }, res)).catch((error: unknown) => {
+      if (!res.writableFinished) {
+        res.status(500).json({ error: error instanceof Error ? error.message : String(error) });
+      }
+    });
+  };
+
+  const onData = (data: Buffer) => {
+    buffered += decoder.write(data);
+    const lines = buffered.split("\n");
+    buffered = lines.pop() ?? "";
+    if (buffered.length > MAX_FRAME_BYTES) {
+      socket.destroy();
+      return;
+    }
+    for (const line of lines) {
+      if (!line.trim()) continue;
+      let frame: MuxRequestFrame;
+      try {
+        frame = JSON.parse(line) as MuxRequestFrame;
+      } catch {
+        continue;
+      }
+      handleFrame(frame);
+    }
+  };
+
+  socket.on("data", onData);
+  socket.on("error", () => socket.destroy());
+  socket.on("close", () => {
+    for (const res of streams.values()) res.close();
+    streams.clear();
+  });
+  if (head.length) onData(head);
+}
+
+export function attachMuxChannel(server: Server, routes: Map<string, RouteHandler>) {
+  server.on("upgrade", (req: IncomingMessage, socket: Duplex, head: Buffer) => {
+    if ((req.headers.upgrade ?? "").toLowerCase() !== MUX_PROTOCOL) {
+      socket.end("HTTP/1.1 400 Bad Request\r\nConnection: close\r\n\r\n");
+      return;
+    }
+    socket.write(
+      `HTTP/1.1 101 Switching Protocols\r\nUpgrade: ${MUX_PROTOCOL}\r\nConnection: Upgrade\r\n\r\n`
+    );
+    (socket as Socket).setNoDelay?.(true);
+    serveChannel(socket, head, routes);
+  });
+}
@@ -1,5 +1,5 @@
 import crypto from "node:crypto";
-import { runBash } from "../tools/bash-tool.js";
+import { BashStreamName, runBash, runBashStream } from "../tools/bash-tool.js";
 
 export interface TerminalRequest {
   id: string;
@@ -30,3 +30,11 @@ export function clearTerminalRequest(id: string): void {
 export async function executeTerminalCommand(command: string) {
   return runBash(command, process.cwd());
 }
+
+export async function executeTerminalCommandStream(
+  command: string,
+  onOutput: (stream: BashStreamName, data: string) => void,
+  signal?: AbortSignal
+) {
+  return runBashStream(command, onOutput, process.cwd(), signal);
+}
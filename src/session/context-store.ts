@@ -0,0 +1,104 @@
+import crypto from "node:crypto";
+import { AgentRequestContext } from "../types.js";
+
+const MAX_ENTRIES = 64;
+const MAX_TOTAL_CHARS = 64 * 1024 * 1024;
+const MAX_SESSION_CONTEXTS = 256;
+
+const contexts = new Map<string, string>();
+let totalChars = 0;
+// 세션마다 마지막 요청의 컨텍스트. 세션 파일에는 쓰지 않고, 선택 영역은 위 저장소의 해시로만 가리킨다.
+const sessionContexts = new Map<string, AgentRequestContext>();
+
+export function contextHash(text: string): string {
+  return crypto.createHash("sha256").update(text, "utf8").digest("hex");
+}
+
+function remember(hash: string, text: string): void {
+  const existing = contexts.get(hash);
+  if (existing !== undefined) {
+    contexts.delete(hash);
+    contexts.set(hash, existing);
+    return;
+  }
+  contexts.set(hash, text);
+  totalChars += text.length;
+  while (contexts.size > MAX_ENTRIES || totalChars > MAX_TOTAL_CHARS) {
+    const oldest = contexts.keys().next().value as string;
+    totalChars -= contexts.get(oldest)?.length ?? 0;
+    contexts.delete(oldest);
+  }
+}
+
+function lookup(hash: string): string | null {
+  const text = contexts.get(hash);
+  if (text === undefined) return null;
+  contexts.delete(hash);
+  contexts.set(hash, text);
+  return text;
+}
+
+function applyLineDelta(base: string, ops: Array<[number, number, string[]]>): string {
+  const baseLines = base.split("\n");
+  const lines: string[] = [];
+  let cursor = 0;
+  for (const [start, end, replacement] of ops) {
+    lines.push(...baseLines.slice(cursor, start), ...replacement);
+    cursor = end;
+  }
+  lines.push(...baseLines.slice(cursor));
+  return lines.join("\n");
+}
+
+export function resolveContext(
+  context: AgentRequestContext | undefined
+): AgentRequestContext | undefined | null {
+  if (!context) return context;
+  const { selectionHash, selectionDelta, ...rest } = context;
+
+  if (typeof context.selection === "string") {
+    remember(contextHash(context.selection), context.selection);
+    return rest;
+  }
+  if (!selectionHash) return rest;
+
+  let text: string | null = null;
+  if (selectionDelta) {
+    const base = lookup(selectionDelta.baseHash);
+    if (base === null) return null;
+    text = applyLineDelta(base, selectionDelta.ops);
+    if (contextHash(text) !== selectionHash) return null;
+    remember(selectionHash, text);
+  } else {
+    text = lookup(selectionHash);
+  }
+  if (text === null) return null;
+  return { ...rest, selection: text };
+}
+
+export function rememberSessionContext(sessionId: string, context: AgentRequestContext): void {
+  const { selection, ...rest } = context;
+  const entry: AgentRequestContext = { ...rest };
+  if (typeof selection === "string") {
+    entry.selectionHash = contextHash(selection);
+    remember(entry.selectionHash, selection);
+  }
+  sessionContexts.delete(sessionId);
+  sessionContexts.set(sessionId, entry);
+  while (sessionContexts.size > MAX_SESSION_CONTEXTS) {
+    sessionContexts.delete(sessionContexts.keys().next().value as string);
+  }
+}
+
+// 선택 영역이 저장소에서 밀려났으면 null을 돌려주고, 클라이언트가 전체 컨텍스트를 다시 보내게 한다.
+export function sessionContext(sessionId: string): AgentRequestContext | null {
+  const entry = sessionContexts.get(sessionId);
+  if (!entry) return null;
+  sessionContexts.delete(sessionId);
+  sessionContexts.set(sessionId, entry);
+  const { selectionHash, ...rest } = entry;
+  if (!selectionHash) return rest;
+  const text = lookup(selectionHash);
+  if (text === null) return null;
+  return { ...rest, selection: text };
+}
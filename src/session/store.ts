@@ -1,7 +1,7 @@
 import fs from "node:fs";
 import path from "node:path";
 import crypto from "node:crypto";
-import { LLMConfig, SessionMessage, SessionRecord } from "../types.js";
+import { LLMConfig, SessionMessage, SessionRecord, SessionSummary } from "../types.js";
 
 const SESSIONS_DIR = path.join(process.cwd(), ".ai-agent", "sessions");
 
@@ -40,7 +40,9 @@ export function loadSession(id: string): SessionRecord | null {
 export function saveSession(record: SessionRecord): void {
   ensureDir();
   record.updatedAt = new Date().toISOString();
-  fs.writeFileSync(sessionPath(record.id), JSON.stringify(record, null, 2), "utf-8");
+  const file = sessionPath(record.id);
+  fs.writeFileSync(file, JSON.stringify(record, null, 2), "utf-8");
+  rememberSummary(`${record.id}.json`, fs.statSync(file), summarizeSession(record));
 }
 
 export function appendMessage(
@@ -52,6 +54,20 @@ export function appendMessage(
   return record;
 }
 
+export function appendMessages(
+  record: SessionRecord,
+  messages: SessionMessage[]
+): number {
+  const seen = new Set(
+    record.messages.map((message) => message.id).filter((id): id is string => Boolean(id))
+  );
+  const fresh = messages.filter((message) => !message.id || !seen.has(message.id));
+  if (fresh.length === 0) return 0;
+  record.messages.push(...fresh);
+  saveSession(record);
+  return fresh.length;
+}
+
 export function listSessions(): SessionRecord[] {
   ensureDir();
   const files = fs.readdirSync(SESSIONS_DIR);
@@ -63,3 +79,54 @@ export function listSessions(): SessionRecord[] {
     })
     .sort((a, b) => b.updatedAt.localeCompare(a.updatedAt));
 }
+
+export function summarizeSession(record: SessionRecord): SessionSummary {
+  const firstPrompt = record.messages.find((message) => message.role === "user")?.content ?? "";
+  return {
+    id: record.id,
+    createdAt: record.createdAt,
+    updatedAt: record.updatedAt,
+    messageCount: record.messages.length,
+    firstPrompt: firstPrompt.slice(0, 120)
+  };
+}
+
+// 세션 파일 이름별 요약. 파일의 mtime과 크기가 그대로면 다시 읽지 않는다.
+const summaryCache = new Map<string, { mtimeMs: number; size: number; summary: SessionSummary }>();
+
+function rememberSummary(file: string, stat: fs.Stats, summary: SessionSummary): void {
+  summaryCache.set(file, { mtimeMs: stat.mtimeMs, size: stat.size, summary });
+}
+
+export function listSessionSummaries(): SessionSummary[] {
+  ensureDir();
+  const files = fs.readdirSync(SESSIONS_DIR).filter((file) => file.endsWith(".json"));
+  const present = new Set(files);
+  for (const file of summaryCache.keys()) {
+    if (!present.has(file)) summaryCache.delete(file);
+  }
+  const summaries: SessionSummary[] = [];
+  for (const file of files) {
+    const fullPath = path.join(SESSIONS_DIR, file);
+    let stat: fs.Stats;
+    try {
+      stat = fs.statSync(fullPath);
+    } catch {
+      continue;
+    }
+    const cached = summaryCache.get(file);
+    if (cached && cached.mtimeMs === stat.mtimeMs && cached.size === stat.size) {
+      summaries.push(cached.summary);
+      continue;
+    }
+    try {
+      const record = JSON.parse(fs.readFileSync(fullPath, "utf-8")) as SessionRecord;
+      const summary = summarizeSession(record);
+      rememberSummary(file, stat, summary);
+      summaries.push(summary);
+    } catch {
+      summaryCache.delete(file);
+    }
+  }
+  return summaries.sort((a, b) => b.updatedAt.localeCompare(a.updatedAt));
+}
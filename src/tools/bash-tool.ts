@@ -1,4 +1,4 @@
-import { exec } from "node:child_process";
+import { exec, spawn } from "node:child_process";
 
 export interface BashResult {
   stdout: string;
@@ -32,3 +32,35 @@ export function runBash(command: string, cwd = process.cwd()): Promise<BashResul
     );
   });
 }
+
+export type BashStreamName = "stdout" | "stderr";
+
+export function runBashStream(
+  command: string,
+  onOutput: (stream: BashStreamName, data: string) => void,
+  cwd = process.cwd(),
+  signal?: AbortSignal
+): Promise<number> {
+  return new Promise((resolve) => {
+    const child = spawn(command, {
+      cwd,
+      shell: true,
+      signal,
+      env: {
+        ...process.env,
+        LANG: process.env.LANG ?? "ko_KR.UTF-8",
+        LC_ALL: process.env.LC_ALL ?? "ko_KR.UTF-8"
+      }
+    });
+    child.stdout.setEncoding("utf8");
+    child.stderr.setEncoding("utf8");
+    child.stdout.on("data", (data: string) => onOutput("stdout", data));
+    child.stderr.on("data", (data: string) => onOutput("stderr", data));
+    child.on("error", (error) => {
+      onOutput("stderr", error.message);
+    });
+    child.on("close", (code) => {
+      resolve(typeof code === "number" ? code : 1);
+    });
+  });
+}
@@ -11,12 +11,22 @@ export interface AgentRequestContext {
   file?: string;
   selection?: string;
   range?: [number, number];
+  segments?: Array<[number, number]>;
+  selectionHash?: string;
+  selectionDelta?: {
+    baseHash: string;
+    ops: Array<[number, number, string[]]>;
+  };
+  // true이면 바뀐 항목만 보낸 것이므로 세션에 저장된 컨텍스트와 합친다(null은 항목 삭제).
+  inherit?: boolean;
 }
 
 export interface AgentProcessRequest {
   prompt: string;
   context?: AgentRequestContext;
   sessionId?: string;
+  // "chat"일 때만 세션의 이전 대화를 프롬프트에 넣는다. 편집/리뷰는 선택 영역만으로 답한다.
+  mode?: "chat" | "edit" | "review";
   model?: LLMConfig;
   stream?: boolean;
 }
@@ -43,6 +53,12 @@ export type AgentStreamChunk =
   | { type: "tool"; name: string; arguments: string }
   | { type: "final"; result: AgentResult };
 
+export type TerminalStreamChunk =
+  | { type: "start"; command: string }
+  | { type: "stdout"; data: string }
+  | { type: "stderr"; data: string }
+  | { type: "exit"; exitCode: number };
+
 export interface JsonRpcRequest<TParams = unknown> {
   jsonrpc: "2.0";
   method: string;
@@ -63,6 +79,7 @@ export interface JsonRpcError {
 }
 
 export interface SessionMessage {
+  id?: string;
   role: "user" | "assistant" | "tool";
   content: string;
   createdAt: string;
@@ -75,3 +92,11 @@ export interface SessionRecord {
   messages: SessionMessage[];
   model: LLMConfig;
 }
+
+export interface SessionSummary {
+  id: string;
+  createdAt: string;
+  updatedAt: string;
+  messageCount: number;
+  firstPrompt: string;
+}
@@ -1,9 +1,21 @@
 import json
 import threading
 import http.client
+import socket
+import time
+import collections
+import concurrent.futures
 import difflib
+import fnmatch
+import hashlib
+import bisect
+import heapq
 import html
+import math
+import os
 import re
+import tempfile
+import uuid
 import sublime
 import sublime_plugin
 
@@ -14,394 +26,4900 @@ USER_LABEL = "junsangdong"
 ASSISTANT_LABEL = "Maclaw"
 USER_BG = "#f2f2f2"
 ASSISTANT_BG = "#e6f2ff"
+HISTORY_PAGE_SIZE = 20
+HISTORY_MESSAGE_PAGE_SIZE = 20
+# 서버가 한 번에 돌려주는 세션/메시지 수의 상한(pageParams)
+SERVER_PAGE_LIMIT = 200
+HISTORY_PREVIEW_CHARS = 600
+SETTINGS_FILE = "ai_agent.sublime-settings"
 
 
-def _build_rpc_request(prompt, context, stream=True, request_id=1):
+def _setting(key, default):
+    value = sublime.load_settings(SETTINGS_FILE).get(key)
+    if value is None:
+        return default
+    return value
+
+
+_STALE_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    http.client.CannotSendRequest,
+    http.client.ResponseNotReady,
+    BrokenPipeError,
+    ConnectionResetError,
+    ConnectionAbortedError
+)
+
+
+class _CircuitOpenError(ConnectionError):
+    pass
+
+
+class _PoolTimeout(socket.timeout):
+    pass
+
+
+class _CircuitBreaker(object):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=3, open_seconds=10.0):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.last_error = None
+        self._trial_started = None
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._stats = collections.Counter()
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def retry_in(self):
+        with self._lock:
+            if self.state != self.OPEN:
+                return 0.0
+            return max(0.0, self.opened_at + self.open_seconds - time.monotonic())
+
+    def allows(self):
+        now = time.monotonic()
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                return now - self.opened_at >= self.open_seconds
+            return self._trial_started is None or now - self._trial_started > self.open_seconds
+
+    def check(self):
+        # 열린 동안에는 연결을 시도하지 않고 바로 실패시킨다. 대기 시간이 지나면 한 요청만 시험으로 보낸다.
+        now = time.monotonic()
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN and now - self.opened_at >= self.open_seconds:
+                self._set_state(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN and (
+                self._trial_started is None or now - self._trial_started > self.open_seconds
+            ):
+                self._trial_started = now
+                self._stats["trials"] += 1
+                return
+            self._stats["rejected"] += 1
+            wait = max(0.0, self.opened_at + self.open_seconds - now)
+        raise _CircuitOpenError(
+            "에이전트 서버에 연결할 수 없습니다 ({:.0f}초 후 다시 확인): {}".format(wait, self.last_error)
+        )
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._trial_started = None
+            if self.state != self.CLOSED:
+                self._set_state(self.CLOSED)
+
+    def record_failure(self, error):
+        with self._lock:
+            self.failures += 1
+            self.last_error = str(error) or type(error).__name__
+            self._trial_started = None
+            self._stats["failures"] += 1
+            if self.state == self.HALF_OPEN or (
+                self.state == self.CLOSED and self.failures >= self.failure_threshold
+            ):
+                self.opened_at = time.monotonic()
+                self._set_state(self.OPEN)
+
+    def _set_state(self, state):
+        self.state = state
+        self._stats[state] += 1
+        for listener in self._listeners:
+            sublime.set_timeout(lambda listener=listener: listener(state), 0)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["state"] = self.state
+            stats["failures"] = self.failures
+            if self.last_error:
+                stats["lastError"] = self.last_error
+        return stats
+
+
+def _server_socket():
+    path = _setting("server_socket", "")
+    if not path or not hasattr(socket, "AF_UNIX"):
+        return None
+    return os.path.expanduser(path)
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, host, port, timeout):
+        http.client.HTTPConnection.__init__(self, host, port, timeout=timeout)
+        self.socket_path = socket_path
+        self.ai_agent_fallback = False
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            # 소켓 파일이 없거나 서버가 TCP로만 떠 있으면 TCP로 연결한다.
+            sock.close()
+            self.ai_agent_fallback = True
+            http.client.HTTPConnection.connect(self)
+            return
+        self.sock = sock
+
+
+class _ConnectionPool(object):
+    def __init__(
+        self, host, port, max_size=8, idle_timeout=4.0, acquire_timeout=10.0, socket_path=None,
+        connect_timeout=None, breaker=None
+    ):
+        self.host = host
+        self.port = port
+        self.socket_path = socket_path
+        self.connect_timeout = connect_timeout
+        self.breaker = breaker
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.acquire_timeout = acquire_timeout
+        self._idle = collections.deque()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._stats = {
+            "requests": 0,
+            "created": 0,
+            "reused": 0,
+            "reconnects": 0,
+            "discarded": 0,
+            "errors": 0,
+            "waitTimeouts": 0,
+            "socketFallbacks": 0
+        }
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def acquire(self, timeout):
+        # 요청 시간 제한이 풀 대기 시간보다 짧으면 그 안에서만 빈 연결을 기다린다.
+        wait = min(timeout, self.acquire_timeout) if timeout else self.acquire_timeout
+        if not self._slots.acquire(timeout=wait):
+            self._count("waitTimeouts")
+            raise _PoolTimeout("연결 풀 대기 시간 초과")
+        conn = None
+        now = time.monotonic()
+        with self._lock:
+            self._in_use += 1
+            while self._idle:
+                candidate, released_at = self._idle.pop()
+                if now - released_at < self.idle_timeout and candidate.sock is not None:
+                    conn = candidate
+                    break
+                candidate.close()
+                self._stats["discarded"] += 1
+            if conn is not None:
+                self._stats["reused"] += 1
+        if conn is None:
+            if self.socket_path:
+                conn = _UnixHTTPConnection(self.socket_path, self.host, self.port, timeout)
+            else:
+                conn = http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+            conn.ai_agent_reused = False
+            self._count("created")
+        else:
+            conn.ai_agent_reused = True
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn
+
+    def release(self, conn, reusable=True):
+        with self._lock:
+            self._in_use -= 1
+            aborted = getattr(conn, "ai_agent_aborted", False)
+            if reusable and not aborted and conn.sock is not None:
+                self._idle.append((conn, time.monotonic()))
+            else:
+                conn.close()
+                self._stats["discarded"] += 1
+        self._slots.release()
+
+    def _send(self, method, path, body, headers, timeout):
+        if self.breaker is not None:
+            self.breaker.check()
+        try:
+            conn, resp = self._send_once(method, path, body, headers, timeout)
+        except _PoolTimeout:
+            raise
+        except Exception as e:
+            if self.breaker is not None:
+                self.breaker.record_failure(e)
+            raise
+        if self.breaker is not None:
+            # 프록시(nginx)가 백엔드 장애를 5xx로 돌려주는 경우도 실패로 센다.
+            if resp.status in (502, 503, 504):
+                self.breaker.record_failure(http.client.HTTPException("HTTP {}".format(resp.status)))
+            else:
+                self.breaker.record_success()
+        return conn, resp
+
+    def _send_once(self, method, path, body, headers, timeout):
+        self._count("requests")
+        attempts = 0
+        while True:
+            conn = self.acquire(timeout)
+            try:
+                if conn.sock is None:
+                    connect_started = time.monotonic()
+                    if self.connect_timeout:
+                        # 응답이 없는 서버에서 요청 시간 제한(30~60초)만큼 기다리지 않도록 연결은 짧게 기다린다.
+                        conn.timeout = min(timeout, self.connect_timeout)
+                    conn.connect()
+                    conn.timeout = timeout
+                    conn.sock.settimeout(timeout)
+                    conn.ai_agent_connect_ms = (time.monotonic() - connect_started) * 1000
+                    if getattr(conn, "ai_agent_fallback", False) and self.socket_path:
+                        with self._lock:
+                            self.socket_path = None
+                            self._stats["socketFallbacks"] += 1
+                else:
+                    conn.ai_agent_connect_ms = 0.0
+                conn.request(method, path, body=body, headers=headers or {})
+                return conn, conn.getresponse()
+            except _STALE_ERRORS:
+                self.release(conn, reusable=False)
+                if not conn.ai_agent_reused or attempts:
+                    self._count("errors")
+                    raise
+                attempts += 1
+                self._count("reconnects")
+            except Exception:
+                self.release(conn, reusable=False)
+                self._count("errors")
+                raise
+
+    def request(self, method, path, body=None, headers=None, timeout=30):
+        conn, resp = self._send(method, path, body, headers, timeout)
+        try:
+            data = resp.read()
+        except Exception:
+            self.release(conn, reusable=False)
+            self._count("errors")
+            raise
+        self.release(conn, reusable=not resp.will_close)
+        return resp.status, data, resp
+
+    def stream(self, method, path, body=None, headers=None, timeout=60):
+        return _PooledStream(self, method, path, body, headers, timeout)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["idle"] = len(self._idle)
+            stats["inUse"] = self._in_use
+            stats["maxSize"] = self.max_size
+            stats["transport"] = "unix:" + self.socket_path if self.socket_path else "tcp"
+        return stats
+
+    def close_idle(self):
+        with self._lock:
+            while self._idle:
+                conn, _ = self._idle.pop()
+                conn.close()
+
+
+class _PooledStream(object):
+    def __init__(self, pool, method, path, body, headers, timeout):
+        self._pool = pool
+        self._args = (method, path, body, headers, timeout)
+        self._conn = None
+        self.response = None
+
+    @property
+    def connection(self):
+        return self._conn
+
+    def __enter__(self):
+        self._conn, self.response = self._pool._send(*self._args)
+        return self.response
+
+    def __exit__(self, exc_type, exc, tb):
+        reusable = (
+            exc_type is None
+            and self.response.isclosed()
+            and not self.response.will_close
+        )
+        self._pool.release(self._conn, reusable=reusable)
+        return False
+
+
+LATENCY_EWMA_ALPHA = 0.2
+
+
+class _Backend(object):
+    def __init__(self, host, port, socket_path=None):
+        self.host = host
+        self.port = port
+        self.name = "{}:{}".format(host, port)
+        self.socket_path = socket_path
+        self.breaker = _CircuitBreaker(
+            failure_threshold=int(_setting("circuit_failure_threshold", 3)),
+            open_seconds=float(_setting("circuit_open_seconds", 10))
+        )
+        self.breaker.add_listener(lambda state: _on_circuit_change(self, state))
+        self.pool = _ConnectionPool(
+            host,
+            port,
+            max_size=int(_setting("pool_max_connections", 8)),
+            idle_timeout=float(_setting("pool_idle_timeout", 4.0)),
+            socket_path=socket_path,
+            connect_timeout=float(_setting("connect_timeout", 3.0)),
+            breaker=self.breaker
+        )
+        self.health = {"data": None, "ok": None, "checkedAt": 0.0}
+        self.outstanding = 0
+        self.routed = 0
+        self.latency_ms = None
+        self._latencies = collections.deque(maxlen=200)
+        self._mux = None
+        self._lock = threading.Lock()
+
+    def mux_channel(self):
+        if _setting("transport", "http") != "mux":
+            return None
+        with self._lock:
+            if self._mux is None:
+                self._mux = _MuxChannel(
+                    self.host,
+                    self.port,
+                    socket_path=self.socket_path,
+                    retry_interval=float(_setting("mux_retry_interval", 60))
+                )
+            return self._mux
+
+    def observe(self, elapsed_ms):
+        with self._lock:
+            self._latencies.append(elapsed_ms)
+            if self.latency_ms is None:
+                self.latency_ms = elapsed_ms
+            else:
+                self.latency_ms += LATENCY_EWMA_ALPHA * (elapsed_ms - self.latency_ms)
+
+    def stats(self):
+        with self._lock:
+            latencies = list(self._latencies)
+            stats = {"outstanding": self.outstanding, "routed": self.routed}
+            if latencies:
+                stats["latencyMs"] = round(self.latency_ms, 1)
+                stats["latencyP50Ms"] = round(_percentile(latencies, 0.5), 1)
+                stats["latencyP90Ms"] = round(_percentile(latencies, 0.9), 1)
+        stats.update(("circuit." + key, value) for key, value in self.breaker.stats().items())
+        stats["circuit.retryIn"] = round(self.breaker.retry_in(), 1)
+        return stats
+
+    def close(self):
+        self.pool.close_idle()
+        if self._mux is not None:
+            self._mux.close()
+
+
+class _BackendSet(object):
+    def __init__(self, backends, max_sessions=2000, path=None):
+        self.backends = backends
+        self.max_sessions = max_sessions
+        self.path = path
+        self._owners = collections.OrderedDict()
+        self._turn = 0
+        self._lock = threading.Lock()
+        self._stats = collections.Counter()
+        self._save_scheduled = False
+        self._load()
+
+    def _load(self):
+        # 재시작 후에도 대기 중인 세션 기록과 마지막 세션이 만든 서버로 가도록 세션별 서버를 저장해 둔다.
+        if not self.path or len(self.backends) < 2:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        by_name = {backend.name: backend for backend in self.backends}
+        for session_id, name in data:
+            if name in by_name:
+                self._owners[session_id] = by_name[name]
+
+    def save(self):
+        with self._lock:
+            self._save_scheduled = False
+            data = [[session_id, backend.name] for session_id, backend in self._owners.items()]
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                f.write(json.dumps(data))
+            os.replace(temp_path, self.path)
+        except OSError:
+            pass
+
+    def _choose(self, session_id, exclude=()):
+        # 세션 파일은 그 세션을 만든 백엔드에만 있으므로 이어지는 요청은 같은 백엔드로 보낸다.
+        owner = self._owners.get(session_id) if session_id else None
+        if owner is not None:
+            self._owners.move_to_end(session_id)
+            if owner not in exclude and owner.breaker.allows():
+                self._stats["affinity"] += 1
+                return owner
+            self._stats["affinityFallbacks"] += 1
+        remaining = [b for b in self.backends if b not in exclude] or self.backends
+        candidates = [b for b in remaining if b.breaker.allows()] or remaining
+        self._turn += 1
+        count = len(candidates)
+        index = min(range(count), key=lambda i: (
+            candidates[i].outstanding,
+            candidates[i].latency_ms or 0.0,
+            (i - self._turn) % count
+        ))
+        return candidates[index]
+
+    def pick(self, session_id=None, exclude=()):
+        with self._lock:
+            if exclude:
+                self._stats["failovers"] += 1
+            return self._choose(session_id, exclude)
+
+    def acquire(self, session_id=None, backend=None):
+        with self._lock:
+            if backend is None:
+                backend = self._choose(session_id)
+            backend.outstanding += 1
+            backend.routed += 1
+        return backend
+
+    def release(self, backend):
+        with self._lock:
+            backend.outstanding -= 1
+
+    def bind(self, session_id, backend):
+        if not session_id or len(self.backends) < 2:
+            return
+        with self._lock:
+            changed = self._owners.get(session_id) is not backend
+            self._owners[session_id] = backend
+            self._owners.move_to_end(session_id)
+            while len(self._owners) > self.max_sessions:
+                self._owners.popitem(last=False)
+            if not changed or not self.path or self._save_scheduled:
+                return
+            self._save_scheduled = True
+        # 세션 목록을 합칠 때처럼 한꺼번에 여러 세션이 묶이므로 모아서 저장한다.
+        sublime.set_timeout(lambda: _run_in_background(self.save), 2000)
+
+    def available(self):
+        return [backend for backend in self.backends if backend.breaker.allows()]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["sessions"] = len(self._owners)
+        stats["backends"] = len(self.backends)
+        return stats
+
+    def close(self):
+        if self._save_scheduled:
+            self.save()
+        for backend in self.backends:
+            backend.close()
+
+
+def _server_addresses():
+    servers = _setting("servers", []) or []
+    if not servers:
+        return [(SERVER_HOST, SERVER_PORT, _server_socket())]
+    addresses = []
+    for server in servers:
+        address = str(server).split("://", 1)[-1].rstrip("/")
+        host, sep, port = address.rpartition(":")
+        if not sep:
+            host, port = address, SERVER_PORT
+        addresses.append((host, int(port), None))
+    return addresses
+
+
+_backends = None
+_backends_lock = threading.Lock()
+
+
+def _get_backends():
+    global _backends
+    with _backends_lock:
+        if _backends is None:
+            _backends = _BackendSet(
+                [_Backend(host, port, socket_path) for host, port, socket_path in _server_addresses()],
+                path=os.path.join(sublime.cache_path(), "AiAgent", "session-owners.json")
+            )
+        return _backends
+
+
+SESSION_PATH_PREFIX = "/api/agent/sessions/"
+
+
+def _request_session_id(path, payload=None):
+    if path == "/rpc":
+        return ((payload or {}).get("params") or {}).get("sessionId")
+    if path.startswith(SESSION_PATH_PREFIX):
+        session_id = path[len(SESSION_PATH_PREFIX):].split("?", 1)[0].split("/", 1)[0]
+        if session_id != "index":
+            return session_id
+    return None
+
+
+def _pool_request(method, path, body=None, headers=None, timeout=30, backend=None):
+    backends = _get_backends()
+    backend = backends.acquire(_request_session_id(path), backend)
+    started = time.monotonic()
+    try:
+        status, data, resp = backend.pool.request(
+            method, path, body=body, headers=headers, timeout=timeout
+        )
+    finally:
+        backends.release(backend)
+    backend.observe((time.monotonic() - started) * 1000)
+    return status, data, resp
+
+
+def _http_request(method, path, payload=None, timeout=30, backend=None):
+    if method == "POST" and path in MUX_PATHS and _setting("transport", "http") == "mux":
+        with _open_stream(path, payload, timeout, backend) as stream:
+            return stream.status, stream.read()
+    body = None
+    headers = {}
+    if payload is not None:
+        body = json.dumps(payload)
+        headers["Content-Type"] = "application/json"
+    status, data, _ = _pool_request(
+        method, path, body=body, headers=headers, timeout=timeout, backend=backend
+    )
+    return status, data.decode("utf-8")
+
+
+class _SessionCache(object):
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._index = None
+        self._lock = threading.Lock()
+        self._stats = {"misses": 0, "revalidated": 0, "evictions": 0, "bytesSaved": 0}
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json")
+
+    def _load_index(self):
+        if self._index is not None:
+            return
+        self._index = collections.OrderedDict()
+        if not os.path.isdir(self.directory):
+            return
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._index[name] = size
+
+    def get(self, key):
+        path = self._path(key)
+        name = os.path.basename(path)
+        with self._lock:
+            self._load_index()
+            if name not in self._index:
+                return None
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+                os.utime(path, None)
+            except (OSError, ValueError):
+                self._index.pop(name, None)
+                return None
+            self._index.move_to_end(name)
+            return entry
+
+    def put(self, key, etag, body):
+        if not etag:
+            return
+        path = self._path(key)
+        name = os.path.basename(path)
+        data = json.dumps({"key": key, "etag": etag, "body": body})
+        with self._lock:
+            self._load_index()
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(data)
+            except OSError:
+                return
+            self._index[name] = len(data)
+            self._index.move_to_end(name)
+            self._evict()
+
+    def _evict(self):
+        total = sum(self._index.values())
+        while total > self.max_bytes and len(self._index) > 1:
+            name, size = self._index.popitem(last=False)
+            total -= size
+            self._stats["evictions"] += 1
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    def record(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def clear(self):
+        with self._lock:
+            self._load_index()
+            for name in list(self._index):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+            self._index.clear()
+
+    def stats(self):
+        with self._lock:
+            self._load_index()
+            stats = dict(self._stats)
+            stats["entries"] = len(self._index)
+            stats["bytes"] = sum(self._index.values())
+            stats["maxBytes"] = self.max_bytes
+        return stats
+
+
+_session_cache = None
+_session_cache_lock = threading.Lock()
+
+
+def _get_session_cache():
+    global _session_cache
+    with _session_cache_lock:
+        if _session_cache is None:
+            _session_cache = _SessionCache(
+                os.path.join(sublime.cache_path(), "AiAgent", "sessions"),
+                int(_setting("history_cache_max_bytes", 20 * 1024 * 1024))
+            )
+        return _session_cache
+
+
+def _cached_get(path, timeout=30, backend=None):
+    backend = backend or _get_backends().pick(_request_session_id(path))
+    # 백엔드마다 세션 목록과 ETag가 다르므로 캐시 키에 백엔드를 넣는다.
+    key = backend.name + path
+    cache = _get_session_cache()
+    entry = cache.get(key)
+    headers = {}
+    if entry:
+        headers["If-None-Match"] = entry["etag"]
+    status, data, resp = _pool_request("GET", path, headers=headers, timeout=timeout, backend=backend)
+    if status == 304 and entry:
+        cache.record("revalidated")
+        cache.record("bytesSaved", len(entry["body"]))
+        return 200, entry["body"]
+    body = data.decode("utf-8")
+    if status == 200:
+        cache.record("misses")
+        cache.put(key, resp.getheader("ETag"), body)
+    return status, body
+
+
+def _build_rpc_request(prompt, context, stream=True, request_id=1, session_id=None, mode=None):
+    params = {
+        "prompt": prompt,
+        "context": context,
+        "stream": stream
+    }
+    if session_id:
+        params["sessionId"] = session_id
+    if mode:
+        params["mode"] = mode
+    return {
+        "jsonrpc": "2.0",
+        "method": "agent.process",
+        "params": params,
+        "id": request_id
+    }
+
+
+CONTEXT_MISSING_CODE = -32010
+HEALTH_TTL = 60.0
+
+_health_lock = threading.Lock()
+
+
+def _server_health(max_age=HEALTH_TTL, backend=None):
+    # 서버마다 모델과 기능이 다를 수 있으므로 상태는 백엔드별로 보관한다.
+    backend = backend or _get_backends().pick()
+    health = backend.health
+    now = time.monotonic()
+    with _health_lock:
+        if health["checkedAt"] and now - health["checkedAt"] < max_age:
+            return health["data"]
+    data = None
+    try:
+        status, body = _http_request("GET", "/health", timeout=5, backend=backend)
+        if status == 200:
+            data = json.loads(body)
+    except Exception:
+        data = None
+    with _health_lock:
+        # 서버에 닿지 않는 동안에도 마지막으로 확인한 모델/기능 정보는 유지해 캐시 키가 바뀌지 않게 한다.
+        health["ok"] = data is not None
+        health["data"] = data or health["data"]
+        health["checkedAt"] = now
+        return health["data"]
+
+
+class _HealthMonitor(object):
+    def __init__(self, backends, interval=30.0):
+        self.backends = backends
+        self.interval = interval
+        self._due = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        now = time.monotonic()
+        for backend in self.backends.backends:
+            self._due[backend.name] = now + self._delay(backend)
+        self._thread = threading.Thread(target=self._run, name="ai-agent-health", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _delay(self, backend):
+        breaker = backend.breaker
+        if breaker.state == breaker.OPEN:
+            # 열린 시간이 끝나는 대로 확인해 서버가 돌아오면 바로 닫히도록 한다.
+            return max(0.5, breaker.retry_in())
+        if breaker.state == breaker.HALF_OPEN or breaker.failures:
+            return min(self.interval, breaker.open_seconds)
+        return self.interval
+
+    def _run(self):
+        while not self._stop.wait(max(0.0, min(self._due.values()) - time.monotonic())):
+            for backend in self.backends.backends:
+                if time.monotonic() < self._due[backend.name]:
+                    continue
+                _server_health(max_age=0, backend=backend)
+                self._due[backend.name] = time.monotonic() + self._delay(backend)
+
+
+_health_monitor = None
+
+
+class _DeferredCommands(object):
+    def __init__(self, max_size=5, ttl=300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.expired = 0
+        self._items = collections.deque()
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        while self._items and now - self._items[0][0] > self.ttl:
+            self._items.popleft()
+            self.expired += 1
+
+    def add(self, replay):
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            if len(self._items) >= self.max_size:
+                return False
+            self._items.append((now, replay))
+            return True
+
+    def take(self):
+        with self._lock:
+            self._expire(time.monotonic())
+            items = [replay for _, replay in self._items]
+            self._items.clear()
+        return items
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+
+
+_deferred_commands = None
+_deferred_commands_lock = threading.Lock()
+
+
+def _get_deferred_commands():
+    global _deferred_commands
+    with _deferred_commands_lock:
+        if _deferred_commands is None:
+            _deferred_commands = _DeferredCommands(
+                max_size=int(_setting("circuit_queue_max", 5)),
+                ttl=float(_setting("circuit_queue_ttl", 300))
+            )
+        return _deferred_commands
+
+
+SERVER_STATUS_KEY = "ai_agent_server"
+
+
+def _server_status_text():
+    if _backends is None:
+        return None
+    states = [backend.breaker.state for backend in _backends.backends]
+    closed = states.count(_CircuitBreaker.CLOSED)
+    if closed == len(states):
+        return None
+    if closed:
+        return "AI Agent: 서버 {}/{}대 사용 중".format(closed, len(states))
+    if _CircuitBreaker.HALF_OPEN in states:
+        return "AI Agent: 서버 복구 확인 중"
+    text = "AI Agent: 서버 연결 안 됨"
+    queued = len(_deferred_commands) if _deferred_commands is not None else 0
+    if queued:
+        text += " · 대기 {}건".format(queued)
+    return text
+
+
+def _update_server_status(view=None):
+    text = _server_status_text()
+    if view is not None:
+        views = [view]
+    else:
+        views = [v for window in sublime.windows() for v in window.views()]
+    for target in views:
+        if text:
+            target.set_status(SERVER_STATUS_KEY, text)
+        else:
+            target.erase_status(SERVER_STATUS_KEY)
+
+
+def _on_circuit_change(backend, state):
+    _update_server_status()
+    if state == _CircuitBreaker.OPEN:
+        if _get_backends().available():
+            sublime.status_message("에이전트 서버 {}에 연결할 수 없어 잠시 제외합니다.".format(backend.name))
+        else:
+            sublime.status_message("에이전트 서버에 연결할 수 없습니다. 복구될 때까지 요청을 바로 실패 처리합니다.")
+    elif state == _CircuitBreaker.CLOSED:
+        replays = _get_deferred_commands().take()
+        for replay in replays:
+            replay()
+        if replays:
+            sublime.status_message(
+                "에이전트 서버가 복구되어 대기 중이던 요청 {}건을 보냅니다.".format(len(replays))
+            )
+        else:
+            sublime.status_message("에이전트 서버 연결이 복구되었습니다.")
+
+
+def _server_model(backend=None):
+    return (_server_health(backend=backend) or {}).get("model", "")
+
+
+def _content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _line_delta(base_lines, new_lines):
+    matcher = difflib.SequenceMatcher(None, base_lines, new_lines)
+    ops = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag != "equal":
+            ops.append([i1, i2, new_lines[j1:j2]])
+    return ops
+
+
+class _ContextUploader(object):
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._supported = None
+        self._stats = {"full": 0, "hashOnly": 0, "delta": 0, "fallbacks": 0, "savedChars": 0}
+
+    def supported(self, backend=None):
+        capabilities = (_server_health(backend=backend) or {}).get("capabilities") or {}
+        self._supported = bool(capabilities.get("contextCache"))
+        return self._supported
+
+    def encode(self, key, context):
+        text = context.get("selection") or ""
+        digest = _content_hash(text)
+        compact = dict(context)
+        compact["selectionHash"] = digest
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            self._count("full")
+            return compact, (digest, text)
+        base_hash, base_text = entry
+        if base_hash == digest:
+            compact.pop("selection", None)
+            self._count("hashOnly")
+            self._count("savedChars", len(text))
+            return compact, (digest, text)
+        ops = _line_delta(base_text.split("\n"), text.split("\n"))
+        delta = {"baseHash": base_hash, "ops": ops}
+        delta_size = len(json.dumps(delta))
+        if delta_size * 2 >= len(text):
+            self._count("full")
+            return compact, (digest, text)
+        compact.pop("selection", None)
+        compact["selectionDelta"] = delta
+        self._count("delta")
+        self._count("savedChars", len(text) - delta_size)
+        return compact, (digest, text)
+
+    def commit(self, key, uploaded):
+        with self._lock:
+            self._entries[key] = uploaded
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def forget(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+        self._count("fallbacks")
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["cachedFiles"] = len(self._entries)
+        stats["serverSupport"] = self._supported
+        return stats
+
+
+_context_uploader = _ContextUploader()
+
+
+class _SessionContexts(object):
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._supported = None
+        self._stats = {"full": 0, "inherited": 0, "fallbacks": 0, "savedChars": 0}
+
+    def supported(self, backend=None):
+        capabilities = (_server_health(backend=backend) or {}).get("capabilities") or {}
+        self._supported = bool(capabilities.get("sessionContext"))
+        return self._supported
+
+    def encode(self, session_id, context):
+        # 서버 세션에 저장된 지난 턴의 컨텍스트와 비교해 바뀐 항목만 보낸다. 없어진 항목은 null로 지운다.
+        with self._lock:
+            base = self._entries.get(session_id)
+        if base is None:
+            self._count("full")
+            return context, False
+        changed = {key: value for key, value in context.items() if base.get(key) != value}
+        changed.update((key, None) for key in base if key not in context)
+        changed["inherit"] = True
+        self._count("inherited")
+        if "selection" not in changed:
+            self._count("savedChars", len(context.get("selection") or ""))
+        return changed, True
+
+    def commit(self, session_id, context):
+        with self._lock:
+            self._entries[session_id] = context
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def forget(self, session_id):
+        with self._lock:
+            self._entries.pop(session_id, None)
+        self._count("fallbacks")
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["sessions"] = len(self._entries)
+        stats["serverSupport"] = self._supported
+        return stats
+
+
+_session_contexts = _SessionContexts()
+
+
+class _RequestMetrics(object):
+    def __init__(self, kind):
+        self.kind = kind
+        self.started = time.monotonic()
+        self.marks = {}
+        self.deltas = 0
+        self.chars = 0
+        self.reads = 0
+        self.malformed = 0
+        self.attempts = 0
+        self.connect_ms = None
+        self.reused = None
+        self.ui_lags = []
+        self.record = None
+        self._lock = threading.Lock()
+
+    def _elapsed_ms(self):
+        return (time.monotonic() - self.started) * 1000
+
+    def mark(self, name):
+        if name not in self.marks:
+            self.marks[name] = self._elapsed_ms()
+
+    def connected(self, conn):
+        self.attempts += 1
+        if self.connect_ms is None:
+            self.connect_ms = getattr(conn, "ai_agent_connect_ms", 0.0)
+            self.reused = getattr(conn, "ai_agent_reused", False)
+        self.mark("headers")
+
+    def decoded(self, decoder):
+        self.reads += decoder.reads
+        self.malformed += decoder.malformed
+
+    def delta(self, content):
+        if not self.deltas:
+            self.mark("firstDelta")
+        self.deltas += 1
+        self.chars += len(content)
+
+    def dispatch(self, fn, delay=0):
+        scheduled = time.monotonic()
+
+        def run():
+            lag = (time.monotonic() - scheduled) * 1000 - delay
+            with self._lock:
+                self.ui_lags.append(max(0.0, lag))
+            fn()
+        sublime.set_timeout(run, delay)
+
+    def finish(self, status):
+        # 요청 하나는 한 번만 기록한다. 두 번째 호출은 처음 기록을 그대로 돌려준다.
+        with self._lock:
+            if self.record is not None:
+                return self.record
+            lags = list(self.ui_lags)
+        total = self._elapsed_ms()
+        first = self.marks.get("firstDelta")
+        window = (total - first) / 1000.0 if first is not None else 0.0
+        record = {
+            "at": _utc_now(),
+            "kind": self.kind,
+            "status": status,
+            "attempts": self.attempts,
+            "reused": self.reused,
+            "connectMs": self.connect_ms,
+            "headersMs": self.marks.get("headers"),
+            "startMs": self.marks.get("start"),
+            "firstDeltaMs": first,
+            "firstPreviewMs": self.marks.get("firstPreview"),
+            "totalMs": total,
+            "deltas": self.deltas,
+            "chars": self.chars,
+            "reads": self.reads,
+            "malformed": self.malformed,
+            "deltasPerSec": self.deltas / window if window > 0 else None,
+            "charsPerSec": self.chars / window if window > 0 else None,
+            "uiLagMs": sum(lags) / len(lags) if lags else None,
+            "uiLagMaxMs": max(lags) if lags else None
+        }
+        for key, value in record.items():
+            if isinstance(value, float):
+                record[key] = round(value, 2)
+        with self._lock:
+            if self.record is not None:
+                return self.record
+            self.record = record
+        _get_metrics_recorder().add(record)
+        return record
+
+
+METRIC_KEYS = (
+    "connectMs", "headersMs", "startMs", "firstDeltaMs", "firstPreviewMs", "totalMs",
+    "deltasPerSec", "charsPerSec", "uiLagMs", "uiLagMaxMs"
+)
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    rank = max(0, int(math.ceil(fraction * len(ordered))) - 1)
+    return ordered[rank]
+
+
+class _MetricsRecorder(object):
+    def __init__(self, capacity=500, log_path=None):
+        self.log_path = log_path
+        self._records = collections.deque(maxlen=capacity)
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        with self._lock:
+            self._records.append(record)
+        if not self.log_path:
+            return
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        try:
+            os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+            with self._lock, open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(line)
+        except OSError:
+            pass
+
+    def records(self, kind=None):
+        with self._lock:
+            return [r for r in self._records if kind is None or r["kind"] == kind]
+
+    def summary(self, kind=None):
+        records = self.records(kind)
+        summary = {}
+        for key in METRIC_KEYS:
+            values = [r[key] for r in records if r.get(key) is not None]
+            if not values:
+                continue
+            summary[key] = {
+                "p50": _percentile(values, 0.5),
+                "p90": _percentile(values, 0.9),
+                "p99": _percentile(values, 0.99),
+                "max": max(values)
+            }
+        return records, summary
+
+
+_metrics_recorder = None
+_metrics_recorder_lock = threading.Lock()
+
+
+def _get_metrics_recorder():
+    global _metrics_recorder
+    with _metrics_recorder_lock:
+        if _metrics_recorder is None:
+            log_path = None
+            if _setting("metrics_log", False):
+                log_path = os.path.join(sublime.cache_path(), "AiAgent", "metrics.jsonl")
+            _metrics_recorder = _MetricsRecorder(
+                capacity=int(_setting("metrics_capacity", 500)), log_path=log_path
+            )
+        return _metrics_recorder
+
+
+class _NdjsonDecoder(object):
+    def __init__(self):
+        self._tail = b""
+        self.reads = 0
+        self.bytes = 0
+        self.records = 0
+        self.malformed = 0
+        self.max_batch = 0
+        self.last_error = None
+
+    def feed(self, data):
+        self.reads += 1
+        self.bytes += len(data)
+        lines = (self._tail + data).split(b"\n")
+        self._tail = lines.pop()
+        return self._parse(lines)
+
+    def finish(self):
+        tail, self._tail = self._tail, b""
+        return self._parse([tail])
+
+    def _parse(self, lines):
+        lines = [line for line in lines if line.strip()]
+        if not lines:
+            return []
+        try:
+            records = json.loads(b"[" + b",".join(lines) + b"]")
+            if len(records) != len(lines):
+                raise ValueError("레코드 경계가 줄과 맞지 않습니다.")
+        except ValueError:
+            records = []
+            for line in lines:
+                try:
+                    records.append(json.loads(line))
+                except ValueError as e:
+                    self._malformed(line, e)
+        valid = [record for record in records if isinstance(record, dict)]
+        for record in records:
+            if not isinstance(record, dict):
+                self._malformed(json.dumps(record).encode("utf-8"), "객체가 아닌 레코드")
+        self.records += len(valid)
+        self.max_batch = max(self.max_batch, len(valid))
+        return valid
+
+    def _malformed(self, line, error):
+        self.malformed += 1
+        self.last_error = "{} ({!r})".format(error, line[:80])
+
+    def stats(self):
+        return {
+            "reads": self.reads,
+            "bytes": self.bytes,
+            "records": self.records,
+            "malformed": self.malformed,
+            "maxBatch": self.max_batch
+        }
+
+
+class _ChunkedBody(object):
+    def __init__(self, resp):
+        self._resp = resp
+        self._raw = b""
+        self._left = 0
+        self._done = False
+
+    def read1(self, size):
+        out = []
+        while not out and not self._done:
+            data = self._resp.fp.read1(size)
+            if not data:
+                raise http.client.IncompleteRead(b"")
+            self._raw += data
+            self._parse(out)
+            if self._done:
+                # 마지막 청크까지 읽었으니 응답을 닫아 연결을 풀에 돌려줄 수 있게 한다.
+                self._resp.close()
+        return b"".join(out)
+
+    def _parse(self, out):
+        raw = self._raw
+        pos = 0
+        while pos < len(raw):
+            if self._left > 0:
+                piece = raw[pos:pos + self._left]
+                out.append(piece)
+                pos += len(piece)
+                self._left -= len(piece)
+                if self._left:
+                    break
+                self._left = -2
+            if self._left < 0:
+                if len(raw) - pos < 2:
+                    break
+                pos += 2
+                self._left = 0
+            end = raw.find(b"\r\n", pos)
+            if end < 0:
+                break
+            size = int(raw[pos:end].split(b";", 1)[0], 16)
+            if size == 0:
+                trailer = raw.find(b"\r\n\r\n", end)
+                if raw[end:end + 4] != b"\r\n\r\n" and trailer < 0:
+                    break
+                self._done = True
+                pos = len(raw)
+                break
+            pos = end + 2
+            self._left = size
+        self._raw = raw[pos:]
+
+
+_ndjson_totals = collections.Counter()
+_ndjson_lock = threading.Lock()
+_ndjson_last_error = [None]
+
+
+def _read_ndjson(resp, decoder, chunk_size=None):
+    size = chunk_size or int(_setting("stream_read_size", 65536))
+    reader = _ChunkedBody(resp) if resp.chunked else resp
+    try:
+        while True:
+            data = reader.read1(size)
+            if not data:
+                break
+            records = decoder.feed(data)
+            if records:
+                yield records
+        records = decoder.finish()
+        if records:
+            yield records
+    finally:
+        with _ndjson_lock:
+            stats = decoder.stats()
+            max_batch = max(_ndjson_totals["maxBatch"], stats.pop("maxBatch"))
+            _ndjson_totals.update(stats)
+            _ndjson_totals["streams"] += 1
+            _ndjson_totals["maxBatch"] = max_batch
+            if decoder.last_error:
+                _ndjson_last_error[0] = decoder.last_error
+
+
+def _ndjson_stats():
+    with _ndjson_lock:
+        stats = dict(_ndjson_totals)
+        if _ndjson_last_error[0]:
+            stats["lastError"] = _ndjson_last_error[0]
+    return stats
+
+
+class _HttpStream(object):
+    def __init__(self, pool, path, payload, timeout):
+        body = json.dumps(payload)
+        headers = {"Content-Type": "application/json"}
+        self._stream = pool.stream("POST", path, body=body, headers=headers, timeout=timeout)
+        self.response = None
+        self.status = None
+        self.content_type = ""
+
+    @property
+    def connection(self):
+        return self._stream.connection
+
+    def __enter__(self):
+        self.response = self._stream.__enter__()
+        self.status = self.response.status
+        self.content_type = self.response.getheader("Content-Type") or ""
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._stream.__exit__(exc_type, exc, tb)
+
+    def read(self):
+        return self.response.read().decode("utf-8", "replace")
+
+    def batches(self, decoder):
+        return _read_ndjson(self.response, decoder)
+
+
+MUX_PROTOCOL = "ai-agent-mux"
+MUX_PATHS = frozenset((
+    "/rpc",
+    "/api/agent/terminal/request",
+    "/api/agent/terminal/request-batch",
+    "/api/agent/terminal/execute",
+    "/api/agent/terminal/execute-stream"
+))
+
+
+class _MuxStream(object):
+    def __init__(self, channel, stream_id, timeout, reused, connect_ms):
+        self.channel = channel
+        self.id = stream_id
+        self.timeout = timeout
+        self.status = None
+        self.content_type = ""
+        self.ai_agent_reused = reused
+        self.ai_agent_connect_ms = connect_ms
+        self.ai_agent_aborted = False
+        self._records = []
+        self._done = False
+        self._error = None
+        self._cond = threading.Condition()
+
+    @property
+    def connection(self):
+        return self
+
+    def __enter__(self):
+        self._wait(lambda: self.status is not None)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self._done:
+            self.cancel()
+        self.channel.forget(self.id)
+        return False
+
+    def deliver(self, frames):
+        with self._cond:
+            for frame in frames:
+                if "data" in frame:
+                    self._records.append(frame["data"])
+                elif "status" in frame:
+                    self.status = frame["status"]
+                    self.content_type = frame.get("type") or ""
+                elif frame.get("end"):
+                    self._done = True
+            self._cond.notify_all()
+
+    def fail(self, error):
+        with self._cond:
+            self._error = error
+            self._cond.notify_all()
+
+    def _wait(self, ready):
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while not ready():
+                if self._error is not None:
+                    raise self._error
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise socket.timeout("멀티플렉스 스트림 응답 대기 시간 초과")
+                self._cond.wait(remaining)
+
+    def batches(self, decoder=None):
+        while True:
+            self._wait(lambda: self._records or self._done)
+            with self._cond:
+                records, self._records = self._records, []
+                done = self._done
+            if records:
+                if decoder is not None:
+                    decoder.reads += 1
+                    decoder.records += len(records)
+                    decoder.max_batch = max(decoder.max_batch, len(records))
+                yield [record for record in records if isinstance(record, dict)]
+            if done:
+                return
+
+    def read(self):
+        records = []
+        for batch in self.batches():
+            records.extend(batch)
+        if "ndjson" not in self.content_type and len(records) == 1:
+            return json.dumps(records[0], ensure_ascii=False)
+        return "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+
+    def cancel(self):
+        with self._cond:
+            if self._done:
+                return
+            self._done = True
+            self.ai_agent_aborted = True
+            self._cond.notify_all()
+        self.channel.send({"stream": self.id, "cancel": True})
+
+
+class _MuxChannel(object):
+    def __init__(self, host, port, socket_path=None, retry_interval=60.0, connect_timeout=5.0):
+        self.host = host
+        self.port = port
+        self.socket_path = socket_path
+        self.retry_interval = retry_interval
+        self.connect_timeout = connect_timeout
+        self._sock = None
+        self._transport = None
+        self._streams = {}
+        self._next_id = 0
+        self._disabled_until = 0.0
+        self._last_error = None
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._stats = collections.Counter()
+
+    def _connect(self):
+        sock = None
+        transport = "tcp"
+        if self.socket_path:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.connect_timeout)
+            try:
+                sock.connect(self.socket_path)
+                transport = "unix"
+            except (FileNotFoundError, ConnectionRefusedError):
+                sock.close()
+                sock = None
+                self._stats["socketFallbacks"] += 1
+        if sock is None:
+            sock = socket.create_connection((self.host, self.port), timeout=self.connect_timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            sock.sendall((
+                "GET /mux HTTP/1.1\r\nHost: {}:{}\r\nConnection: Upgrade\r\n"
+                "Upgrade: {}\r\n\r\n"
+            ).format(self.host, self.port, MUX_PROTOCOL).encode("ascii"))
+            data = b""
+            while b"\r\n\r\n" not in data:
+                chunk = sock.recv(4096)
+                if not chunk or len(data) > 65536:
+                    raise ConnectionResetError("멀티플렉스 채널 핸드셰이크 중 연결이 끊겼습니다.")
+                data += chunk
+            head, _, leftover = data.partition(b"\r\n\r\n")
+            status_line = head.split(b"\r\n", 1)[0].decode("latin-1")
+            if status_line.split(" ")[1:2] != ["101"]:
+                raise ValueError("멀티플렉스 채널을 지원하지 않는 서버입니다: " + status_line)
+        except Exception:
+            sock.close()
+            raise
+        sock.settimeout(None)
+        return sock, leftover, transport
+
+    def open(self, path, payload, timeout):
+        with self._lock:
+            sock = self._sock
+            reused = sock is not None
+            connect_ms = 0.0
+            if sock is None:
+                if time.monotonic() < self._disabled_until:
+                    return None
+                started = time.monotonic()
+                try:
+                    sock, leftover, self._transport = self._connect()
+                except (OSError, ValueError) as e:
+                    # HTTP로 대체하고 retry_interval 동안은 다시 시도하지 않는다.
+                    self._disabled_until = time.monotonic() + self.retry_interval
+                    self._last_error = str(e)
+                    self._stats["fallbacks"] += 1
+                    return None
+                connect_ms = (time.monotonic() - started) * 1000
+                self._sock = sock
+                self._stats["connects"] += 1
+                threading.Thread(
+                    target=self._read_loop, args=(sock, leftover), name="ai-agent-mux", daemon=True
+                ).start()
+            self._next_id += 1
+            stream = _MuxStream(self, self._next_id, timeout, reused, connect_ms)
+            self._streams[stream.id] = stream
+            self._stats["streams"] += 1
+        try:
+            self._send(sock, {"stream": stream.id, "path": path, "body": payload})
+        except OSError as e:
+            self._close(sock, e)
+            self.forget(stream.id)
+            return None
+        return stream
+
+    def _send(self, sock, frame):
+        line = (json.dumps(frame, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._send_lock:
+            sock.sendall(line)
+
+    def send(self, frame):
+        sock = self._sock
+        if sock is None:
+            return
+        try:
+            self._send(sock, frame)
+        except OSError as e:
+            self._close(sock, e)
+
+    def forget(self, stream_id):
+        with self._lock:
+            self._streams.pop(stream_id, None)
+
+    def _read_loop(self, sock, leftover):
+        decoder = _NdjsonDecoder()
+        size = int(_setting("stream_read_size", 65536))
+        error = None
+        data = leftover
+        try:
+            while True:
+                if data:
+                    self._dispatch(decoder.feed(data))
+                data = sock.recv(size)
+                if not data:
+                    break
+        except OSError as e:
+            error = e
+        self._stats["frames"] += decoder.records
+        self._stats["malformed"] += decoder.malformed
+        self._close(sock, error or ConnectionResetError("멀티플렉스 채널이 닫혔습니다."))
+
+    def _dispatch(self, frames):
+        grouped = collections.OrderedDict()
+        for frame in frames:
+            grouped.setdefault(frame.get("stream"), []).append(frame)
+        with self._lock:
+            targets = [(self._streams.get(stream_id), items) for stream_id, items in grouped.items()]
+        for stream, items in targets:
+            if stream is not None:
+                stream.deliver(items)
+
+    def _close(self, sock, error):
+        with self._lock:
+            if self._sock is not sock:
+                return
+            self._sock = None
+            streams = list(self._streams.values())
+            self._streams.clear()
+            if error is not None:
+                self._last_error = str(error)
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        sock.close()
+        for stream in streams:
+            stream.fail(error)
+
+    def close(self):
+        sock = self._sock
+        if sock is not None:
+            self._close(sock, ConnectionAbortedError("멀티플렉스 채널을 닫았습니다."))
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["connected"] = self._sock is not None
+            stats["transport"] = self._transport if self._sock is not None else None
+            stats["openStreams"] = len(self._streams)
+            if self._last_error:
+                stats["lastError"] = self._last_error
+        return stats
+
+
+class _RoutedStream(object):
+    def __init__(self, backends, backend, stream):
+        self.backends = backends
+        self.backend = backend
+        self.stream = stream
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+    def __enter__(self):
+        started = time.monotonic()
+        try:
+            self.stream.__enter__()
+        except Exception:
+            self.backends.release(self.backend)
+            raise
+        self.backend.observe((time.monotonic() - started) * 1000)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            return self.stream.__exit__(exc_type, exc, tb)
+        finally:
+            self.backends.release(self.backend)
+
+
+def _open_stream(path, payload, timeout=60, backend=None):
+    backends = _get_backends()
+    backend = backends.acquire(_request_session_id(path, payload), backend)
+    stream = None
+    channel = backend.mux_channel()
+    if channel is not None and path in MUX_PATHS:
+        stream = channel.open(path, payload, timeout)
+    if stream is None:
+        stream = _HttpStream(backend.pool, path, payload, timeout)
+    return _RoutedStream(backends, backend, stream)
+
+
+def _stream_rpc_once(
+    payload, on_start, on_delta, on_final, handle=None, metrics=None, backend=None
+):
+    with _open_stream("/rpc", payload, timeout=60, backend=backend) as stream:
+        if handle is not None:
+            handle.attach(stream.connection)
+        if metrics is not None:
+            metrics.connected(stream.connection)
+        if stream.status != 200:
+            return stream.status, stream.read()
+
+        decoder = _NdjsonDecoder()
+        for records in stream.batches(decoder):
+            # 한 번 읽은 묶음 안에서 연속된 delta는 합쳐서 한 번에 넘긴다.
+            pending = []
+            for data in records:
+                result = data.get("result") or {}
+                chunk_type = result.get("type")
+                if chunk_type == "delta":
+                    content = result.get("content", "")
+                    if metrics is not None:
+                        metrics.delta(content)
+                    pending.append(content)
+                    continue
+                if pending:
+                    on_delta("".join(pending))
+                    pending = []
+                if chunk_type == "start":
+                    if metrics is not None:
+                        metrics.mark("start")
+                    _get_backends().bind(result.get("sessionId"), stream.backend)
+                    on_start(result.get("sessionId"))
+                elif chunk_type == "tool":
+                    name = result.get("name", "tool")
+                    args = result.get("arguments", "")
+                    on_delta("\n[툴 호출] {} {}\n".format(name, args))
+                elif chunk_type == "final":
+                    on_final(result.get("result"))
+            if pending:
+                on_delta("".join(pending))
+        if metrics is not None:
+            metrics.decoded(decoder)
+    return 200, None
+
+
+def _is_context_missing(error_body):
+    try:
+        error = json.loads(error_body).get("error") or {}
+    except Exception:
+        return False
+    return error.get("code") == CONTEXT_MISSING_CODE
+
+
+def _with_context(payload, context):
+    params = dict(payload["params"])
+    params["context"] = context
+    compact = dict(payload)
+    compact["params"] = params
+    return compact
+
+
+def _guarded(handle, callback):
+    def wrapper(*args):
+        if not handle.cancelled:
+            callback(*args)
+    return wrapper
+
+
+def _send_streaming_rpc(
+    payload, on_start, on_delta, on_final, on_error, context_key=None, handle=None, metrics=None,
+    backend=None
+):
+    status = None
+    try:
+        status = _send_streaming_rpc_inner(
+            payload, on_start, on_delta, on_final, on_error, context_key, handle, metrics, backend
+        )
+    finally:
+        if metrics is not None:
+            if handle is not None and handle.cancelled:
+                status = "cancelled"
+            metrics.finish(status or "error")
+
+
+FAILOVER_ERRORS = (ConnectionRefusedError, _CircuitOpenError)
+
+
+def _stream_rpc_to(backend, payload, on_start, on_delta, on_final, context_key, handle, metrics):
+    params = payload.get("params") or {}
+    context = params.get("context")
+    session_id = params.get("sessionId")
+    uploaded = None
+    inherited = False
+    request = payload
+    sent = context
+    if context and _session_contexts.supported(backend):
+        if session_id:
+            sent, inherited = _session_contexts.encode(session_id, context)
+        on_start = _committing_start(context, on_start)
+    # 업로드한 컨텍스트는 받은 백엔드에만 있으므로 백엔드별로 기억하고, 재시도도 같은 백엔드로 보낸다.
+    if context_key:
+        context_key = "{}|{}".format(backend.name, context_key)
+    if context_key and sent and "selection" in sent and _context_uploader.supported(backend):
+        sent, uploaded = _context_uploader.encode(context_key, sent)
+    if sent is not context:
+        request = _with_context(payload, sent)
+
+    status, error_body = _stream_rpc_once(
+        request, on_start, on_delta, on_final, handle, metrics, backend
+    )
+    if status == 409 and (uploaded or inherited) and _is_context_missing(error_body):
+        # 서버가 컨텍스트나 세션을 잃었으면 전체 컨텍스트로 한 번 더 보낸다.
+        if inherited:
+            _session_contexts.forget(session_id)
+        if uploaded:
+            _context_uploader.forget(context_key)
+            context = dict(context, selectionHash=_content_hash(context.get("selection") or ""))
+            uploaded = (context["selectionHash"], context.get("selection") or "")
+        request = _with_context(payload, context)
+        status, error_body = _stream_rpc_once(
+            request, on_start, on_delta, on_final, handle, metrics, backend
+        )
+    if status == 200 and uploaded:
+        _context_uploader.commit(context_key, uploaded)
+    return status
+
+
+def _committing_start(context, on_start):
+    # start 청크가 오면 서버가 이 컨텍스트를 세션에 저장한 것이므로 다음 턴의 기준으로 삼는다.
+    def start(session_id):
+        if session_id:
+            _session_contexts.commit(session_id, context)
+        on_start(session_id)
+    return start
+
+
+def _send_streaming_rpc_inner(
+    payload, on_start, on_delta, on_final, on_error, context_key, handle, metrics, preferred=None
+):
+    if handle is not None:
+        on_start = _guarded(handle, on_start)
+        on_delta = _guarded(handle, on_delta)
+        on_final = _guarded(handle, on_final)
+    try:
+        backends = _get_backends()
+        session_id = _request_session_id("/rpc", payload)
+        tried = []
+        while True:
+            if preferred is not None and not tried and preferred.breaker.allows():
+                backend = preferred
+            else:
+                backend = backends.pick(session_id, exclude=tried)
+            try:
+                status = _stream_rpc_to(
+                    backend, payload, on_start, on_delta, on_final, context_key, handle, metrics
+                )
+                break
+            except FAILOVER_ERRORS:
+                # 연결 단계에서 실패해 요청이 전달되지 않았으므로 다른 백엔드로 보낸다.
+                tried.append(backend)
+                if not [b for b in backends.available() if b not in tried]:
+                    raise
+        if handle is not None and handle.cancelled:
+            return None
+        if status != 200:
+            on_error("서버 응답 오류: {}".format(status))
+            return "http{}".format(status)
+        return "ok"
+    except Exception as e:
+        if handle is not None and handle.cancelled:
+            return None
+        on_error(str(e))
+        return "error"
+
+
+class _RequestHandle(object):
+    def __init__(self, view_id, window_id, kind="stream"):
+        self.view_id = view_id
+        self.window_id = window_id
+        # "stream"(채팅/편집/리뷰)만 같은 뷰의 새 요청에 밀려나고 창별 동시 요청 수에 포함된다.
+        self.kind = kind
+        self.cancelled = False
+        self.started_at = time.monotonic()
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def attach(self, conn):
+        with self._lock:
+            self._conn = conn
+            cancelled = self.cancelled
+        if cancelled:
+            self._abort(conn)
+
+    def cancel(self):
+        with self._lock:
+            if self.cancelled:
+                return False
+            self.cancelled = True
+            conn = self._conn
+        if conn is not None:
+            self._abort(conn)
+        return True
+
+    def _abort(self, conn):
+        if isinstance(conn, _MuxStream):
+            # 채널은 다른 스트림과 공유하므로 소켓을 닫지 않고 이 스트림만 취소한다.
+            conn.cancel()
+            return
+        conn.ai_agent_aborted = True
+        sock = conn.sock
+        if sock is None:
+            return
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class _RequestManager(object):
+    def __init__(self, max_workers=8, max_per_window=3):
+        self.max_per_window = max_per_window
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        self._handles = []
+        self._lock = threading.Lock()
+
+    def open(self, view, window):
+        window_id = window.id() if window else None
+        superseded = []
+        with self._lock:
+            for handle in self._handles:
+                if handle.view_id == view.id() and handle.kind == "stream":
+                    superseded.append(handle)
+            self._handles = [h for h in self._handles if h not in superseded]
+            in_window = [
+                h for h in self._handles if h.window_id == window_id and h.kind == "stream"
+            ]
+            if window_id is not None and len(in_window) >= self.max_per_window:
+                self._handles.extend(superseded)
+                return None
+            handle = _RequestHandle(view.id(), window_id)
+            self._handles.append(handle)
+        for old in superseded:
+            old.cancel()
+        return handle
+
+    def track(self, view_id, window_id, kind="background"):
+        # 터미널 실행이나 프로젝트 리뷰처럼 뷰의 대화와 따로 도는 작업은 밀려나지 않고
+        # 창별 제한에도 세지 않는다. 동시 실행 수는 각 작업이 따로 제한한다.
+        handle = _RequestHandle(view_id, window_id, kind)
+        with self._lock:
+            self._handles.append(handle)
+        return handle
+
+    def run(self, owner, fn, *args, **kwargs):
+        def task():
+            try:
+                fn(*args, **kwargs)
+            finally:
+                self._close(owner)
+        return self._executor.submit(task)
+
+    def submit(self, fn, *args, **kwargs):
+        return self._executor.submit(fn, *args, **kwargs)
+
+    def close(self, handle):
+        self._close(handle)
+
+    def _close(self, handle):
+        with self._lock:
+            if handle in self._handles:
+                self._handles.remove(handle)
+
+    def cancel(self, view_id=None, window_id=None):
+        with self._lock:
+            targets = [
+                h for h in self._handles
+                if (view_id is None or h.view_id == view_id)
+                and (window_id is None or h.window_id == window_id)
+            ]
+            self._handles = [h for h in self._handles if h not in targets]
+        return sum(1 for handle in targets if handle.cancel())
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._handles)
+
+    def shutdown(self):
+        self.cancel()
+        self._executor.shutdown(wait=False)
+
+
+_request_manager = None
+_request_manager_lock = threading.Lock()
+
+
+def _get_request_manager():
+    global _request_manager
+    with _request_manager_lock:
+        if _request_manager is None:
+            _request_manager = _RequestManager(
+                max_workers=int(_setting("max_workers", 8)),
+                max_per_window=int(_setting("max_requests_per_window", 3))
+            )
+        return _request_manager
+
+
+def _run_in_background(fn, *args, **kwargs):
+    return _get_request_manager().submit(fn, *args, **kwargs)
+
+
+class _ResultCache(object):
+    def __init__(self, directory, max_entries=200, ttl=86400.0, max_bytes=0):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "diskHits": 0, "misses": 0, "stored": 0, "expired": 0, "refreshes": 0}
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def _expired(self, entry):
+        return self.ttl > 0 and time.time() - entry["createdAt"] > self.ttl
+
+    def _load(self, key):
+        if not self.max_bytes:
+            return None
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            os.utime(self._path(key), None)
+        except (OSError, ValueError):
+            return None
+        self._stats["diskHits"] += 1
+        return entry
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key) or self._load(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            if self._expired(entry):
+                self._stats["expired"] += 1
+                self._discard(key)
+                return None
+            self._remember(key, entry)
+            self._stats["hits"] += 1
+            return entry
+
+    def put(self, key, session_id, content, result):
+        entry = {
+            "createdAt": time.time(),
+            "sessionId": session_id,
+            "content": content,
+            "result": result
+        }
+        with self._lock:
+            self._remember(key, entry)
+            self._stats["stored"] += 1
+            if not self.max_bytes:
+                return
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                with open(self._path(key), "w", encoding="utf-8") as f:
+                    f.write(json.dumps(entry))
+            except OSError:
+                return
+            self._evict_disk()
+
+    def record(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _discard(self, key):
+        self._entries.pop(key, None)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _disk_entries(self):
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, path, stat.st_size))
+        return sorted(entries)
+
+    def _evict_disk(self):
+        entries = self._disk_entries()
+        total = sum(size for _, _, size in entries)
+        for _, path, size in entries[:-1]:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            for _, path, _ in self._disk_entries():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            if self.max_bytes:
+                stats["diskBytes"] = sum(size for _, _, size in self._disk_entries())
+        return stats
+
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def _get_result_cache():
+    global _result_cache
+    with _result_cache_lock:
+        if _result_cache is None:
+            _result_cache = _ResultCache(
+                os.path.join(sublime.cache_path(), "AiAgent", "results"),
+                max_entries=int(_setting("result_cache_max_entries", 200)),
+                ttl=float(_setting("result_cache_ttl", 86400)),
+                max_bytes=int(_setting("result_cache_max_bytes", 10 * 1024 * 1024))
+            )
+        return _result_cache
+
+
+def _result_cache_key(payload, backend=None):
+    params = payload.get("params") or {}
+    context = params.get("context") or {}
+    context_hash = _content_hash(json.dumps(context, sort_keys=True))
+    material = json.dumps(
+        [params.get("prompt", ""), context_hash, context.get("file") or "", _server_model(backend)]
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def _format_age(seconds):
+    if seconds < 60:
+        return "{}초".format(int(seconds))
+    if seconds < 3600:
+        return "{}분".format(int(seconds // 60))
+    if seconds < 86400:
+        return "{}시간".format(int(seconds // 3600))
+    return "{}일".format(int(seconds // 86400))
+
+
+def _replay_cached_result(entry, on_start, on_delta, on_final, metrics=None, handle=None):
+    if metrics is not None:
+        metrics.mark("start")
+    # 저장된 응답의 세션은 이미 지난 세션이므로 뷰의 세션을 그쪽으로 바꾸지 않는다.
+    on_start(None)
+    on_delta("[캐시됨] {} 전 응답입니다. 새로 받으려면 Refresh 명령을 사용하세요.\n".format(
+        _format_age(time.time() - entry["createdAt"])
+    ))
+    content = entry.get("content", "")
+    if content:
+        if metrics is not None:
+            metrics.delta(content)
+        on_delta(content)
+    on_final(dict(entry["result"], cached=True))
+    if metrics is not None:
+        metrics.finish("cancelled" if handle is not None and handle.cancelled else "cached")
+
+
+def _recording_callbacks(cache, key, on_start, on_delta, on_final):
+    recorded = {"sessionId": None, "deltas": []}
+
+    def start(session_id):
+        recorded["sessionId"] = session_id
+        on_start(session_id)
+
+    def delta(content):
+        recorded["deltas"].append(content)
+        on_delta(content)
+
+    def final(result):
+        if result:
+            cache.put(key, recorded["sessionId"], "".join(recorded["deltas"]), result)
+        on_final(result)
+
+    return start, delta, final
+
+
+def _start_cached_stream(
+    view, window, payload, on_start, on_delta, on_final, on_error, context_key, metrics, refresh
+):
+    cache = _get_result_cache()
+    # 캐시 키의 모델은 요청을 실제로 보낼 백엔드의 것이어야 하므로 백엔드를 먼저 정해 그대로 보낸다.
+    backend = _get_backends().pick(_request_session_id("/rpc", payload))
+    key = _result_cache_key(payload, backend)
+    entry = None if refresh else cache.get(key)
+    if entry is not None:
+        # 다시 보여주기도 요청처럼 등록해 Cancel과 같은 뷰의 새 요청으로 중단되게 한다.
+        # 서버 연결을 쓰지 않으므로 창별 동시 요청 수 제한에 걸리면 제한 없이 등록한다.
+        manager = _get_request_manager()
+        handle = manager.open(view, window) if view is not None else None
+        if handle is None:
+            handle = manager.track(
+                view.id() if view else None, window.id() if window else None, "stream"
+            )
+        try:
+            _replay_cached_result(
+                entry, _guarded(handle, on_start), _guarded(handle, on_delta),
+                _guarded(handle, on_final), metrics, handle
+            )
+        finally:
+            manager.close(handle)
+        return
+    if refresh:
+        cache.record("refreshes")
+    on_start, on_delta, on_final = _recording_callbacks(cache, key, on_start, on_delta, on_final)
+    _start_agent_stream(
+        view, window, payload, on_start, on_delta, on_final, on_error,
+        context_key=context_key, metrics=metrics, backend=backend
+    )
+
+
+def _start_agent_stream(
+    view, window, payload, on_start, on_delta, on_final, on_error, context_key=None,
+    metrics=None, cache=False, refresh=False, backend=None
+):
+    if cache:
+        _run_in_background(
+            _start_cached_stream, view, window, payload, on_start, on_delta, on_final,
+            on_error, context_key, metrics, refresh
+        )
+        return None
+    if not _get_backends().available():
+        _defer_agent_stream(
+            view, window, payload, on_start, on_delta, on_final, on_error, context_key, metrics
+        )
+        return None
+    manager = _get_request_manager()
+    handle = manager.open(view, window)
+    if handle is None:
+        if metrics is not None:
+            metrics.finish("rejected")
+        on_error("진행 중인 요청이 너무 많습니다. 잠시 후 다시 시도하세요.")
+        return None
+    manager.run(
+        handle,
+        _send_streaming_rpc,
+        payload,
+        on_start,
+        on_delta,
+        on_final,
+        on_error,
+        context_key=context_key,
+        handle=handle,
+        metrics=metrics,
+        backend=backend
+    )
+    return handle
+
+
+def _defer_agent_stream(
+    view, window, payload, on_start, on_delta, on_final, on_error, context_key, metrics
+):
+    kind = metrics.kind if metrics is not None else "chat"
+    if metrics is not None:
+        metrics.finish("deferred")
+
+    def replay():
+        if view is not None and not view.is_valid():
+            return
+        _start_agent_stream(
+            view, window, payload, on_start, on_delta, on_final, on_error,
+            context_key=context_key, metrics=_RequestMetrics(kind)
+        )
+
+    deferred = _get_deferred_commands()
+    if not deferred.add(replay):
+        on_error("에이전트 서버에 연결할 수 없고 대기열({}건)이 가득 찼습니다.".format(deferred.max_size))
+        return
+    notice = (
+        "\n[대기] 에이전트 서버에 연결할 수 없어 요청을 대기열에 넣었습니다 ({}/{}). "
+        "서버가 복구되면 자동으로 보냅니다.\n"
+    ).format(len(deferred), deferred.max_size)
+    if window is not None:
+        _show_output_panel(window, notice)
+    sublime.set_timeout(_update_server_status, 0)
+
+
+CONTEXT_GAP_MARKER = "\n[... 생략 ...]\n"
+
+
+def _indent_width(text):
+    return len(text) - len(text.lstrip())
+
+
+def _scope_region(view, point, limit):
+    first = view.line(point)
+    base = _indent_width(view.substr(first))
+    end = first.end()
+    size = view.size()
+    while end < size and end - first.begin() < limit:
+        line = view.line(end + 1)
+        text = view.substr(line)
+        stripped = text.strip()
+        if stripped and _indent_width(text) <= base:
+            if stripped[0] in ")]}":
+                end = line.end()
+            break
+        end = line.end()
+    return sublime.Region(first.begin(), min(end, first.begin() + limit))
+
+
+def _clip_around(view, region, limit):
+    if region.size() <= limit:
+        return region
+    center = (region.begin() + region.end()) // 2
+    start = max(region.begin(), center - limit // 2)
+    start = view.line(start).begin()
+    end = min(region.end(), start + limit)
+    return sublime.Region(start, end)
+
+
+def _merge_segments(segments):
+    merged = []
+    for region in sorted(segments, key=lambda r: r.begin()):
+        if merged and region.begin() <= merged[-1].end() + 1:
+            last = merged[-1]
+            merged[-1] = sublime.Region(last.begin(), max(last.end(), region.end()))
+        else:
+            merged.append(region)
+    return merged
+
+
+def _build_context(view, budget=None):
+    if budget is None:
+        budget = int(_setting("context_budget_chars", 24000))
+    size = view.size()
+    file_path = view.file_name()
+    if size <= budget:
+        return {
+            "file": file_path,
+            "selection": view.substr(sublime.Region(0, size)),
+            "range": [0, size]
+        }
+
+    anchor = view.sel()[0] if view.sel() else sublime.Region(0, 0)
+    symbols = sorted(
+        (region for region, _ in view.symbols()),
+        key=lambda region: region.begin()
+    )
+    scopes = {}
+
+    def scope_of(region):
+        key = region.begin()
+        if key not in scopes:
+            scopes[key] = _scope_region(view, key, budget)
+        return scopes[key]
+
+    focus = None
+    for region in reversed([r for r in symbols if r.begin() <= anchor.begin()][-20:]):
+        scope = scope_of(region)
+        if scope.contains(anchor.begin()):
+            focus = scope.cover(anchor)
+            break
+    if focus is None:
+        focus = sublime.Region(
+            view.line(max(0, anchor.begin() - budget // 4)).begin(),
+            min(size, anchor.end() + budget // 4)
+        )
+    focus = _clip_around(view, focus, budget)
+    segments = [focus]
+    used = focus.size()
+
+    header_end = symbols[0].begin() if symbols else size
+    header_end = min(header_end, budget // 5, focus.begin())
+    if header_end > 0:
+        header = sublime.Region(0, view.line(header_end).begin())
+        if header.size() and used + header.size() <= budget:
+            segments.append(header)
+            used += header.size()
+
+    def distance(region):
+        if region.end() < focus.begin():
+            return focus.begin() - region.end()
+        return region.begin() - focus.end()
+
+    neighbours = [r for r in symbols if not focus.contains(r.begin())]
+    for region in sorted(neighbours, key=distance):
+        if used >= budget:
+            break
+        scope = scope_of(region)
+        if any(segment.contains(scope.begin()) for segment in segments):
+            continue
+        if used + scope.size() > budget:
+            continue
+        segments.append(scope)
+        used += scope.size()
+
+    merged = _merge_segments(segments)
+    return {
+        "file": file_path,
+        "selection": CONTEXT_GAP_MARKER.join(view.substr(region) for region in merged),
+        "range": [merged[0].begin(), merged[-1].end()],
+        "segments": [[region.begin(), region.end()] for region in merged]
+    }
+
+
+class _PanelRenderer(object):
+    def __init__(self, window, interval_ms=33):
+        self.window = window
+        self.interval_ms = interval_ms
+        self._panel = None
+        self._pending = []
+        self._scheduled = False
+        self._lock = threading.Lock()
+        self._scheduled_at = 0.0
+        self._stats = {
+            "deltas": 0, "flushes": 0, "chars": 0, "maxMerged": 0, "lastMerged": 0,
+            "lastLagMs": 0.0, "maxLagMs": 0.0
+        }
+
+    def append(self, content):
+        if not content:
+            return
+        with self._lock:
+            self._pending.append(content)
+            self._stats["deltas"] += 1
+            if self._scheduled:
+                return
+            self._scheduled = True
+            self._scheduled_at = time.monotonic()
+        sublime.set_timeout(self._flush, self.interval_ms)
+
+    def _ensure_panel(self):
+        if self._panel is None or not self._panel.is_valid():
+            self._panel = self.window.find_output_panel("ai_agent")
+        if self._panel is None:
+            self._panel = self.window.create_output_panel("ai_agent")
+        return self._panel
+
+    def _flush(self):
+        with self._lock:
+            pending = self._pending
+            self._pending = []
+            self._scheduled = False
+            lag = max(0.0, (time.monotonic() - self._scheduled_at) * 1000 - self.interval_ms)
+            self._stats["lastLagMs"] = round(lag, 2)
+            self._stats["maxLagMs"] = max(self._stats["maxLagMs"], round(lag, 2))
+        if not pending:
+            return
+        text = "".join(pending)
+        with self._lock:
+            self._stats["flushes"] += 1
+            self._stats["chars"] += len(text)
+            self._stats["lastMerged"] = len(pending)
+            self._stats["maxMerged"] = max(self._stats["maxMerged"], len(pending))
+        panel = self._ensure_panel()
+        panel.run_command("append", {"characters": text})
+        if self.window.active_panel() != "output.ai_agent":
+            self.window.run_command("show_panel", {"panel": "output.ai_agent"})
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        flushes = stats["flushes"]
+        stats["avgMerged"] = round(float(stats["deltas"]) / flushes, 2) if flushes else 0
+        return stats
+
+
+_renderers = {}
+_renderers_lock = threading.Lock()
+
+
+def _get_renderer(window):
+    with _renderers_lock:
+        renderer = _renderers.get(window.id())
+        if renderer is None:
+            interval = int(_setting("panel_render_interval_ms", 33))
+            renderer = _PanelRenderer(window, max(0, interval))
+            _renderers[window.id()] = renderer
+        return renderer
+
+
+def _show_output_panel(window, content):
+    # 어느 스레드에서 불러도 호출한 순서대로 패널에 붙는다. 스트림 조각과 순서가 섞이지 않도록
+    # set_timeout을 거치지 말고 바로 부른다.
+    if window is None:
+        return
+    _get_renderer(window).append(content)
+
+class _SessionWriter(object):
+    def __init__(self, path, interval_ms=500, max_bytes=65536, max_delay=30.0):
+        self.path = path
+        self.interval_ms = interval_ms
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self._pending = collections.OrderedDict()
+        self._bytes = 0
+        self._scheduled = False
+        self._flushing = False
+        self._failures = 0
+        self._batch_supported = True
+        self._lock = threading.Lock()
+        self._stats = {
+            "queued": 0, "sent": 0, "requests": 0, "retries": 0, "dropped": 0, "maxBatch": 0
+        }
+        self._load()
+
+    def _load(self):
+        # 대기 중인 기록은 한 줄에 메시지 하나씩 저널에 덧붙이고, 전송이 끝날 때만 남은 것으로 다시 쓴다.
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                lines = f.readlines()
+        except OSError:
+            lines = []
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # 기록 중에 종료되어 잘린 마지막 줄은 건너뛴다.
+                continue
+            session_id = entry.pop("sessionId", None)
+            if session_id and entry.get("content"):
+                self._pending.setdefault(session_id, []).append(entry)
+                self._bytes += len(entry["content"])
+        legacy_path = os.path.splitext(self.path)[0] + ".json"
+        try:
+            with open(legacy_path, "r", encoding="utf-8") as f:
+                legacy = json.load(f)
+        except (OSError, ValueError):
+            legacy = None
+        if legacy:
+            for session_id, messages in legacy.items():
+                self._pending.setdefault(session_id, []).extend(messages)
+                self._bytes += sum(len(message["content"]) for message in messages)
+            self._persist()
+        if legacy is not None:
+            try:
+                os.remove(legacy_path)
+            except OSError:
+                pass
+        if self._pending:
+            self._schedule(0)
+
+    def _journal_line(self, session_id, message):
+        return json.dumps(dict(message, sessionId=session_id), ensure_ascii=False) + "\n"
+
+    def _append_journal(self, session_id, message):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(self._journal_line(session_id, message))
+        except OSError:
+            pass
+
+    def _persist(self):
+        try:
+            if not self._pending:
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+                return
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                for session_id, messages in self._pending.items():
+                    f.write("".join(self._journal_line(session_id, message) for message in messages))
+            os.replace(temp_path, self.path)
+        except OSError:
+            pass
+
+    def add(self, session_id, role, content):
+        if not session_id or not content:
+            return
+        message = {
+            "id": uuid.uuid4().hex,
+            "role": role,
+            "content": content,
+            "createdAt": _utc_now()
+        }
+        with self._lock:
+            self._pending.setdefault(session_id, []).append(message)
+            self._bytes += len(content)
+            self._stats["queued"] += 1
+            self._append_journal(session_id, message)
+            urgent = self._bytes >= self.max_bytes and not self._failures
+        self._schedule(0 if urgent else self.interval_ms)
+
+    def _schedule(self, delay_ms):
+        with self._lock:
+            if self._scheduled:
+                return
+            self._scheduled = True
+        sublime.set_timeout(lambda: _run_in_background(self.flush), int(delay_ms))
+
+    def _take_batch(self):
+        session_id, messages = next(iter(self._pending.items()))
+        batch, size = [], 0
+        for message in messages:
+            if batch and size + len(message["content"]) > self.max_bytes:
+                break
+            batch.append(message)
+            size += len(message["content"])
+        return session_id, batch
+
+    def _send(self, session_id, batch):
+        backends = _get_backends()
+        owner = backends.pick(session_id)
+        status = self._send_to(session_id, batch, owner)
+        if status == 200:
+            backends.bind(session_id, owner)
+        if status != 404 or len(backends.backends) < 2:
+            return status
+        # 세션을 만든 서버를 모르면(예: 서버 목록을 바꾼 뒤) 버리기 전에 다른 서버에서 세션을 찾는다.
+        for backend in backends.available():
+            if backend is owner:
+                continue
+            status = self._send_to(session_id, batch, backend)
+            if status != 404:
+                if status == 200:
+                    backends.bind(session_id, backend)
+                return status
+        return 404
+
+    def _send_to(self, session_id, batch, backend):
+        if self._batch_supported:
+            status, body = _http_request(
+                "POST",
+                "/api/agent/sessions/{}/messages/batch".format(session_id),
+                {"messages": batch},
+                timeout=30,
+                backend=backend
+            )
+            self._stats["requests"] += 1
+            if status != 404 or body.lstrip().startswith("{"):
+                return status
+            self._batch_supported = False
+        status = 200
+        for message in batch:
+            status, _ = _http_request(
+                "POST",
+                "/api/agent/sessions/{}/messages".format(session_id),
+                {"role": message["role"], "content": message["content"]},
+                timeout=30,
+                backend=backend
+            )
+            self._stats["requests"] += 1
+            if status != 200:
+                break
+        return status
+
+    def _complete(self, session_id, batch):
+        with self._lock:
+            messages = self._pending.get(session_id, [])
+            del messages[:len(batch)]
+            if not messages:
+                self._pending.pop(session_id, None)
+            self._bytes -= sum(len(message["content"]) for message in batch)
+
+    def flush(self):
+        with self._lock:
+            self._scheduled = False
+            if self._flushing:
+                return
+            self._flushing = True
+        completed = False
+        try:
+            while True:
+                with self._lock:
+                    if not self._pending:
+                        self._failures = 0
+                        return
+                    session_id, batch = self._take_batch()
+                try:
+                    status = self._send(session_id, batch)
+                except Exception:
+                    status = None
+                if status == 200:
+                    self._complete(session_id, batch)
+                    completed = True
+                    self._failures = 0
+                    self._stats["sent"] += len(batch)
+                    self._stats["maxBatch"] = max(self._stats["maxBatch"], len(batch))
+                    for message in batch:
+                        _index_message(session_id, message["role"], message["content"])
+                elif status is not None and 400 <= status < 500:
+                    self._complete(session_id, batch)
+                    completed = True
+                    self._stats["dropped"] += len(batch)
+                else:
+                    self._failures += 1
+                    self._stats["retries"] += 1
+                    break
+        finally:
+            # 보낸 기록은 전송 한 번이 끝난 뒤에 저널에서 한꺼번에 지운다. 그 사이에 종료되어 다시 보내도 서버가 id로 중복을 걸러낸다.
+            with self._lock:
+                self._flushing = False
+                if completed:
+                    self._persist()
+        delay = min(self.max_delay, 0.5 * (2 ** min(self._failures, 10)))
+        self._schedule(delay * 1000)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pending"] = sum(len(messages) for messages in self._pending.values())
+            stats["pendingBytes"] = self._bytes
+            stats["failures"] = self._failures
+            stats["batchEndpoint"] = self._batch_supported
+        return stats
+
+
+_session_writer = None
+_session_writer_lock = threading.Lock()
+
+
+def _get_session_writer():
+    global _session_writer
+    with _session_writer_lock:
+        if _session_writer is None:
+            _session_writer = _SessionWriter(
+                os.path.join(sublime.cache_path(), "AiAgent", "pending-messages.jsonl"),
+                interval_ms=int(_setting("session_flush_interval_ms", 500)),
+                max_bytes=int(_setting("session_flush_max_bytes", 65536)),
+                max_delay=float(_setting("session_retry_max_delay", 30.0))
+            )
+        return _session_writer
+
+
+def _append_session_message(session_id, role, content):
+    _get_session_writer().add(session_id, role, content)
+
+
+def _request_terminal(command, backend=None):
+    try:
+        status, body = _http_request(
+            "POST", "/api/agent/terminal/request", {"command": command}, timeout=30,
+            backend=backend
+        )
+        if status != 200:
+            return None, "요청 실패: {}".format(status)
+        data = json.loads(body)
+        return data, None
+    except Exception as e:
+        return None, str(e)
+
+
+def _execute_terminal(request_id, approve, backend=None):
+    try:
+        status, body = _http_request(
+            "POST",
+            "/api/agent/terminal/execute",
+            {"requestId": request_id, "approve": approve},
+            timeout=60,
+            backend=backend
+        )
+        if status != 200:
+            return None, "실행 실패: {}".format(status)
+        data = json.loads(body)
+        return data, None
+    except Exception as e:
+        return None, str(e)
+
+
+def _execute_terminal_stream(request_id, on_output, handle=None, backend=None):
+    payload = {"requestId": request_id, "approve": True}
+    timeout = float(_setting("terminal_stream_timeout", 600))
+    try:
+        exit_code = None
+        with _open_stream(
+            "/api/agent/terminal/execute-stream", payload, timeout, backend
+        ) as stream:
+            if handle is not None:
+                handle.attach(stream.connection)
+            if stream.status == 404:
+                # 스트리밍 엔드포인트가 없는 서버: 호출한 쪽에서 일반 실행으로 대체한다.
+                stream.read()
+                return None, None
+            if stream.status != 200:
+                stream.read()
+                return None, "실행 실패: {}".format(stream.status)
+            if "ndjson" not in stream.content_type:
+                return json.loads(stream.read()), None
+            for records in stream.batches(_NdjsonDecoder()):
+                pending_kind, pending = None, []
+                for chunk in records:
+                    kind = chunk.get("type")
+                    if pending and kind != pending_kind:
+                        on_output(pending_kind, "".join(pending))
+                        pending = []
+                    if kind == "start":
+                        on_output("start", chunk.get("command", ""))
+                    elif kind in ("stdout", "stderr"):
+                        pending_kind = kind
+                        pending.append(chunk.get("data", ""))
+                    elif kind == "exit":
+                        exit_code = chunk.get("exitCode")
+                if pending:
+                    on_output(pending_kind, "".join(pending))
+        if exit_code is None:
+            return None, "종료 코드를 받기 전에 터미널 스트림이 끊겼습니다."
+        return {"ok": True, "exitCode": exit_code}, None
+    except Exception as e:
+        return None, str(e)
+
+
+class _TerminalOutput(object):
+    def __init__(self, prefix="", memory_bytes=262144):
+        self.prefix = prefix
+        self.bytes = {"stdout": 0, "stderr": 0}
+        self._partial = {"stdout": "", "stderr": ""}
+        self._files = {
+            name: tempfile.SpooledTemporaryFile(max_size=memory_bytes)
+            for name in ("stdout", "stderr")
+        }
+
+    def feed(self, stream, data):
+        encoded = data.encode("utf-8")
+        self._files[stream].write(encoded)
+        self.bytes[stream] += len(encoded)
+        if not self.prefix:
+            return data
+        lines = (self._partial[stream] + data).split("\n")
+        self._partial[stream] = lines.pop()
+        return "".join(self.prefix + line + "\n" for line in lines)
+
+    def flush(self):
+        text = "".join(
+            self.prefix + partial + "\n" for partial in self._partial.values() if partial
+        )
+        self._partial = {"stdout": "", "stderr": ""}
+        return text
+
+    def read(self, stream, limit):
+        spool = self._files[stream]
+        size = self.bytes[stream]
+        spool.seek(0)
+        if size <= limit:
+            return spool.read().decode("utf-8", "replace")
+        half = limit // 2
+        head = spool.read(half).decode("utf-8", "ignore")
+        spool.seek(size - half)
+        tail = spool.read().decode("utf-8", "ignore")
+        return "{}\n[... {} bytes 생략 ...]\n{}".format(head, size - 2 * half, tail)
+
+    def close(self):
+        for spool in self._files.values():
+            spool.close()
+
+
+def _request_terminal_batch(commands, backend=None):
+    try:
+        status, body = _http_request(
+            "POST", "/api/agent/terminal/request-batch", {"commands": commands}, timeout=30,
+            backend=backend
+        )
+        if status == 404:
+            requests = []
+            for command in commands:
+                request, error = _request_terminal(command, backend)
+                if error:
+                    return None, error
+                requests.append(request)
+            return requests, None
+        if status != 200:
+            return None, "요청 실패: {}".format(status)
+        return json.loads(body).get("requests", []), None
+    except Exception as e:
+        return None, str(e)
+
+
+def _show_confirm_popup(view, html_content, on_navigate):
+    if view is None:
+        return
+    region = view.sel()[0] if view.sel() else sublime.Region(0, 0)
+    view.add_phantom(
+        "ai_agent_terminal_approval",
+        region,
+        html_content,
+        sublime.LAYOUT_BLOCK,
+        on_navigate=on_navigate
+    )
+
+
+def _hide_confirm_popup(view):
+    if view is None:
+        return
+    view.erase_phantoms("ai_agent_terminal_approval")
+
+
+class _TerminalCommandScanner(object):
+    SHELL_LANGS = ("bash", "sh", "shell")
+    FENCE = "```"
+
+    def __init__(self):
+        self._line = []
+        self._fence = None
+        self._body = []
+
+    def feed(self, chunk):
+        found = []
+        start = 0
+        while True:
+            newline = chunk.find("\n", start)
+            if newline < 0:
+                if start < len(chunk):
+                    self._line.append(chunk[start:])
+                return found
+            self._line.append(chunk[start:newline])
+            line = "".join(self._line)
+            self._line = []
+            self._add_line(line, found)
+            start = newline + 1
+
+    def finish(self):
+        found = []
+        line = "".join(self._line)
+        self._line = []
+        self._add_line(line, found)
+        self._fence = None
+        self._body = []
+        return found
+
+    def _add_line(self, line, found):
+        line = line.rstrip("\r")
+        # Markdown처럼 줄 맨 앞(들여쓰기 3칸까지)의 ```만 코드 블록 경계로 본다.
+        marker = line.lstrip(" ")
+        if marker.startswith(self.FENCE) and len(line) - len(marker) <= 3:
+            if self._fence is None:
+                info = marker[3:].strip().lower()
+                self._fence = "shell" if info in self.SHELL_LANGS else "other"
+                self._body = []
+                return
+            if not marker.strip("`").strip():
+                if self._fence == "shell":
+                    cmd = "\n".join(self._body).strip()
+                    if cmd:
+                        found.append(cmd)
+                self._fence = None
+                self._body = []
+                return
+        if self._fence == "shell":
+            self._body.append(line)
+        if line[:9].lower() == "terminal:":
+            cmd = line[9:].strip()
+            if cmd:
+                found.append(cmd)
+
+
+def _extract_terminal_commands(text):
+    scanner = _TerminalCommandScanner()
+    return scanner.feed(text) + scanner.finish()
+
+
+class _ViewState(object):
+    __slots__ = (
+        "view_id",
+        "settings",
+        "session_id",
+        "chat_session_id",
+        "session_usage",
+        "terminal_policy",
+        "terminal_batch",
+        "terminal_queue",
+        "terminal_seen",
+        "scanner",
+        "pending_changes",
+        "diff_preview",
+        "edit_preview"
+    )
+
+    def __init__(self, view):
+        self.view_id = view.id()
+        self.settings = view.settings()
+        self.session_id = self.settings.get("ai_agent_last_session_id")
+        self.chat_session_id = self.settings.get("ai_agent_chat_session_id")
+        self.session_usage = list(self.settings.get("ai_agent_session_usage") or [0, 0])
+        self.terminal_policy = self.settings.get("ai_agent_terminal_policy") or "ask"
+        self.terminal_batch = None
+        self.terminal_queue = collections.deque()
+        self.terminal_seen = set()
+        self.scanner = None
+        self.pending_changes = None
+        self.diff_preview = None
+        self.edit_preview = None
+
+    def set_session_id(self, session_id):
+        if session_id and session_id != self.session_id:
+            self.session_id = session_id
+            self.settings.set("ai_agent_last_session_id", session_id)
+
+    def set_chat_session_id(self, session_id):
+        # 편집/리뷰 세션은 대화로 이어 쓰지 않도록 대화 세션을 따로 기억한다.
+        if session_id and session_id != self.chat_session_id:
+            self.chat_session_id = session_id
+            self.settings.set("ai_agent_chat_session_id", session_id)
+            self.session_usage = [0, 0]
+            self.settings.set("ai_agent_session_usage", self.session_usage)
+
+    def add_usage(self, chars):
+        self.session_usage = [self.session_usage[0] + 1, self.session_usage[1] + chars]
+        self.settings.set("ai_agent_session_usage", self.session_usage)
+
+    def clear_chat_session(self):
+        self.chat_session_id = None
+        self.session_usage = [0, 0]
+        self.settings.erase("ai_agent_chat_session_id")
+        self.settings.erase("ai_agent_session_usage")
+
+    def set_terminal_policy(self, policy):
+        if policy != self.terminal_policy:
+            self.terminal_policy = policy
+            self.settings.set("ai_agent_terminal_policy", policy)
+
+    def reset_stream(self, session_id=None):
+        self.set_session_id(session_id)
+        if self.terminal_batch is not None and self.terminal_batch.phase == "pending":
+            self.terminal_batch.close()
+        self.terminal_queue.clear()
+        self.terminal_seen.clear()
+        self.scanner = None
+
+
+# 상태 자체는 UI 스레드에서만 바꾼다. 작업 스레드의 콜백은 metrics.dispatch로 넘겨 바꾸고,
+# 사전은 작업 스레드에서도 찾을 수 있도록 잠금으로 보호한다.
+_view_states = {}
+_view_states_lock = threading.Lock()
+
+
+def _view_state(view):
+    with _view_states_lock:
+        state = _view_states.get(view.id())
+        if state is None:
+            state = _ViewState(view)
+            _view_states[view.id()] = state
+        return state
+
+
+def _drop_view_state(view):
+    with _view_states_lock:
+        _view_states.pop(view.id(), None)
+
+
+def _enqueue_terminal_commands(view, commands):
+    if view is None:
+        return
+    state = _view_state(view)
+    for cmd in commands:
+        if cmd not in state.terminal_seen:
+            state.terminal_seen.add(cmd)
+            state.terminal_queue.append(cmd)
+
+
+class _TerminalBatch(object):
+    def __init__(self, view, commands):
+        self.view = view
+        self.items = []
+        self.phase = "pending"
+        self.extend(commands)
+
+    def extend(self, commands):
+        for command in commands:
+            self.items.append({"command": command, "enabled": True, "sequential": False})
+
+    def render(self):
+        rows = []
+        for index, item in enumerate(self.items):
+            rows.append(
+                "<div style='margin:4px 0;'>"
+                "<a href='toggle:{0}'>{1}</a> <a href='seq:{0}'>{2}</a>"
+                "<pre style='background:#f6f6f6; padding:6px; border-radius:6px; margin:2px 0;'>{3}</pre>"
+                "</div>".format(
+                    index,
+                    "☑" if item["enabled"] else "☐",
+                    "순차" if item["sequential"] else "병렬",
+                    html.escape(item["command"])
+                )
+            )
+        popup_html = (
+            "<div style='font-family:-apple-system; font-size:12px;'>"
+            "<div style='display:flex; justify-content:space-between; align-items:center;'>"
+            "<h3 style='margin:0;'>터미널 실행 승인 ({}개)</h3>"
+            "<a href='close' style='text-decoration:none;'>✕</a>"
+            "</div>"
+            "<div style='margin:8px 0;'>아래 명령을 실행할까요? "
+            "체크 해제한 명령은 거부되고, '순차'로 표시한 명령은 순서대로 실행됩니다.</div>"
+            "{}"
+            "<a href='approve'>승인</a> · <a href='reject'>거부</a>"
+            "<br>"
+            "<a href='always_allow'>항상 허용</a> · <a href='always_deny'>항상 거부</a>"
+            "</div>"
+        ).format(len(self.items), "".join(rows))
+        _hide_confirm_popup(self.view)
+        _show_confirm_popup(self.view, popup_html, self.on_navigate)
+
+    def on_navigate(self, href):
+        action, _, arg = href.partition(":")
+        state = _view_state(self.view)
+        if action == "toggle":
+            item = self.items[int(arg)]
+            item["enabled"] = not item["enabled"]
+            self.render()
+        elif action == "seq":
+            item = self.items[int(arg)]
+            item["sequential"] = not item["sequential"]
+            self.render()
+        elif action == "close":
+            self.close()
+        elif action == "approve":
+            self.run()
+        elif action == "reject":
+            self.run(approve=False)
+        elif action == "always_allow":
+            state.set_terminal_policy("allow")
+            self.run()
+        elif action == "always_deny":
+            state.set_terminal_policy("deny")
+            self.run(approve=False)
+
+    def close(self):
+        _hide_confirm_popup(self.view)
+        state = _view_state(self.view)
+        if state.terminal_batch is self:
+            state.terminal_batch = None
+
+    def run(self, approve=True):
+        _hide_confirm_popup(self.view)
+        self.phase = "running"
+        approved = [item for item in self.items if approve and item["enabled"]]
+        rejected = [item for item in self.items if item not in approved]
+        window = self.view.window()
+        state = _view_state(self.view)
+        session_id = state.session_id
+        # 승인하지 않은 명령도 실행되지 않았다는 사실을 출력 패널과 세션 기록에 남긴다.
+        for item in rejected:
+            skipped = "\n[터미널 건너뜀]\ncommand: {}\n승인되지 않아 실행하지 않았습니다.\n".format(item["command"])
+            _show_output_panel(window, skipped)
+            if session_id:
+                _append_session_message(session_id, "tool", skipped)
+
+        # 승인 요청은 받은 서버의 메모리에만 있으므로 요청과 실행을 세션의 백엔드 하나로 보낸다.
+        backend = _get_backends().pick(session_id)
+
+        def worker():
+            started = time.monotonic()
+            # 거부한 명령도 승인 요청을 만든 뒤 거부로 보내, 단일 명령처럼 서버가 건너뛴 것을 알게 한다.
+            requests, error = _request_terminal_batch(
+                [item["command"] for item in self.items], backend
+            )
+            if error or len(requests) != len(self.items):
+                _show_output_panel(window, "\n[오류] " + (error or "요청 ID 없음") + "\n")
+                sublime.set_timeout(self.finish, 0)
+                return
+            for item, request in zip(self.items, requests):
+                item["requestId"] = request.get("id")
+            for item in rejected:
+                if item["requestId"]:
+                    _execute_terminal(item["requestId"], False, backend)
+            if not approved:
+                _show_output_panel(window, "\n[정보] 실행이 거부되었습니다.\n")
+                sublime.set_timeout(self.finish, 0)
+                return
+            for index, item in enumerate(approved, 1):
+                item["index"] = index
+            sequential = [item for item in approved if item["sequential"]]
+            steps = collections.deque([sequential] if sequential else [])
+            steps.extend([item] for item in approved if not item["sequential"])
+            progress = {"running": 0, "left": len(steps)}
+            lock = threading.Lock()
+            limit = max(1, int(_setting("terminal_max_parallel", 3)))
+
+            def dispatch():
+                while True:
+                    with lock:
+                        if not steps or progress["running"] >= limit:
+                            return
+                        items = steps.popleft()
+                        progress["running"] += 1
+                    _run_in_background(run_sequence, items).add_done_callback(step_done)
+
+            def step_done(_):
+                with lock:
+                    progress["running"] -= 1
+                    progress["left"] -= 1
+                    last = progress["left"] == 0
+                if not last:
+                    dispatch()
+                    return
+                _show_output_panel(
+                    window,
+                    "\n[터미널 배치] {}개 실행, 총 {:.2f}s\n".format(
+                        len(approved), time.monotonic() - started
+                    )
+                )
+                sublime.set_timeout(self.finish, 0)
+
+            dispatch()
+
+        def run_sequence(items):
+            for item in items:
+                run_item(item)
+
+        def run_item(item):
+            command = item["command"]
+            if not item.get("requestId"):
+                _show_output_panel(window, "\n[오류] 요청 ID 없음\n")
+                return
+            started = time.monotonic()
+            if _setting("terminal_stream_output", True) and stream_item(item, started):
+                return
+            result, exec_error = _execute_terminal(item["requestId"], True, backend)
+            elapsed = time.monotonic() - started
+            if exec_error:
+                _show_output_panel(window, "\n[오류] " + exec_error + "\n")
+                return
+            if not result.get("ok"):
+                _show_output_panel(window, "\n[정보] 실행이 거부되었습니다.\n")
+                return
+            res = result.get("result", {})
+            output = (
+                "\n[터미널 결과]\n"
+                "command: {}\n"
+                "exitCode: {}\n"
+                "elapsed: {:.2f}s\n"
+                "stdout:\n{}\n"
+                "stderr:\n{}\n"
+            ).format(command, res.get("exitCode"), elapsed, res.get("stdout"), res.get("stderr"))
+            _show_output_panel(window, output)
+            if session_id:
+                _append_session_message(session_id, "tool", output)
+
+        def stream_item(item, started):
+            command = item["command"]
+            label = "[{}] ".format(item["index"]) if len(approved) > 1 else ""
+            output = _TerminalOutput(label, int(_setting("terminal_output_memory_bytes", 262144)))
+            manager = _get_request_manager()
+            handle = manager.track(self.view.id(), window.id() if window else None, "terminal")
+
+            def on_output(kind, data):
+                if handle.cancelled:
+                    return
+                if kind == "start":
+                    _show_output_panel(window, "\n{}$ {}\n".format(label, data or command))
+                    return
+                _show_output_panel(window, output.feed(kind, data))
+
+            try:
+                result, exec_error = _execute_terminal_stream(
+                    item["requestId"], on_output, handle=handle, backend=backend
+                )
+                if result is None and exec_error is None:
+                    return False
+                if handle.cancelled:
+                    return True
+                _show_output_panel(window, output.flush())
+                elapsed = time.monotonic() - started
+                if exec_error:
+                    _show_output_panel(window, "\n[오류] " + exec_error + "\n")
+                    return True
+                if not result.get("ok"):
+                    _show_output_panel(window, "\n[정보] 실행이 거부되었습니다.\n")
+                    return True
+                _show_output_panel(
+                    window,
+                    "{}[터미널 종료] exitCode: {}, elapsed: {:.2f}s, stdout {} bytes, stderr {} bytes\n".format(
+                        label,
+                        result.get("exitCode"),
+                        elapsed,
+                        output.bytes["stdout"],
+                        output.bytes["stderr"]
+                    )
+                )
+                if session_id:
+                    limit = max(2, int(_setting("terminal_session_max_bytes", 1048576)) // 2)
+                    _append_session_message(
+                        session_id,
+                        "tool",
+                        (
+                            "\n[터미널 결과]\n"
+                            "command: {}\n"
+                            "exitCode: {}\n"
+                            "elapsed: {:.2f}s\n"
+                            "stdout:\n{}\n"
+                            "stderr:\n{}\n"
+                        ).format(
+                            command,
+                            result.get("exitCode"),
+                            elapsed,
+                            output.read("stdout", limit),
+                            output.read("stderr", limit)
+                        )
+                    )
+                return True
+            finally:
+                output.close()
+                manager.close(handle)
+
+        _run_in_background(worker)
+
+    def finish(self):
+        self.phase = "done"
+        state = _view_state(self.view)
+        if state.terminal_batch is self:
+            state.terminal_batch = None
+        _process_terminal_queue(self.view)
+
+
+def _process_terminal_queue(view):
+    if view is None:
+        return
+    state = _view_state(view)
+    queue = state.terminal_queue
+    if not queue:
+        return
+    batch = state.terminal_batch
+    if batch is not None and batch.phase == "running":
+        return
+    commands = list(queue)
+    queue.clear()
+    policy = state.terminal_policy or "ask"
+    if batch is None:
+        batch = _TerminalBatch(view, commands)
+        state.terminal_batch = batch
+    else:
+        batch.extend(commands)
+    if policy == "deny":
+        # 항상 거부도 명령마다 거부를 보내고 건너뛴 사실을 기록한다.
+        batch.run(approve=False)
+    elif policy == "allow":
+        batch.run()
+    else:
+        batch.render()
+
+
+def _maybe_trigger_terminal(view, chunk, final=False):
+    if view is None:
+        return
+    state = _view_state(view)
+    if state.scanner is None:
+        state.scanner = _TerminalCommandScanner()
+    if final:
+        commands = state.scanner.finish() + _extract_terminal_commands(chunk)
+        state.scanner = None
+    else:
+        commands = state.scanner.feed(chunk)
+    if commands:
+        _enqueue_terminal_commands(view, commands)
+        _process_terminal_queue(view)
+
+
+def _show_history_popup(view, html_content, on_navigate=None):
+    def _default_navigate(href):
+        if href == "close":
+            view.hide_popup()
+
+    view.show_popup(
+        html_content,
+        max_width=900,
+        max_height=600,
+        flags=0,
+        on_navigate=on_navigate or _default_navigate
+    )
+
+
+def _show_chat_popup(view, html_content, on_navigate=None):
+    return
+
+
+def _append_chat_popup(view, chunk):
+    return
+
+
+def _fetch_session_messages(session_id):
+    try:
+        status, body = _cached_get("/api/agent/sessions/{}".format(session_id))
+        if status != 200:
+            return None, "세션 조회 실패: {}".format(status)
+        data = json.loads(body)
+        return data.get("messages", []), None
+    except Exception as e:
+        return None, str(e)
+
+def _format_role(role):
+    if role == "user":
+        return USER_LABEL
+    if role == "assistant":
+        return ASSISTANT_LABEL
+    return role
+
+
+def _role_bg(role):
+    if role == "user":
+        return USER_BG
+    if role == "assistant":
+        return ASSISTANT_BG
+    return "#ffffff"
+
+
+def _message_html(role, created_at, content, limit=None, more_href=None):
+    more = ""
+    if limit is not None and len(content) > limit:
+        content = content[:limit] + "…"
+        if more_href:
+            more = " <a href='{}'>더 보기</a>".format(html.escape(more_href))
+    safe_content = html.escape(content).replace("\n", "<br>")
+    safe_role = html.escape(_format_role(role))
+    safe_time = html.escape(created_at)
+    bg = _role_bg(role)
+    return (
+        "<div style='background-color:{}; padding:6px; margin:6px 0; "
+        "border-radius:6px; font-family: -apple-system; font-size:12px;'>"
+        "<div><strong>[{}]</strong> {} </div>"
+        "<div>{}{}</div>"
+        "</div>"
+    ).format(bg, safe_role, safe_time, safe_content, more)
+
+
+def _summarize_session(session):
+    messages = session.get("messages", [])
+    first_prompt = next(
+        (m.get("content", "") for m in messages if m.get("role") == "user"), ""
+    )
     return {
-        "jsonrpc": "2.0",
-        "method": "agent.process",
-        "params": {
-            "prompt": prompt,
-            "context": context,
-            "stream": stream
-        },
-        "id": request_id
+        "id": session.get("id", ""),
+        "createdAt": session.get("createdAt", ""),
+        "updatedAt": session.get("updatedAt", ""),
+        "messageCount": len(messages),
+        "firstPrompt": first_prompt[:120]
     }
 
 
-def _send_streaming_rpc(payload, on_start, on_delta, on_final, on_error):
+class _SessionIndexCursor(object):
+    def __init__(self, backend, page_size):
+        self.backend = backend
+        self.page_size = page_size
+        self.offset = 0
+        self.total = None
+        self.error = None
+        self._buffer = collections.deque()
+
+    def peek(self):
+        if not self._buffer and self.error is None and (self.total is None or self.offset < self.total):
+            data, error = _fetch_backend_session_index(self.backend, self.offset, self.page_size)
+            if error:
+                self.error = error
+                return None
+            sessions = data.get("sessions", [])
+            self.total = data.get("total", 0) if sessions else self.offset
+            self.offset += len(sessions)
+            self._buffer.extend(sessions)
+        return self._buffer[0] if self._buffer else None
+
+    def pop(self):
+        return self._buffer.popleft()
+
+
+def _fetch_session_index(offset=0, limit=HISTORY_PAGE_SIZE):
+    backends = _get_backends()
+    if len(backends.backends) == 1:
+        return _fetch_backend_session_index(backends.backends[0], offset, limit)
+    # 백엔드마다 최근 순 목록을 페이지 단위로 읽으며 합친다. 서버가 한 번에 주는 수에 상한이 있으므로
+    # offset+limit개를 한 번에 요청하지 않고, 합친 목록이 그만큼 찰 때까지 백엔드별 offset을 넘겨 가며 받는다.
+    page_size = min(SERVER_PAGE_LIMIT, offset + limit)
+    cursors = [_SessionIndexCursor(backend, page_size) for backend in backends.backends]
+    sessions = []
+    for position in range(offset + limit):
+        heads = [(cursor.peek(), cursor) for cursor in cursors]
+        heads = [(summary, cursor) for summary, cursor in heads if summary is not None]
+        if not heads:
+            break
+        summary, cursor = max(heads, key=lambda head: head[0].get("updatedAt", ""))
+        cursor.pop()
+        backends.bind(summary.get("id"), cursor.backend)
+        if position >= offset:
+            sessions.append(summary)
+    errors = ["{}: {}".format(c.backend.name, c.error) for c in cursors if c.error]
+    if errors and all(c.total is None for c in cursors):
+        return None, ", ".join(errors)
+    total = sum(c.total or 0 for c in cursors)
+    return {"total": total, "offset": offset, "sessions": sessions}, None
+
+
+def _fetch_backend_session_index(backend, offset, limit):
     try:
-        body = json.dumps(payload)
-        conn = http.client.HTTPConnection(SERVER_HOST, SERVER_PORT, timeout=60)
-        conn.request("POST", "/rpc", body=body, headers={"Content-Type": "application/json"})
-        resp = conn.getresponse()
-        if resp.status != 200:
-            on_error("서버 응답 오류: {}".format(resp.status))
-            return
+        status, body = _cached_get(
+            "/api/agent/sessions/index?offset={}&limit={}".format(offset, limit), backend=backend
+        )
+        if status == 404:
+            sessions, error = _fetch_sessions(backend)
+            if error:
+                return None, error
+            summaries = [_summarize_session(session) for session in sessions]
+            return {
+                "total": len(summaries),
+                "offset": offset,
+                "sessions": summaries[offset:offset + limit]
+            }, None
+        if status != 200:
+            return None, "세션 목록 조회 실패: {}".format(status)
+        return json.loads(body), None
+    except Exception as e:
+        return None, str(e)
 
-        buffer = ""
-        while True:
-            line = resp.fp.readline()
-            if not line:
-                break
-            try:
-                data = json.loads(line.decode("utf-8"))
-                result = data.get("result") or {}
-                chunk_type = result.get("type")
-                if chunk_type == "start":
-                    on_start(result.get("sessionId"))
-                elif chunk_type == "delta":
-                    on_delta(result.get("content", ""))
-                elif chunk_type == "tool":
-                    name = result.get("name", "tool")
-                    args = result.get("arguments", "")
-                    on_delta("\n[툴 호출] {} {}\n".format(name, args))
-                elif chunk_type == "final":
-                    on_final(result.get("result"))
-            except Exception:
-                buffer += line.decode("utf-8")
-        conn.close()
+
+def _fetch_session_page(session_id, offset=0, limit=HISTORY_MESSAGE_PAGE_SIZE):
+    try:
+        status, body = _cached_get(
+            "/api/agent/sessions/{}/messages?offset={}&limit={}".format(session_id, offset, limit)
+        )
+        if status == 404:
+            messages, error = _fetch_session_messages(session_id)
+            if error:
+                return None, error
+            return {
+                "id": session_id,
+                "total": len(messages),
+                "offset": offset,
+                "messages": messages[offset:offset + limit]
+            }, None
+        if status != 200:
+            return None, "세션 조회 실패: {}".format(status)
+        return json.loads(body), None
     except Exception as e:
-        on_error(str(e))
+        return None, str(e)
 
 
-def _show_output_panel(window, content):
-    panel = window.create_output_panel("ai_agent")
-    panel.run_command("append", {"characters": content})
-    window.run_command("show_panel", {"panel": "output.ai_agent"})
+class _HistoryBrowser(object):
+    def __init__(self, view):
+        self.view = view
+        self.offset = 0
+        self.total = 0
+        self.sessions = []
+        self.expanded = {}
+        self.full_messages = set()
+        self.loading = None
+        self.highlight = None
 
-def _append_session_message(session_id, role, content):
-    try:
-        payload = json.dumps({"role": role, "content": content})
-        conn = http.client.HTTPConnection(SERVER_HOST, SERVER_PORT, timeout=30)
-        conn.request(
-            "POST",
-            "/api/agent/sessions/{}/messages".format(session_id),
-            body=payload,
-            headers={"Content-Type": "application/json"}
+    def open(self):
+        self._load_index(0)
+
+    def open_session(self, summary, message_index):
+        self.sessions = [summary]
+        self.total = 1
+        if message_index is None:
+            # 아직 서버와 동기화하지 못한 메시지는 위치를 모르므로 세션의 마지막 메시지들을 연다.
+            message_index = summary.get("messageCount", 0)
+        else:
+            self.highlight = "{}/{}".format(summary.get("id", ""), message_index)
+        self.expanded[summary.get("id", "")] = {
+            "start": max(0, message_index - 2),
+            "messages": [],
+            "total": None
+        }
+        self._load_messages(summary.get("id", ""))
+
+    def _load_index(self, offset):
+        self.loading = "index"
+
+        def worker():
+            data, error = _fetch_session_index(offset)
+
+            def apply():
+                self.loading = None
+                if error:
+                    _show_output_panel(self.view.window(), "\n[오류] " + error + "\n")
+                    return
+                self.offset = data.get("offset", offset)
+                self.total = data.get("total", 0)
+                self.sessions = data.get("sessions", [])
+                if not self.sessions and offset == 0:
+                    _show_output_panel(self.view.window(), "\n[정보] 세션이 없습니다.\n")
+                    return
+                self.render()
+
+            sublime.set_timeout(apply, 0)
+
+        _run_in_background(worker)
+
+    def _load_messages(self, session_id):
+        entry = self.expanded.setdefault(
+            session_id, {"start": 0, "messages": [], "total": None}
         )
-        conn.getresponse()
-        conn.close()
-    except Exception:
+        offset = entry["start"] + len(entry["messages"])
+        self.loading = session_id
+
+        def worker():
+            data, error = _fetch_session_page(session_id, offset)
+
+            def apply():
+                self.loading = None
+                if error:
+                    _show_output_panel(self.view.window(), "\n[오류] " + error + "\n")
+                    return
+                entry["messages"].extend(data.get("messages", []))
+                entry["total"] = data.get("total", len(entry["messages"]))
+                self.render()
+
+            sublime.set_timeout(apply, 0)
+
+        _run_in_background(worker)
+
+    def on_navigate(self, href):
+        action, _, arg = href.partition(":")
+        if action == "close":
+            self.view.hide_popup()
+        elif action == "page":
+            self._load_index(max(0, int(arg)))
+        elif action == "expand":
+            if arg in self.expanded:
+                self.render()
+            else:
+                self._load_messages(arg)
+        elif action == "collapse":
+            self.expanded.pop(arg, None)
+            self.render()
+        elif action == "more":
+            self._load_messages(arg)
+        elif action == "full":
+            self.full_messages.add(arg)
+            self.render()
+
+    def render(self):
+        blocks = [
+            "<div style='font-family:-apple-system; font-size:12px;'>",
+            "<div style='display:flex; justify-content:space-between; align-items:center;'>",
+            "<h3 style='margin:0;'>전체 대화 목록 ({}-{} / {})</h3>".format(
+                self.offset + 1 if self.sessions else 0,
+                self.offset + len(self.sessions),
+                self.total
+            ),
+            "<a href='close' style='text-decoration:none;'>✕</a>",
+            "</div>"
+        ]
+        for session in self.sessions:
+            session_id = session.get("id", "")
+            safe_id = html.escape(session_id)
+            entry = self.expanded.get(session_id)
+            toggle = "collapse" if entry is not None else "expand"
+            blocks.append(
+                "<div style='margin-top:12px;'>"
+                "<a href='{}:{}'>{}</a> <strong>session: {}</strong> "
+                "(updated: {}, {}개 메시지)<br>{}</div>".format(
+                    toggle,
+                    safe_id,
+                    "▾" if entry is not None else "▸",
+                    safe_id,
+                    html.escape(session.get("updatedAt", "")),
+                    session.get("messageCount", 0),
+                    html.escape(session.get("firstPrompt", ""))
+                )
+            )
+            if entry is None:
+                continue
+            for index, message in enumerate(entry["messages"], entry["start"]):
+                key = "{}/{}".format(session_id, index)
+                message_html = _message_html(
+                    message.get("role", "unknown"),
+                    message.get("createdAt", ""),
+                    message.get("content", ""),
+                    limit=None if key in self.full_messages else HISTORY_PREVIEW_CHARS,
+                    more_href="full:" + key
+                )
+                if key == self.highlight:
+                    message_html = "<div style='border:2px solid #f0a020; border-radius:6px;'>{}</div>".format(
+                        message_html
+                    )
+                blocks.append(message_html)
+            loaded = entry["start"] + len(entry["messages"])
+            if entry["total"] is not None and loaded < entry["total"]:
+                blocks.append("<a href='more:{}'>메시지 더 불러오기 ({}/{})</a>".format(
+                    safe_id, loaded, entry["total"]
+                ))
+        nav = []
+        if self.offset > 0:
+            nav.append("<a href='page:{}'>← 이전</a>".format(
+                max(0, self.offset - HISTORY_PAGE_SIZE)
+            ))
+        if self.offset + len(self.sessions) < self.total:
+            nav.append("<a href='page:{}'>다음 →</a>".format(self.offset + len(self.sessions)))
+        if nav:
+            blocks.append("<hr>" + " · ".join(nav))
+        blocks.append("</div>")
+        html_content = "".join(blocks)
+        if self.view.is_popup_visible():
+            self.view.update_popup(html_content)
+        else:
+            _show_history_popup(self.view, html_content, self.on_navigate)
+
+
+_SEARCH_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _search_terms(text):
+    terms = []
+    for token in _SEARCH_TOKEN_RE.findall(text.lower()):
+        if token.isascii():
+            if len(token) > 1:
+                terms.append(token)
+            continue
+        terms.append(token)
+        for i in range(len(token) - 1):
+            terms.append(token[i:i + 2])
+    return terms
+
+
+def _utc_now():
+    return time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime())
+
+
+class _HistoryIndex(object):
+    K1 = 1.2
+    B = 0.75
+    VERSION = 2
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._docs = []
+        self._keys = {}
+        self._postings = {}
+        self._session_counts = {}
+        self._provisional = {}
+        self._synced = {}
+        self._live = 0
+        self._total_length = 0
+        self._loaded = False
+        self._dirty = False
+        self._save_scheduled = False
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        # 이전 형식은 로컬에서 센 메시지 위치가 섞여 있으므로 버리고 서버에서 다시 색인한다.
+        if data.get("version") != self.VERSION:
+            return
+        self._docs = data.get("docs", [])
+        self._session_counts = data.get("sessions", {})
+        self._postings = {
+            term: {int(doc_id): tf for doc_id, tf in postings.items()}
+            for term, postings in data.get("postings", {}).items()
+        }
+        self._provisional = {
+            session_id: {int(doc_id): terms for doc_id, terms in docs.items()}
+            for session_id, docs in data.get("provisional", {}).items()
+        }
+        self._synced = data.get("synced", {})
+        live = [(doc_id, doc) for doc_id, doc in enumerate(self._docs) if doc is not None]
+        self._keys = {(doc[0], doc[1]): doc_id for doc_id, doc in live if doc[1] is not None}
+        self._live = len(live)
+        self._total_length = sum(doc[5] for _, doc in live)
+
+    def session_count(self, session_id):
+        with self._lock:
+            self._load()
+            return self._session_counts.get(session_id, 0)
+
+    def add_message(self, session_id, role, content, created_at=None, message_index=None):
+        # message_index는 서버의 메시지 위치다. 없으면 서버에서 동기화할 때까지 위치 없는 임시 문서로 둔다.
+        if not session_id or not content:
+            return
+        terms = _search_terms(content)
+        with self._lock:
+            self._load()
+            key = (session_id, message_index)
+            if message_index is not None and key in self._keys:
+                return
+            doc_id = len(self._docs)
+            preview = " ".join(content.split())[:160]
+            self._docs.append([session_id, message_index, role, created_at or _utc_now(), preview, len(terms)])
+            self._live += 1
+            self._total_length += len(terms)
+            for term in terms:
+                postings = self._postings.setdefault(term, {})
+                postings[doc_id] = postings.get(doc_id, 0) + 1
+            if message_index is None:
+                self._provisional.setdefault(session_id, {})[doc_id] = terms
+            else:
+                self._keys[key] = doc_id
+                self._session_counts[session_id] = max(
+                    self._session_counts.get(session_id, 0), message_index + 1
+                )
+            self._dirty = True
+
+    def sync_state(self, backend_name):
+        # 백엔드별로 마지막 동기화 때의 세션 목록 ETag와 가장 최근 updatedAt을 둔다.
+        with self._lock:
+            self._load()
+            return dict(self._synced.get(backend_name, {}))
+
+    def set_sync_state(self, backend_name, etag, updated_at):
+        with self._lock:
+            self._load()
+            self._synced[backend_name] = {"etag": etag, "updatedAt": updated_at}
+            self._dirty = True
+
+    def confirm_session(self, session_id):
+        # 서버 메시지로 세션을 모두 색인했으면 로컬에서 미리 넣은 임시 문서는 지운다.
+        with self._lock:
+            self._load()
+            for doc_id, terms in self._provisional.pop(session_id, {}).items():
+                for term in set(terms):
+                    postings = self._postings.get(term)
+                    if postings is not None:
+                        postings.pop(doc_id, None)
+                        if not postings:
+                            del self._postings[term]
+                self._total_length -= self._docs[doc_id][5]
+                self._docs[doc_id] = None
+                self._live -= 1
+                self._dirty = True
+
+    def search(self, query, limit=50):
+        terms = list(dict.fromkeys(_search_terms(query)))
+        with self._lock:
+            self._load()
+            count = self._live
+            if not terms or not count:
+                return []
+            avg_length = float(self._total_length) / count or 1.0
+            scores = {}
+            matched = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1.0 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    length = self._docs[doc_id][5]
+                    norm = tf + self.K1 * (1 - self.B + self.B * length / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.K1 + 1) / norm
+                    matched[doc_id] = matched.get(doc_id, 0) + 1
+            ranked = heapq.nlargest(
+                limit, scores, key=lambda doc_id: (matched[doc_id], scores[doc_id])
+            )
+            results = []
+            for doc_id in ranked:
+                session_id, message_index, role, created_at, preview, _ = self._docs[doc_id]
+                results.append({
+                    "sessionId": session_id,
+                    "messageIndex": message_index,
+                    "role": role,
+                    "createdAt": created_at,
+                    "preview": preview,
+                    "score": round(scores[doc_id], 3)
+                })
+            return results
+
+    def save(self, force=False):
+        with self._lock:
+            if not self._dirty:
+                return
+            if not force:
+                # 대화 중에는 턴마다 인덱스 전체를 쓰지 않고 모아서 한 번 쓴다.
+                if not self._save_scheduled:
+                    self._save_scheduled = True
+                    sublime.set_timeout(lambda: _run_in_background(self._flush), 5000)
+                return
+        self._flush()
+
+    def _flush(self):
+        with self._lock:
+            self._save_scheduled = False
+            if not self._dirty:
+                return
+            data = {
+                "version": self.VERSION,
+                "docs": self._docs,
+                "sessions": self._session_counts,
+                "postings": self._postings,
+                "provisional": self._provisional,
+                "synced": self._synced
+            }
+            self._dirty = False
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                tmp_path = self.path + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.write(json.dumps(data, ensure_ascii=False, separators=(",", ":")))
+                os.replace(tmp_path, self.path)
+            except OSError:
+                self._dirty = True
+
+    def stats(self):
+        with self._lock:
+            self._load()
+            return {
+                "messages": self._live,
+                "unsynced": sum(len(docs) for docs in self._provisional.values()),
+                "sessions": len(self._session_counts),
+                "terms": len(self._postings)
+            }
+
+
+_history_index = None
+_history_index_lock = threading.Lock()
+
+
+def _get_history_index():
+    global _history_index
+    with _history_index_lock:
+        if _history_index is None:
+            _history_index = _HistoryIndex(
+                os.path.join(sublime.cache_path(), "AiAgent", "search-index.json")
+            )
+        return _history_index
+
+
+def _index_message(session_id, role, content):
+    index = _get_history_index()
+    index.add_message(session_id, role, content)
+    index.save()
+
+
+def _record_turn(session_id, prompt, result):
+    if not session_id or not result or result.get("cached"):
         return
+    if result.get("type") == "message":
+        content = result.get("content", "")
+    else:
+        content = json.dumps(result, ensure_ascii=False)
+    index = _get_history_index()
+    index.add_message(session_id, "user", prompt)
+    index.add_message(session_id, "assistant", content)
+    index.save()
+
+
+def _sync_history_index():
+    index = _get_history_index()
+    backends = _get_backends()
+    summaries = {}
+    errors = []
+    # 순서는 상관없으므로 합치지 않고 백엔드마다 따로 동기화한다.
+    for backend in backends.backends:
+        error = _sync_backend_history(index, backends, backend, summaries)
+        if error:
+            errors.append(error if len(backends.backends) == 1 else "{}: {}".format(backend.name, error))
+    index.save(force=True)
+    return summaries, ", ".join(errors) or None
+
+
+def _sync_backend_history(index, backends, backend, summaries):
+    # 세션 목록은 updatedAt 내림차순이므로 지난 동기화 이후 바뀐 세션까지만 읽는다.
+    state = index.sync_state(backend.name)
+    data, etag, error = _fetch_session_index_head(backend, state.get("etag"))
+    if error:
+        return error
+    if data is None:
+        return None
+    since = state.get("updatedAt", "")
+    sessions = data.get("sessions", [])
+    latest = sessions[0].get("updatedAt", "") if sessions else since
+    offset = 0
+    while True:
+        for summary in sessions:
+            if summary.get("updatedAt", "") < since:
+                index.set_sync_state(backend.name, etag, max(latest, since))
+                return None
+            session_id = summary.get("id", "")
+            summaries[session_id] = summary
+            backends.bind(session_id, backend)
+            page_error = _sync_session_messages(index, session_id, summary.get("messageCount", 0))
+            if page_error:
+                return page_error
+        offset += len(sessions)
+        if not sessions or offset >= data.get("total", 0):
+            break
+        data, error = _fetch_backend_session_index(backend, offset, SERVER_PAGE_LIMIT)
+        if error:
+            return error
+        sessions = data.get("sessions", [])
+    index.set_sync_state(backend.name, etag, max(latest, since))
+    return None
 
 
-def _request_terminal(command):
+def _fetch_session_index_head(backend, etag):
+    # 첫 페이지는 지난 동기화의 ETag로 요청해 304면 이 백엔드는 건너뛴다.
+    path = "/api/agent/sessions/index?offset=0&limit={}".format(SERVER_PAGE_LIMIT)
     try:
-        payload = json.dumps({"command": command})
-        conn = http.client.HTTPConnection(SERVER_HOST, SERVER_PORT, timeout=30)
-        conn.request(
-            "POST",
-            "/api/agent/terminal/request",
-            body=payload,
-            headers={"Content-Type": "application/json"}
+        status, body, resp = _pool_request(
+            "GET", path, headers={"If-None-Match": etag} if etag else {}, backend=backend
         )
-        resp = conn.getresponse()
-        body = resp.read().decode("utf-8")
-        conn.close()
-        if resp.status != 200:
-            return None, "요청 실패: {}".format(resp.status)
+        if status == 304:
+            return None, etag, None
+        if status == 404:
+            data, error = _fetch_backend_session_index(backend, 0, SERVER_PAGE_LIMIT)
+            return data, None, error
+        if status != 200:
+            return None, None, "세션 목록 조회 실패: {}".format(status)
+        return json.loads(body.decode("utf-8")), resp.getheader("ETag"), None
+    except Exception as e:
+        return None, None, str(e)
+
+
+def _sync_session_messages(index, session_id, message_count):
+    have = index.session_count(session_id)
+    while have < message_count:
+        page, page_error = _fetch_session_page(session_id, have, SERVER_PAGE_LIMIT)
+        if page_error:
+            return page_error
+        messages = page.get("messages", [])
+        if not messages:
+            break
+        for position, message in enumerate(messages, page.get("offset", have)):
+            index.add_message(
+                session_id,
+                message.get("role", "unknown"),
+                message.get("content", ""),
+                created_at=message.get("createdAt", ""),
+                message_index=position
+            )
+        have += len(messages)
+    if have >= message_count:
+        index.confirm_session(session_id)
+    return None
+
+
+def _fetch_sessions(backend=None):
+    try:
+        status, body = _http_request("GET", "/api/agent/sessions", timeout=30, backend=backend)
+        if status != 200:
+            return None, "세션 목록 조회 실패: {}".format(status)
         data = json.loads(body)
         return data, None
     except Exception as e:
         return None, str(e)
 
 
-def _execute_terminal(request_id, approve):
-    try:
-        payload = json.dumps({"requestId": request_id, "approve": approve})
-        conn = http.client.HTTPConnection(SERVER_HOST, SERVER_PORT, timeout=60)
-        conn.request(
-            "POST",
-            "/api/agent/terminal/execute",
-            body=payload,
-            headers={"Content-Type": "application/json"}
-        )
-        resp = conn.getresponse()
-        body = resp.read().decode("utf-8")
-        conn.close()
-        if resp.status != 200:
-            return None, "실행 실패: {}".format(resp.status)
-        data = json.loads(body)
-        return data, None
-    except Exception as e:
-        return None, str(e)
+DIFF_CONTEXT_LINES = 3
+DIFF_MAX_RENDER_LINES = 400
+DIFF_SMALL_SEGMENT = 250000
+
+
+def _unique_anchors(a, b, a0, a1, b0, b1):
+    counts = {}
+    for i in range(a0, a1):
+        entry = counts.setdefault(a[i], [0, 0, i, -1])
+        entry[0] += 1
+    for j in range(b0, b1):
+        entry = counts.get(b[j])
+        if entry is not None:
+            entry[1] += 1
+            entry[3] = j
+    pairs = sorted(
+        (entry[2], entry[3]) for entry in counts.values() if entry[0] == 1 and entry[1] == 1
+    )
+    if not pairs:
+        return []
+    tails = []
+    tail_index = []
+    previous = [-1] * len(pairs)
+    for index, (_, j) in enumerate(pairs):
+        position = bisect.bisect_left(tails, j)
+        if position == len(tails):
+            tails.append(j)
+            tail_index.append(index)
+        else:
+            tails[position] = j
+            tail_index[position] = index
+        previous[index] = tail_index[position - 1] if position else -1
+    anchors = []
+    index = tail_index[-1]
+    while index >= 0:
+        anchors.append(pairs[index])
+        index = previous[index]
+    anchors.reverse()
+    return anchors
+
+
+def _split_segment(a, b, a0, a1, b0, b1, deadline):
+    if a0 == a1:
+        return [("insert", a0, a1, b0, b1)]
+    if b0 == b1:
+        return [("delete", a0, a1, b0, b1)]
+    if time.monotonic() > deadline:
+        return [("replace", a0, a1, b0, b1)]
+    anchors = _unique_anchors(a, b, a0, a1, b0, b1)
+    if anchors:
+        parts = []
+        i, j = a0, b0
+        for anchor_i, anchor_j in anchors:
+            parts.append(("diff", i, anchor_i, j, anchor_j))
+            parts.append(("equal", anchor_i, anchor_i + 1, anchor_j, anchor_j + 1))
+            i, j = anchor_i + 1, anchor_j + 1
+        parts.append(("diff", i, a1, j, b1))
+        return parts
+    if (a1 - a0) * (b1 - b0) > DIFF_SMALL_SEGMENT:
+        return [("replace", a0, a1, b0, b1)]
+    matcher = difflib.SequenceMatcher(None, a[a0:a1], b[b0:b1], autojunk=False)
+    return [
+        (tag, a0 + i1, a0 + i2, b0 + j1, b0 + j2)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+    ]
+
+
+def _merge_opcodes(opcodes):
+    merged = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        if i1 == i2 and j1 == j2:
+            continue
+        changed = tag != "equal"
+        if merged and (merged[-1][0] != "equal") == changed:
+            i1, j1 = merged[-1][1], merged[-1][3]
+            if changed:
+                tag = "insert" if i1 == i2 else "delete" if j1 == j2 else "replace"
+            merged[-1] = (tag, i1, i2, j1, j2)
+        else:
+            merged.append((tag, i1, i2, j1, j2))
+    return merged
+
+
+def _diff_opcodes(a_lines, b_lines, budget_ms=None):
+    if budget_ms is None:
+        budget_ms = int(_setting("diff_time_budget_ms", 200))
+    ids = {}
+    a = [ids.setdefault(line, len(ids)) for line in a_lines]
+    b = [ids.setdefault(line, len(ids)) for line in b_lines]
+    deadline = time.monotonic() + budget_ms / 1000.0
+    opcodes = []
+    stack = [("diff", 0, len(a), 0, len(b))]
+    while stack:
+        item = stack.pop()
+        tag, a0, a1, b0, b1 = item
+        if tag != "diff":
+            opcodes.append(item)
+            continue
+        prefix = 0
+        while a0 + prefix < a1 and b0 + prefix < b1 and a[a0 + prefix] == b[b0 + prefix]:
+            prefix += 1
+        suffix = 0
+        while (
+            a1 - suffix > a0 + prefix
+            and b1 - suffix > b0 + prefix
+            and a[a1 - suffix - 1] == b[b1 - suffix - 1]
+        ):
+            suffix += 1
+        parts = []
+        if prefix:
+            parts.append(("equal", a0, a0 + prefix, b0, b0 + prefix))
+        m0, m1, n0, n1 = a0 + prefix, a1 - suffix, b0 + prefix, b1 - suffix
+        if m0 < m1 or n0 < n1:
+            parts.extend(_split_segment(a, b, m0, m1, n0, n1, deadline))
+        if suffix:
+            parts.append(("equal", a1 - suffix, a1, b1 - suffix, b1))
+        stack.extend(reversed(parts))
+    return _merge_opcodes(opcodes)
+
+
+def _diff_hunks(opcodes):
+    return [op for op in opcodes if op[0] != "equal"]
+
+
+def _build_diff_html(original_text, new_text, opcodes=None):
+    a_lines = original_text.split("\n")
+    b_lines = new_text.split("\n")
+    if opcodes is None:
+        opcodes = _diff_opcodes(a_lines, b_lines)
+    rendered = []
+    budget = DIFF_MAX_RENDER_LINES
+    hunks = _diff_hunks(opcodes)
+    for index, (tag, i1, i2, j1, j2) in enumerate(opcodes):
+        if budget <= 0:
+            remaining = sum(1 for op in opcodes[index:] if op[0] != "equal")
+            rendered.append("… 이하 {}개 변경 구간 생략 …".format(remaining))
+            break
+        if tag == "equal":
+            size = i2 - i1
+            head = DIFF_CONTEXT_LINES if index else 0
+            tail = DIFF_CONTEXT_LINES if index < len(opcodes) - 1 else 0
+            if size <= head + tail + 1:
+                rendered.extend(" " + line for line in a_lines[i1:i2])
+            else:
+                rendered.extend(" " + line for line in a_lines[i1:i1 + head])
+                rendered.append("… {}줄 변경 없음 …".format(size - head - tail))
+                rendered.extend(" " + line for line in a_lines[i2 - tail:i2])
+            budget -= min(size, head + tail + 1)
+            continue
+        removed = ["-" + line for line in a_lines[i1:i2]]
+        added = ["+" + line for line in b_lines[j1:j2]]
+        chunk = (removed + added)[:max(budget, 1)]
+        rendered.extend(chunk)
+        budget -= len(chunk)
+    escaped = html.escape("\n".join(rendered))
+    return (
+        "<div>{}개 변경 구간</div><pre>{}</pre>"
+        "<a href='accept'>수락</a> · <a href='reject'>거부</a>"
+    ).format(len(hunks), escaped)
+
+
+class _DiffPreview(object):
+    KEY = "ai_agent_diff"
+
+    def __init__(self, view, region, original_text, new_text, opcodes):
+        self.view = view
+        self.original_lines = original_text.split("\n")
+        self.new_lines = new_text.split("\n")
+        self.original_size = len(original_text)
+        self.opcodes = opcodes
+        self.hunks = _diff_hunks(opcodes)
+        self.decisions = [None] * len(self.hunks)
+        self.folded = False
+        view.add_regions(self.KEY + "_target", [region], "", "", sublime.HIDDEN)
+
+    def target(self):
+        regions = self.view.get_regions(self.KEY + "_target")
+        return regions[0] if regions else None
+
+    def _line_point(self, target, line):
+        row = self.view.rowcol(target.begin())[0] + line
+        if line == 0:
+            return target.begin()
+        return self.view.text_point(row, 0)
+
+    def _hunk_html(self, index, hunk):
+        tag, i1, i2, j1, j2 = hunk
+        decision = self.decisions[index]
+        rows = []
+        for line in self.original_lines[i1:i2][:40]:
+            rows.append("<div style='background-color:#ffe6e6;'>- {}</div>".format(html.escape(line)))
+        for line in self.new_lines[j1:j2][:40]:
+            rows.append("<div style='background-color:#e6ffe6;'>+ {}</div>".format(html.escape(line)))
+        hidden = max(0, i2 - i1 - 40) + max(0, j2 - j1 - 40)
+        if hidden:
+            rows.append("<div>… {}줄 더 있음 …</div>".format(hidden))
+        status = {True: "✔ 수락됨", False: "✘ 거부됨", None: ""}[decision]
+        return (
+            "<div style='font-family:monospace; font-size:12px; padding:4px; "
+            "border-left:3px solid #6a9fdb;'>"
+            "<div><strong>변경 {}/{}</strong> {} "
+            "<a href='accept:{}'>수락</a> · <a href='reject:{}'>거부</a></div>"
+            "{}</div>"
+        ).format(index + 1, len(self.hunks), status, index, index, "".join(rows))
+
+    def _header_html(self):
+        accepted = sum(1 for d in self.decisions if d)
+        return (
+            "<div style='font-family:-apple-system; font-size:12px; padding:4px;'>"
+            "<strong>편집 제안</strong> 변경 {}개 (수락 {}) · "
+            "<a href='accept_all'>모두 수락</a> · <a href='reject_all'>모두 거부</a> · "
+            "<a href='apply'>선택 적용</a> · <a href='fold'>{}</a> · <a href='close'>✕</a>"
+            "</div>"
+        ).format(len(self.hunks), accepted, "변경 없는 구간 펼치기" if self.folded else "변경 없는 구간 접기")
+
+    def render(self):
+        target = self.target()
+        if target is None:
+            return
+        self.view.erase_phantoms(self.KEY)
+        self.view.add_phantom(
+            self.KEY, sublime.Region(target.begin()), self._header_html(),
+            sublime.LAYOUT_BLOCK, on_navigate=self.on_navigate
+        )
+        removed = []
+        for index, hunk in enumerate(self.hunks):
+            tag, i1, i2, j1, j2 = hunk
+            anchor = self._line_point(target, max(0, i1 - 1)) if i1 else target.begin()
+            anchor_line = self.view.line(anchor)
+            self.view.add_phantom(
+                self.KEY, sublime.Region(anchor_line.end()), self._hunk_html(index, hunk),
+                sublime.LAYOUT_BLOCK, on_navigate=self.on_navigate
+            )
+            if i2 > i1:
+                start = self._line_point(target, i1)
+                end = self.view.line(self._line_point(target, i2 - 1)).end()
+                removed.append(sublime.Region(start, min(end, target.end())))
+        self.view.add_regions(
+            self.KEY + "_removed", removed, "markup.deleted", "", sublime.DRAW_NO_FILL
+        )
+
+    def _equal_regions(self, target):
+        regions = []
+        for tag, i1, i2, _, _ in self.opcodes:
+            if tag != "equal" or i2 - i1 <= 2 * DIFF_CONTEXT_LINES:
+                continue
+            start = self._line_point(target, i1 + DIFF_CONTEXT_LINES)
+            end = self.view.line(self._line_point(target, i2 - DIFF_CONTEXT_LINES - 1)).end()
+            regions.append(sublime.Region(start, end))
+        return regions
+
+    def toggle_fold(self):
+        target = self.target()
+        if target is None:
+            return
+        regions = self._equal_regions(target)
+        if self.folded:
+            self.view.unfold(regions)
+        else:
+            self.view.fold(regions)
+        self.folded = not self.folded
+        self.render()
+
+    def merged_text(self):
+        lines = []
+        cursor = 0
+        for decision, (tag, i1, i2, j1, j2) in zip(self.decisions, self.hunks):
+            lines.extend(self.original_lines[cursor:i1])
+            if decision:
+                lines.extend(self.new_lines[j1:j2])
+            else:
+                lines.extend(self.original_lines[i1:i2])
+            cursor = i2
+        lines.extend(self.original_lines[cursor:])
+        return "\n".join(lines)
+
+    def apply(self):
+        target = self.target()
+        if target is None:
+            return
+        if target.size() != self.original_size:
+            sublime.status_message("편집 대상 영역이 변경되어 적용할 수 없습니다.")
+            return
+        if any(self.decisions):
+            _store_pending_changes(self.view, [{
+                "range": [target.begin(), target.end()],
+                "newText": self.merged_text()
+            }])
+            self.close()
+            self.view.run_command("ai_agent_apply_pending")
+        else:
+            self.close()
+
+    def close(self):
+        target = self.target()
+        if self.folded and target is not None:
+            self.view.unfold(self._equal_regions(target))
+        self.view.erase_phantoms(self.KEY)
+        self.view.erase_regions(self.KEY + "_removed")
+        self.view.erase_regions(self.KEY + "_target")
+        state = _view_state(self.view)
+        if state.diff_preview is self:
+            state.diff_preview = None
+
+    def on_navigate(self, href):
+        action, _, arg = href.partition(":")
+        if action in ("accept", "reject") and arg:
+            self.decisions[int(arg)] = action == "accept"
+            if all(d is not None for d in self.decisions):
+                self.apply()
+            else:
+                self.render()
+        elif action == "accept_all":
+            self.decisions = [True] * len(self.hunks)
+            self.apply()
+        elif action == "reject_all":
+            self.decisions = [False] * len(self.hunks)
+            self.close()
+        elif action == "apply":
+            self.apply()
+        elif action == "fold":
+            self.toggle_fold()
+        elif action == "close":
+            self.close()
+
+
+def _show_diff_preview(view, region, original_text, new_text):
+    opcodes = _diff_opcodes(original_text.split("\n"), new_text.split("\n"))
 
+    def show():
+        state = _view_state(view)
+        if state.diff_preview is not None:
+            state.diff_preview.close()
+        preview = _DiffPreview(view, region, original_text, new_text, opcodes)
+        if not preview.hunks:
+            preview.close()
+            sublime.status_message("제안된 변경 사항이 없습니다.")
+            return
+        state.diff_preview = preview
+        preview.render()
 
-def _show_confirm_popup(view, html_content, on_navigate):
-    if view is None:
-        return
-    region = view.sel()[0] if view.sel() else sublime.Region(0, 0)
-    view.add_phantom(
-        "ai_agent_terminal_approval",
-        region,
-        html_content,
-        sublime.LAYOUT_BLOCK,
-        on_navigate=on_navigate
-    )
+    sublime.set_timeout(show, 0)
 
 
-def _hide_confirm_popup(view):
-    if view is None:
-        return
-    view.erase_phantoms("ai_agent_terminal_approval")
+_FENCE_RE = re.compile(r"^```[^\n`]*\n", re.MULTILINE)
+_FENCE_END_RE = re.compile(r"^```[ \t]*$", re.MULTILINE)
 
 
-def _extract_terminal_commands(text):
-    commands = []
-    for match in re.finditer(r"```(?:bash|sh|shell)\n(.*?)```", text, re.S):
-        cmd = match.group(1).strip()
-        if cmd:
-            commands.append(cmd)
-    for line in text.splitlines():
-        if line.lower().startswith("terminal:"):
-            cmd = line.split(":", 1)[1].strip()
-            if cmd:
-                commands.append(cmd)
-    return commands
+def _extract_replacement(text):
+    opening = _FENCE_RE.search(text)
+    if opening is None:
+        return None, False
+    body = text[opening.end():]
+    closing = _FENCE_END_RE.search(body)
+    if closing is not None:
+        return body[:closing.start()].rstrip("\n"), True
+    return body[:body.rfind("\n") + 1].rstrip("\n") if "\n" in body else "", False
 
 
-def _enqueue_terminal_commands(view, commands):
-    if view is None:
-        return
-    queue = view.settings().get("ai_agent_terminal_queue") or []
-    seen = set(view.settings().get("ai_agent_terminal_seen") or [])
-    for cmd in commands:
-        if cmd not in seen:
-            seen.add(cmd)
-            queue.append(cmd)
-    view.settings().set("ai_agent_terminal_queue", queue)
-    view.settings().set("ai_agent_terminal_seen", list(seen))
+def _consumed_lines(opcodes, streamed):
+    if not opcodes:
+        return 0
+    tag, i1, i2, j1, j2 = opcodes[-1]
+    if j2 == streamed and tag == "delete":
+        return i1
+    if j2 == streamed and tag == "replace":
+        return min(i2, i1 + j2 - j1)
+    return i2
 
 
-def _process_terminal_queue(view):
-    if view is None:
-        return
-    if view.settings().get("ai_agent_terminal_active"):
-        return
-    queue = view.settings().get("ai_agent_terminal_queue") or []
-    if not queue:
-        return
-    policy = view.settings().get("ai_agent_terminal_policy") or "ask"
-    command = queue[0]
+class _StreamingEditPreview(object):
+    KEY = "ai_agent_edit_stream"
 
-    if policy == "deny":
-        queue.pop(0)
-        view.settings().set("ai_agent_terminal_queue", queue)
-        _process_terminal_queue(view)
-        return
+    def __init__(self, view, region, original_text, metrics=None):
+        self.view = view
+        self.original_text = original_text
+        self.original_lines = original_text.split("\n")
+        self.metrics = metrics
+        self.step = max(1, int(_setting("edit_preview_lines", 8)))
+        self.chunks = []
+        self.newlines = 0
+        self.next_check = 1
+        self.early_text = None
+        self.closed = False
+        self._lock = threading.Lock()
+        view.add_regions(self.KEY + "_target", [region], "", "", sublime.HIDDEN)
 
-    def run_command(approve, always_policy=None):
-        if always_policy:
-            view.settings().set("ai_agent_terminal_policy", always_policy)
-        view.settings().set("ai_agent_terminal_active", True)
+    def target(self):
+        regions = self.view.get_regions(self.KEY + "_target")
+        return regions[0] if regions else None
 
-        def worker():
-            request, error = _request_terminal(command)
-            if error:
-                sublime.set_timeout(
-                    lambda: _show_output_panel(view.window(), "\n[오류] " + error + "\n"), 0
-                )
-                finish()
+    def feed(self, chunk):
+        with self._lock:
+            if self.closed:
                 return
-            request_id = request.get("id")
-            if not request_id:
-                sublime.set_timeout(
-                    lambda: _show_output_panel(view.window(), "\n[오류] 요청 ID 없음\n"), 0
-                )
-                finish()
+            self.chunks.append(chunk)
+            self.newlines += chunk.count("\n")
+            if self.newlines < self.next_check:
                 return
+            text = "".join(self.chunks)
+            self.chunks = [text]
+            self.next_check = self.newlines + 1
+        replacement, done = _extract_replacement(text)
+        if replacement is None:
+            return
+        streamed = replacement.split("\n") if replacement else []
+        if not streamed:
+            return
+        with self._lock:
+            self.next_check = self.newlines + self.step
+        opcodes = _diff_opcodes(self.original_lines, streamed)
+        consumed = _consumed_lines(opcodes, len(streamed))
+        early_text = "\n".join(streamed + self.original_lines[consumed:])
+        diff_html = _build_diff_html(self.original_text, early_text)
+        content = self._html(len(streamed), consumed, done, diff_html)
+        if self.metrics is not None:
+            self.metrics.dispatch(lambda: self._render(early_text, content))
+        else:
+            sublime.set_timeout(lambda: self._render(early_text, content), 0)
 
-            result, exec_error = _execute_terminal(request_id, approve)
-            if exec_error:
-                _show_output_panel(view.window(), "\n[오류] " + exec_error + "\n")
-            else:
-                if not result.get("ok"):
-                    _show_output_panel(view.window(), "\n[정보] 실행이 거부되었습니다.\n")
-                else:
-                    res = result.get("result", {})
-                    output = (
-                        "\n[터미널 결과]\n"
-                        "command: {}\n"
-                        "exitCode: {}\n"
-                        "stdout:\n{}\n"
-                        "stderr:\n{}\n"
-                    ).format(command, res.get("exitCode"), res.get("stdout"), res.get("stderr"))
-                    _show_output_panel(view.window(), output)
-                    session_id = view.settings().get("ai_agent_last_session_id")
-                    if session_id:
-                        _append_session_message(session_id, "tool", output)
-            finish()
-
-        def finish():
-            queue.pop(0)
-            view.settings().set("ai_agent_terminal_queue", queue)
-            view.settings().set("ai_agent_terminal_active", False)
-            _process_terminal_queue(view)
-
-        threading.Thread(target=worker, daemon=True).start()
-
-    if policy == "allow":
-        run_command(True)
-        return
+    def final_text(self):
+        with self._lock:
+            text = "".join(self.chunks)
+        return _extract_replacement(text)[0]
 
-    safe_command = html.escape(command)
-    popup_html = (
-        "<div style='font-family:-apple-system; font-size:12px;'>"
-        "<div style='display:flex; justify-content:space-between; align-items:center;'>"
-        "<h3 style='margin:0;'>터미널 실행 승인</h3>"
-        "<a href='close' style='text-decoration:none;'>✕</a>"
-        "</div>"
-        "<div style='margin:8px 0;'>아래 명령을 실행할까요?</div>"
-        "<pre style='background:#f6f6f6; padding:8px; border-radius:6px;'>"
-        "{}"
-        "</pre>"
-        "<a href='approve'>승인</a> · <a href='reject'>거부</a>"
-        "<br>"
-        "<a href='always_allow'>항상 허용</a> · <a href='always_deny'>항상 거부</a>"
-        "</div>"
-    ).format(safe_command)
+    def _html(self, streamed, consumed, done, diff_html):
+        status = "수신 완료" if done else "수신 중"
+        return (
+            "<div style='font-family:-apple-system; font-size:12px; padding:4px; "
+            "border-left:3px solid #6a9fdb;'>"
+            "<div><strong>편집 미리보기</strong> {} · 제안 {}줄 (원본 {}/{}줄 대응) · "
+            "<a href='abort'>중단</a></div>{}</div>"
+        ).format(status, streamed, consumed, len(self.original_lines), diff_html)
 
-    def on_navigate(href):
-        if href == "close":
-            _hide_confirm_popup(view)
+    def _render(self, early_text, content):
+        target = self.target()
+        if self.closed or target is None:
             return
-        if href == "approve":
-            _hide_confirm_popup(view)
-            run_command(True)
-            return
-        if href == "reject":
-            _hide_confirm_popup(view)
-            run_command(False)
-            return
-        if href == "always_allow":
-            _hide_confirm_popup(view)
-            run_command(True, "allow")
+        if self.metrics is not None:
+            self.metrics.mark("firstPreview")
+        self.early_text = early_text
+        self.view.erase_phantoms(self.KEY)
+        self.view.add_phantom(
+            self.KEY, sublime.Region(self.view.line(target.end()).end()), content,
+            sublime.LAYOUT_BLOCK, on_navigate=self.on_navigate
+        )
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+        self.view.erase_phantoms(self.KEY)
+        self.view.erase_regions(self.KEY + "_target")
+        state = _view_state(self.view)
+        if state.edit_preview is self:
+            state.edit_preview = None
+
+    def show_diff(self, new_text):
+        target = self.target()
+        self.close()
+        if target is None:
             return
-        if href == "always_deny":
-            _hide_confirm_popup(view)
-            run_command(False, "deny")
+        if target.size() != len(self.original_text):
+            sublime.status_message("편집 대상 영역이 변경되어 미리보기를 표시할 수 없습니다.")
             return
+        _show_diff_preview(self.view, target, self.original_text, new_text)
 
-    _show_confirm_popup(view, popup_html, on_navigate)
+    def on_navigate(self, href):
+        if href == "accept" and self.early_text is not None:
+            _get_request_manager().cancel(view_id=self.view.id())
+            self.show_diff(self.early_text)
+        elif href in ("abort", "reject"):
+            _get_request_manager().cancel(view_id=self.view.id())
+            self.close()
+            sublime.status_message("편집 요청을 중단했습니다.")
 
 
-def _maybe_trigger_terminal(view, chunk):
-    if view is None:
-        return
-    buffer = view.settings().get("ai_agent_response_buffer") or ""
-    buffer += chunk
-    view.settings().set("ai_agent_response_buffer", buffer)
-    commands = _extract_terminal_commands(buffer)
-    if commands:
-        _enqueue_terminal_commands(view, commands)
-        _process_terminal_queue(view)
+_edit_journals = {}
 
 
+def _record_text_changes(buffer_id, change_count, changes):
+    journal = _edit_journals.get(buffer_id)
+    if journal is None:
+        journal = collections.deque(maxlen=5000)
+        _edit_journals[buffer_id] = journal
+    for begin, end, inserted in changes:
+        journal.append((change_count, begin, end, inserted))
 
-def _show_history_popup(view, html_content, on_navigate=None):
-    def _default_navigate(href):
-        if href == "close":
-            view.hide_popup()
 
-    view.show_popup(
-        html_content,
-        max_width=900,
-        max_height=600,
-        flags=0,
-        on_navigate=on_navigate or _default_navigate
+def _normalize_changes(changes, size):
+    valid = []
+    problems = []
+    for change in changes:
+        span = change.get("range")
+        if (
+            not isinstance(span, (list, tuple))
+            or len(span) != 2
+            or not all(isinstance(value, int) for value in span)
+            or not 0 <= span[0] <= span[1] <= size
+        ):
+            problems.append("잘못된 범위: {}".format(span))
+            continue
+        valid.append({"range": [span[0], span[1]], "newText": change.get("newText", "")})
+    valid.sort(key=lambda change: (change["range"][0], change["range"][1]))
+    ordered = []
+    for change in valid:
+        if ordered and change["range"][0] < ordered[-1]["range"][1]:
+            problems.append("겹치는 범위: {}".format(change["range"]))
+            continue
+        ordered.append(change)
+    return ordered, problems
+
+
+def _rebase_changes(view, changes, base_count):
+    current = view.change_count()
+    if current == base_count:
+        return changes, []
+    journal = _edit_journals.get(view.buffer_id())
+    entries = [entry for entry in (journal or ()) if entry[0] > base_count]
+    if not entries or entries[0][0] > base_count + 1:
+        return [], ["요청 이후 버퍼가 변경되어 적용할 수 없습니다."]
+    rebased = []
+    problems = []
+    for change in changes:
+        start, end = change["range"]
+        conflict = False
+        for _, begin, old_end, inserted in entries:
+            if end <= begin and not (start == end == begin):
+                continue
+            if start >= old_end:
+                shift = inserted - (old_end - begin)
+                start += shift
+                end += shift
+                continue
+            conflict = True
+            break
+        if conflict:
+            problems.append("편집 중 변경된 범위: {}".format(change["range"]))
+            continue
+        rebased.append({"range": [start, end], "newText": change["newText"]})
+    return rebased, problems
+
+
+def _prepare_changes(view, changes, base_count, base_size=None):
+    if base_size is None:
+        base_size = view.size()
+    ordered, problems = _normalize_changes(changes, base_size)
+    rebased, rebase_problems = _rebase_changes(view, ordered, base_count)
+    return rebased, problems + rebase_problems
+
+
+def _store_pending_changes(view, changes, change_count=None):
+    if change_count is None:
+        change_count = view.change_count()
+    _view_state(view).pending_changes = {"changes": changes, "changeCount": change_count}
+
+
+def _apply_pending_changes(view, edit):
+    state = _view_state(view)
+    pending = state.pending_changes
+    state.pending_changes = None
+    if not pending:
+        return
+    changes, problems = _prepare_changes(
+        view, pending["changes"], pending["changeCount"], view.size()
     )
+    for change in reversed(changes):
+        start, end = change["range"]
+        view.replace(edit, sublime.Region(start, end), change["newText"])
+    if problems:
+        sublime.status_message(
+            "변경 {}건 적용, {}건 건너뜀: {}".format(len(changes), len(problems), problems[0])
+        )
 
 
-def _show_chat_popup(view, html_content, on_navigate=None):
-    return
+PROJECT_REVIEW_PROMPT = (
+    "이 파일을 리뷰해줘. 문제마다 한 줄씩 `[심각도] line 줄번호: 설명` 형식으로 답해줘. "
+    "심각도는 critical, major, minor, info 중 하나로 쓰고, 문제가 없으면 `[info] 문제 없음`이라고 답해줘."
+)
+SEVERITY_ORDER = {"critical": 0, "major": 1, "minor": 2, "info": 3}
+_FINDING_RE = re.compile(
+    r"^\s*(?:[-*]\s*)?\[(critical|major|minor|info)\]\s*"
+    r"(?:(?:line|lines|l|줄)\s*(\d+)(?:\s*-\s*\d+)?)?\s*[:：\-]?\s*(.+)$",
+    re.IGNORECASE
+)
 
 
-def _append_chat_popup(view, chunk):
-    return
+def _parse_findings(text):
+    findings = []
+    for raw in text.splitlines():
+        match = _FINDING_RE.match(raw.replace("`", ""))
+        if not match:
+            continue
+        severity, line, message = match.groups()
+        findings.append({
+            "severity": severity.lower(),
+            "line": int(line) if line else None,
+            "message": message.strip()
+        })
+    if not findings and text.strip():
+        findings.append({"severity": "info", "line": None, "message": " ".join(text.split())[:300]})
+    return findings
 
 
-def _fetch_session_messages(session_id):
-    try:
-        conn = http.client.HTTPConnection(SERVER_HOST, SERVER_PORT, timeout=30)
-        conn.request("GET", "/api/agent/sessions/{}".format(session_id))
-        resp = conn.getresponse()
-        if resp.status != 200:
-            return None, "세션 조회 실패: {}".format(resp.status)
-        body = resp.read().decode("utf-8")
-        conn.close()
-        data = json.loads(body)
-        return data.get("messages", []), None
-    except Exception as e:
-        return None, str(e)
+def _matches_any(rel_path, patterns):
+    name = rel_path.rsplit("/", 1)[-1]
+    return any(fnmatch.fnmatch(name, p) or fnmatch.fnmatch(rel_path, p) for p in patterns)
 
-def _format_role(role):
-    if role == "user":
-        return USER_LABEL
-    if role == "assistant":
-        return ASSISTANT_LABEL
-    return role
 
+def _walk_project(folders, include, exclude, max_bytes, max_files):
+    files, skipped = [], collections.Counter()
+    for folder in folders:
+        for root, dirs, names in os.walk(folder):
+            rel_root = os.path.relpath(root, folder).replace(os.sep, "/")
+            rel_root = "" if rel_root == "." else rel_root + "/"
+            dirs[:] = sorted(d for d in dirs if not _matches_any(rel_root + d, exclude))
+            for name in sorted(names):
+                rel_path = rel_root + name
+                if not _matches_any(rel_path, include) or _matches_any(rel_path, exclude):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    size = os.path.getsize(path)
+                except OSError:
+                    continue
+                if size > max_bytes:
+                    skipped["tooLarge"] += 1
+                    continue
+                if len(files) >= max_files:
+                    skipped["overLimit"] += 1
+                    continue
+                files.append((path, rel_path))
+    return files, skipped
 
-def _role_bg(role):
-    if role == "user":
-        return USER_BG
-    if role == "assistant":
-        return ASSISTANT_BG
-    return "#ffffff"
 
+class _ProjectReviewStore(object):
+    def __init__(self, path):
+        self.path = path
+        self._entries = None
+        self._lock = threading.Lock()
 
-def _message_html(role, created_at, content):
-    safe_content = html.escape(content).replace("\n", "<br>")
-    safe_role = html.escape(_format_role(role))
-    safe_time = html.escape(created_at)
-    bg = _role_bg(role)
-    return (
-        "<div style='background-color:{}; padding:6px; margin:6px 0; "
-        "border-radius:6px; font-family: -apple-system; font-size:12px;'>"
-        "<div><strong>[{}]</strong> {} </div>"
-        "<div>{}</div>"
-        "</div>"
-    ).format(bg, safe_role, safe_time, safe_content)
+    def _load(self):
+        if self._entries is not None:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            self._entries = {}
 
+    def get(self, path, digest):
+        with self._lock:
+            self._load()
+            entry = self._entries.get(path)
+        if entry and entry.get("hash") == digest:
+            return entry
+        return None
 
-def _fetch_sessions():
-    try:
-        conn = http.client.HTTPConnection(SERVER_HOST, SERVER_PORT, timeout=30)
-        conn.request("GET", "/api/agent/sessions")
-        resp = conn.getresponse()
-        if resp.status != 200:
-            return None, "세션 목록 조회 실패: {}".format(resp.status)
-        body = resp.read().decode("utf-8")
-        conn.close()
-        data = json.loads(body)
-        return data, None
-    except Exception as e:
-        return None, str(e)
+    def put(self, path, digest, findings):
+        with self._lock:
+            self._load()
+            self._entries[path] = {"hash": digest, "reviewedAt": _utc_now(), "findings": findings}
 
+    def save(self):
+        with self._lock:
+            if self._entries is None:
+                return
+            data = json.dumps(self._entries)
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "w", encoding="utf-8") as f:
+                f.write(data)
+        except OSError:
+            pass
 
-def _build_diff_html(original_text, new_text):
-    diff = difflib.unified_diff(
-        original_text.splitlines(),
-        new_text.splitlines(),
-        lineterm=""
-    )
-    diff_text = "\n".join(diff)
-    escaped = html.escape(diff_text)
-    return "<pre>{}</pre><a href='accept'>수락</a> · <a href='reject'>거부</a>".format(escaped)
 
+class _ProjectReview(object):
+    def __init__(self, window, refresh=False):
+        self.window = window
+        self.refresh = refresh
+        self.concurrency = max(1, int(_setting("project_review_concurrency", 4)))
+        self.store = _ProjectReviewStore(
+            os.path.join(sublime.cache_path(), "AiAgent", "project-review.json")
+        )
+        self.results = []
+        self.cancelled = False
+        self.done = 0
+        self.total = 0
+        self.counts = collections.Counter()
+        self._lock = threading.Lock()
 
-def _store_pending_changes(view, changes):
-    view.settings().set("ai_agent_pending_changes", changes)
+    def start(self):
+        folders = self.window.folders()
+        if not folders:
+            sublime.status_message("프로젝트 폴더가 없습니다.")
+            return
+        _run_in_background(self._run, folders)
 
+    def _progress(self, message):
+        _show_output_panel(self.window, "[프로젝트 리뷰] " + message + "\n")
+
+    def _run(self, folders):
+        started = time.monotonic()
+        files, skipped = _walk_project(
+            folders,
+            _setting("project_review_include", ["*"]),
+            _setting("project_review_exclude", []),
+            int(_setting("project_review_max_file_bytes", 24000)),
+            int(_setting("project_review_max_files", 200))
+        )
+        self.counts.update(skipped)
+        pending = []
+        for path, rel_path in files:
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+                if b"\0" in data[:4096]:
+                    self.counts["binary"] += 1
+                    continue
+                text = data.decode("utf-8")
+            except (OSError, UnicodeDecodeError):
+                self.counts["unreadable"] += 1
+                continue
+            digest = _content_hash(text)
+            entry = None if self.refresh else self.store.get(path, digest)
+            if entry is not None:
+                self.counts["unchanged"] += 1
+                self.results.append((path, rel_path, entry["findings"], True))
+                continue
+            pending.append((path, rel_path, text, digest))
+        self.total = len(pending)
+        self._progress("\n{}개 파일 리뷰 시작 (동시 {}개, 변경 없음 {}개 건너뜀)".format(
+            self.total, self.concurrency, self.counts["unchanged"]
+        ))
+        if pending:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                list(executor.map(self._review_file, pending))
+        self.store.save()
+        elapsed = time.monotonic() - started
+        self._progress("완료: {}/{}개, {:.1f}s ({:.2f} 파일/s){}".format(
+            self.done,
+            self.total,
+            elapsed,
+            self.done / elapsed if elapsed else 0.0,
+            " - 취소됨" if self.cancelled else ""
+        ))
+        sublime.set_timeout(self._show_report, 0)
+
+    def _review_file(self, item):
+        path, rel_path, text, digest = item
+        if self.cancelled:
+            return
+        manager = _get_request_manager()
+        handle = manager.track(None, self.window.id(), "project")
+        context = {"file": path, "selection": text, "range": [0, len(text)]}
+        payload = _build_rpc_request(PROJECT_REVIEW_PROMPT, context, stream=True)
+        reply = {"deltas": [], "result": None, "error": None}
+        started = time.monotonic()
+
+        def on_start(session_id):
+            pass
+
+        def on_final(result):
+            reply["result"] = result
+
+        def on_error(message):
+            reply["error"] = message
+
+        try:
+            _send_streaming_rpc(
+                payload,
+                on_start,
+                reply["deltas"].append,
+                on_final,
+                on_error,
+                context_key=path,
+                handle=handle,
+                metrics=_RequestMetrics("project")
+            )
+        finally:
+            manager.close(handle)
+        if handle.cancelled:
+            self.cancelled = True
+            return
+        result = reply["result"] or {}
+        content = result.get("content") if result.get("type") == "message" else None
+        failed = bool(reply["error"]) or content is None
+        with self._lock:
+            self.done += 1
+            position = self.done
+            if failed:
+                self.counts["failed"] += 1
+        if failed:
+            self._progress("({}/{}) {} - 실패: {}".format(
+                position, self.total, rel_path, reply["error"] or "응답 없음"
+            ))
+            return
+        findings = _parse_findings(content or "".join(reply["deltas"]))
+        self.store.put(path, digest, findings)
+        with self._lock:
+            self.results.append((path, rel_path, findings, False))
+        issues = [f for f in findings if f["severity"] != "info"]
+        self._progress("({}/{}) {} - 이슈 {}건 ({:.1f}s)".format(
+            position, self.total, rel_path, len(issues), time.monotonic() - started
+        ))
+
+    def _show_report(self):
+        rows = []
+        for path, rel_path, findings, unchanged in self.results:
+            for finding in findings:
+                rows.append((SEVERITY_ORDER.get(finding["severity"], 9), rel_path, path, finding, unchanged))
+        rows.sort(key=lambda row: (row[0], row[1], row[3]["line"] or 0))
+        severities = collections.Counter(row[3]["severity"] for row in rows)
+        lines = [
+            "AI Agent 프로젝트 리뷰 ({})\n".format(_utc_now()),
+            "파일 {}개 (새로 리뷰 {}개, 변경 없음 {}개) · {}\n".format(
+                len(self.results),
+                len(self.results) - self.counts["unchanged"],
+                self.counts["unchanged"],
+                ", ".join("{} {}".format(k, severities[k]) for k in SEVERITY_ORDER if severities[k])
+            ),
+            "더블클릭하면 해당 위치로 이동합니다.\n"
+        ]
+        current = None
+        for _, rel_path, path, finding, unchanged in rows:
+            if finding["severity"] != current:
+                current = finding["severity"]
+                lines.append("\n## {}\n".format(current))
+            lines.append("{}:{}: {}{}\n".format(
+                path,
+                finding["line"] or 1,
+                finding["message"],
+                " (이전 리뷰)" if unchanged else ""
+            ))
+        view = self.window.new_file()
+        view.set_name("AI Agent Project Review")
+        view.set_scratch(True)
+        view.settings().set("result_file_regex", r"^(.+?):(\d+): ")
+        view.settings().set("word_wrap", False)
+        view.run_command("append", {"characters": "".join(lines)})
+        view.set_read_only(True)
 
-def _apply_pending_changes(view, edit):
-    changes = view.settings().get("ai_agent_pending_changes") or []
-    for change in changes:
-        start, end = change.get("range", [0, 0])
-        region = sublime.Region(start, end)
-        view.replace(edit, region, change.get("newText", ""))
-    view.settings().erase("ai_agent_pending_changes")
+
+def _continuation_session(state):
+    # 대화가 너무 길어지면 서버가 매 턴 읽는 기록과 프롬프트가 커지므로 새 세션에서 시작한다.
+    if not state.chat_session_id or not _setting("chat_continue_session", True):
+        return None, None
+    turns, chars = state.session_usage
+    if turns >= _setting("chat_session_max_turns", 20) or chars >= _setting("chat_session_max_chars", 60000):
+        state.clear_chat_session()
+        return None, "[새 세션] 대화가 길어져 새 세션에서 시작합니다 ({}턴, {}자).\n".format(turns, chars)
+    return state.chat_session_id, None
 
 
 class AiAgentChatCommand(sublime_plugin.WindowCommand):
@@ -416,51 +4934,67 @@ class AiAgentChatCommand(sublime_plugin.WindowCommand):
             return
 
         file_path = view.file_name()
-        full_text = view.substr(sublime.Region(0, view.size()))
-        context = {
-            "file": file_path,
-            "selection": full_text,
-            "range": [0, view.size()]
-        }
+        context = _build_context(view)
+        session_id, notice = _continuation_session(_view_state(view))
 
-        payload = _build_rpc_request(text, context, stream=True, request_id=1)
+        payload = _build_rpc_request(
+            text, context, stream=True, request_id=1, session_id=session_id, mode="chat"
+        )
+        metrics = _RequestMetrics("chat")
+
+        prompt_header = "\n{}[에이전트에게 요청]\n{}\n\n[응답]\n".format(notice or "", text)
+        _show_output_panel(self.window, prompt_header)
 
-        prompt_header = "\n[에이전트에게 요청]\n{}\n\n[응답]\n".format(text)
-        sublime.set_timeout(lambda: _show_output_panel(self.window, prompt_header), 0)
+        turn = {"sessionId": None}
 
         def on_start(session_id):
-            if session_id:
-                view.settings().set("ai_agent_last_session_id", session_id)
-            view.settings().set("ai_agent_terminal_active", False)
-            view.settings().set("ai_agent_terminal_queue", [])
-            view.settings().set("ai_agent_terminal_seen", [])
-            view.settings().erase("ai_agent_response_buffer")
+            turn["sessionId"] = session_id
+
+            def start():
+                state = _view_state(view)
+                state.reset_stream(session_id)
+                state.set_chat_session_id(session_id)
+            metrics.dispatch(start)
 
         def on_delta(chunk):
-            sublime.set_timeout(lambda: _show_output_panel(self.window, chunk), 0)
-            sublime.set_timeout(lambda: _maybe_trigger_terminal(view, chunk), 0)
+            _show_output_panel(self.window, chunk)
+            metrics.dispatch(lambda: _maybe_trigger_terminal(view, chunk))
 
         def on_final(result):
+            _record_turn(turn["sessionId"], text, result)
+            if result:
+                usage = len(text) + len(result.get("content") or "")
+                metrics.dispatch(lambda: _view_state(view).add_usage(usage))
             if result and result.get("type") == "message":
                 final_text = "\n\n[완료]\n" + result.get("content", "")
-                sublime.set_timeout(lambda: _show_output_panel(self.window, final_text), 0)
-                sublime.set_timeout(lambda: _maybe_trigger_terminal(view, final_text), 0)
+                _show_output_panel(self.window, final_text)
+                metrics.dispatch(lambda: _maybe_trigger_terminal(view, final_text, True))
 
         def on_error(message):
-            sublime.set_timeout(lambda: _show_output_panel(self.window, "\n[오류] " + message), 0)
+            _show_output_panel(self.window, "\n[오류] " + message)
 
-        threading.Thread(
-            target=_send_streaming_rpc,
-            args=(payload, on_start, on_delta, on_final, on_error),
-            daemon=True
-        ).start()
+        _start_agent_stream(
+            view, self.window, payload, on_start, on_delta, on_final, on_error,
+            context_key=file_path, metrics=metrics
+        )
+
+
+class AiAgentNewSessionCommand(sublime_plugin.WindowCommand):
+    def run(self):
+        view = self.window.active_view()
+        if view is None:
+            return
+        _view_state(view).clear_chat_session()
+        sublime.status_message("AI Agent: 다음 요청은 새 세션에서 시작합니다")
 
 
 class AiAgentEditCommand(sublime_plugin.TextCommand):
-    def run(self, edit):
+    def run(self, edit, refresh=False):
         selection = self.view.sel()[0]
         selected_text = self.view.substr(selection)
         file_path = self.view.file_name()
+        base_count = self.view.change_count()
+        base_size = self.view.size()
 
         context = {
             "file": file_path,
@@ -468,57 +5002,99 @@ class AiAgentEditCommand(sublime_plugin.TextCommand):
             "range": [selection.begin(), selection.end()]
         }
 
-        payload = _build_rpc_request("선택 영역을 개선해줘", context, stream=True, request_id=2)
+        prompt = "선택 영역을 개선해줘"
+        payload = _build_rpc_request(prompt, context, stream=True, request_id=2)
+        metrics = _RequestMetrics("edit")
         window = self.view.window()
+        preview = None
+        if _setting("edit_streaming_preview", True):
+            state = _view_state(self.view)
+            if state.edit_preview is not None:
+                state.edit_preview.close()
+            preview = _StreamingEditPreview(self.view, selection, selected_text, metrics)
+            state.edit_preview = preview
+
+        turn = {"sessionId": None}
 
         def on_start(session_id):
-            if session_id:
-                self.view.settings().set("ai_agent_last_session_id", session_id)
-            self.view.settings().set("ai_agent_terminal_active", False)
-            self.view.settings().set("ai_agent_terminal_queue", [])
-            self.view.settings().set("ai_agent_terminal_seen", [])
-            self.view.settings().erase("ai_agent_response_buffer")
+            turn["sessionId"] = session_id
+            metrics.dispatch(lambda: _view_state(self.view).reset_stream(session_id))
 
         def on_delta(chunk):
             if window:
-                sublime.set_timeout(lambda: _show_output_panel(window, chunk), 0)
-            sublime.set_timeout(lambda: _maybe_trigger_terminal(self.view, chunk), 0)
+                _show_output_panel(window, chunk)
+            if preview is not None:
+                preview.feed(chunk)
+            metrics.dispatch(lambda: _maybe_trigger_terminal(self.view, chunk))
 
         def on_final(result):
+            _record_turn(turn["sessionId"], prompt, result)
+            if preview is not None:
+                proposed = preview.final_text()
+                if result and result.get("type") == "message" and proposed not in (None, selected_text):
+                    metrics.dispatch(lambda: preview.show_diff(proposed))
+                else:
+                    metrics.dispatch(preview.close)
             if not result:
                 return
             if result.get("type") == "edit":
-                changes = result.get("changes", [])
-                _store_pending_changes(self.view, changes)
-                original = selected_text
-                new_text = changes[0].get("newText", "") if changes else ""
-                diff_html = _build_diff_html(original, new_text)
-                self.view.show_popup(
+                changes, problems = _prepare_changes(
+                    self.view, result.get("changes", []), base_count, base_size
+                )
+                if problems:
+                    message = "\n[정보] 편집 제안 {}건을 건너뜀: {}\n".format(
+                        len(problems), "; ".join(problems[:3])
+                    )
+                    _show_output_panel(window, message)
+                if not changes:
+                    return
+                if len(changes) == 1:
+                    start, end = changes[0]["range"]
+                    region = sublime.Region(start, end)
+                    original = self.view.substr(region)
+                    _show_diff_preview(self.view, region, original, changes[0]["newText"])
+                    return
+                change_count = self.view.change_count()
+                metrics.dispatch(lambda: _store_pending_changes(self.view, changes, change_count))
+                span_start = changes[0]["range"][0]
+                span_end = changes[-1]["range"][1]
+                original = self.view.substr(sublime.Region(span_start, span_end))
+                parts = []
+                cursor = span_start
+                for change in changes:
+                    start, end = change["range"]
+                    parts.append(original[cursor - span_start:start - span_start])
+                    parts.append(change["newText"])
+                    cursor = end
+                parts.append(original[cursor - span_start:])
+                diff_html = _build_diff_html(original, "".join(parts))
+                metrics.dispatch(lambda: self.view.show_popup(
                     diff_html,
                     max_width=800,
                     on_navigate=self._handle_diff_action
-                )
+                ))
             elif result.get("type") == "message" and window:
                 final_text = "\n\n[완료]\n" + result.get("content", "")
-                sublime.set_timeout(lambda: _show_output_panel(window, final_text), 0)
-                sublime.set_timeout(lambda: _maybe_trigger_terminal(self.view, final_text), 0)
+                _show_output_panel(window, final_text)
+                metrics.dispatch(lambda: _maybe_trigger_terminal(self.view, final_text, True))
 
         def on_error(message):
+            if preview is not None:
+                metrics.dispatch(preview.close)
             if window:
-                sublime.set_timeout(lambda: _show_output_panel(window, "\n[오류] " + message), 0)
+                _show_output_panel(window, "\n[오류] " + message)
 
-        threading.Thread(
-            target=_send_streaming_rpc,
-            args=(payload, on_start, on_delta, on_final, on_error),
-            daemon=True
-        ).start()
+        _start_agent_stream(
+            self.view, window, payload, on_start, on_delta, on_final, on_error,
+            metrics=metrics, cache=True, refresh=refresh
+        )
 
     def _handle_diff_action(self, href):
         if href == "accept":
             self.view.run_command("ai_agent_apply_pending")
             self.view.hide_popup()
         elif href == "reject":
-            self.view.settings().erase("ai_agent_pending_changes")
+            _view_state(self.view).pending_changes = None
             self.view.hide_popup()
 
 
@@ -528,45 +5104,45 @@ class AiAgentApplyPendingCommand(sublime_plugin.TextCommand):
 
 
 class AiAgentReviewCommand(sublime_plugin.TextCommand):
-    def run(self, edit):
-        full_text = self.view.substr(sublime.Region(0, self.view.size()))
+    def run(self, edit, refresh=False):
         file_path = self.view.file_name()
-        context = {
-            "file": file_path,
-            "selection": full_text,
-            "range": [0, self.view.size()]
-        }
-        payload = _build_rpc_request("전체 파일 리뷰해줘", context, stream=True, request_id=3)
+        context = _build_context(self.view)
+        prompt = "전체 파일 리뷰해줘"
+        payload = _build_rpc_request(prompt, context, stream=True, request_id=3)
+        metrics = _RequestMetrics("review")
         window = self.view.window()
 
+        turn = {"sessionId": None}
+
         def on_start(session_id):
-            if session_id:
-                self.view.settings().set("ai_agent_last_session_id", session_id)
-            self.view.settings().set("ai_agent_terminal_active", False)
-            self.view.settings().set("ai_agent_terminal_queue", [])
-            self.view.settings().set("ai_agent_terminal_seen", [])
-            self.view.settings().erase("ai_agent_response_buffer")
+            turn["sessionId"] = session_id
+            metrics.dispatch(lambda: _view_state(self.view).reset_stream(session_id))
 
         def on_delta(chunk):
             if window:
-                sublime.set_timeout(lambda: _show_output_panel(window, chunk), 0)
-            sublime.set_timeout(lambda: _maybe_trigger_terminal(self.view, chunk), 0)
+                _show_output_panel(window, chunk)
+            metrics.dispatch(lambda: _maybe_trigger_terminal(self.view, chunk))
 
         def on_final(result):
+            _record_turn(turn["sessionId"], prompt, result)
             if result and result.get("type") == "message" and window:
                 final_text = "\n\n[완료]\n" + result.get("content", "")
-                sublime.set_timeout(lambda: _show_output_panel(window, final_text), 0)
-                sublime.set_timeout(lambda: _maybe_trigger_terminal(self.view, final_text), 0)
+                _show_output_panel(window, final_text)
+                metrics.dispatch(lambda: _maybe_trigger_terminal(self.view, final_text, True))
 
         def on_error(message):
             if window:
-                sublime.set_timeout(lambda: _show_output_panel(window, "\n[오류] " + message), 0)
+                _show_output_panel(window, "\n[오류] " + message)
+
+        _start_agent_stream(
+            self.view, window, payload, on_start, on_delta, on_final, on_error,
+            context_key=file_path, metrics=metrics, cache=True, refresh=refresh
+        )
+
 
-        threading.Thread(
-            target=_send_streaming_rpc,
-            args=(payload, on_start, on_delta, on_final, on_error),
-            daemon=True
-        ).start()
+class AiAgentReviewProjectCommand(sublime_plugin.WindowCommand):
+    def run(self, refresh=False):
+        _ProjectReview(self.window, refresh=refresh).start()
 
 
 class AiAgentShowHistoryCommand(sublime_plugin.WindowCommand):
@@ -574,7 +5150,7 @@ class AiAgentShowHistoryCommand(sublime_plugin.WindowCommand):
         view = self.window.active_view()
         if view is None:
             return
-        session_id = view.settings().get("ai_agent_last_session_id")
+        session_id = _view_state(view).session_id
         if not session_id:
             _show_output_panel(self.window, "[오류] 세션 ID를 찾을 수 없습니다.\n")
             return
@@ -595,100 +5171,300 @@ class AiAgentShowHistoryCommand(sublime_plugin.WindowCommand):
             output = "".join(lines)
             sublime.set_timeout(lambda: _show_output_panel(self.window, output), 0)
 
-        threading.Thread(target=worker, daemon=True).start()
+        _run_in_background(worker)
 
 
 class AiAgentShowAllHistoryCommand(sublime_plugin.WindowCommand):
     def run(self):
         def worker():
-            sessions, error = _fetch_sessions()
+            data, error = _fetch_session_index(0, 200)
             if error:
                 sublime.set_timeout(
                     lambda: _show_output_panel(self.window, "\n[오류] " + error + "\n"), 0
                 )
                 return
+            sessions = data.get("sessions", [])
             if not sessions:
                 sublime.set_timeout(
                     lambda: _show_output_panel(self.window, "\n[정보] 세션이 없습니다.\n"), 0
                 )
                 return
-
-            lines = ["\n[전체 대화 목록]\n"]
-            html_blocks = [
-                "<div style='font-family:-apple-system; font-size:12px;'>",
-                "<div style='display:flex; justify-content:space-between; align-items:center;'>",
-                "<h3 style='margin:0;'>전체 대화 목록</h3>",
-                "<a href='close' style='text-decoration:none;'>✕</a>",
-                "</div>"
+            items = [
+                [
+                    "{} · {}개 메시지".format(session.get("updatedAt", ""), session.get("messageCount", 0)),
+                    session.get("firstPrompt", "") or session.get("id", "")
+                ]
+                for session in sessions
             ]
-            for idx, session in enumerate(sessions):
-                session_id = session.get("id", "")
-                updated_at = session.get("updatedAt", "")
-                lines.append("\n- session: {} (updated: {})\n".format(session_id, updated_at))
-                html_blocks.append(
-                    "<div style='margin-top:12px; font-weight:600;'>"
-                    "session: {} (updated: {})</div>".format(
-                        html.escape(session_id), html.escape(updated_at)
-                    )
-                )
-                messages = session.get("messages", [])
+            sublime.set_timeout(
+                lambda: self.window.show_quick_panel(
+                    items, lambda index: self.on_select(sessions, index)
+                ),
+                0
+            )
+
+        _run_in_background(worker)
+
+    def on_select(self, sessions, index):
+        if index < 0:
+            return
+        session = sessions[index]
+        session_id = session.get("id", "")
+
+        def worker():
+            lines = ["\n[대화 기록] session: {} (updated: {})\n".format(
+                session_id, session.get("updatedAt", "")
+            )]
+            offset = 0
+            while True:
+                data, error = _fetch_session_page(session_id, offset, 200)
+                if error:
+                    lines.append("[오류] " + error + "\n")
+                    break
+                messages = data.get("messages", [])
                 for message in messages:
                     role = message.get("role", "unknown")
                     content = message.get("content", "")
                     created_at = message.get("createdAt", "")
                     lines.append("[{}] {} {}\n".format(_format_role(role), created_at, content))
-                    html_blocks.append(_message_html(role, created_at, content))
-                if idx != len(sessions) - 1:
-                    lines.append("\n---\n")
-                    html_blocks.append("<hr>")
-            html_blocks.append("</div>")
-            html_content = "".join(html_blocks)
+                offset += len(messages)
+                if not messages or offset >= data.get("total", 0):
+                    break
             output = "".join(lines)
             sublime.set_timeout(lambda: _show_output_panel(self.window, output), 0)
 
-        threading.Thread(target=worker, daemon=True).start()
+        _run_in_background(worker)
 
 
-class AiAgentShowAllHistoryPopupCommand(sublime_plugin.WindowCommand):
+class AiAgentSearchHistoryCommand(sublime_plugin.WindowCommand):
     def run(self):
+        self.window.show_input_panel("대화 기록 검색", "", self.on_done, None, None)
+
+    def on_done(self, query):
+        if not query.strip():
+            return
+
         def worker():
-            sessions, error = _fetch_sessions()
+            summaries, error = _sync_history_index()
+            started = time.monotonic()
+            results = _get_history_index().search(query)
+            elapsed_ms = (time.monotonic() - started) * 1000
             if error:
                 sublime.set_timeout(
-                    lambda: _show_output_panel(self.window, "\n[오류] " + error + "\n"), 0
+                    lambda: _show_output_panel(
+                        self.window, "\n[정보] 기록 동기화 실패, 로컬 인덱스로 검색합니다: " + error + "\n"
+                    ),
+                    0
                 )
-                return
-            if not sessions:
-                sublime.set_timeout(
-                    lambda: _show_output_panel(self.window, "\n[정보] 세션이 없습니다.\n"), 0
+            sublime.set_timeout(lambda: self.show_results(query, results, summaries, elapsed_ms), 0)
+
+        _run_in_background(worker)
+
+    def show_results(self, query, results, summaries, elapsed_ms):
+        if not results:
+            sublime.status_message("'{}' 검색 결과가 없습니다.".format(query))
+            return
+        sublime.status_message("검색 결과 {}건 ({:.1f}ms)".format(len(results), elapsed_ms))
+        items = [
+            [
+                result["preview"] or "(내용 없음)",
+                "[{}] {} · session {} #{} · score {}".format(
+                    _format_role(result["role"]),
+                    result["createdAt"],
+                    result["sessionId"][:8],
+                    "-" if result["messageIndex"] is None else result["messageIndex"] + 1,
+                    result["score"]
                 )
+            ]
+            for result in results
+        ]
+
+        def on_select(index):
+            if index < 0:
                 return
+            view = self.window.active_view()
+            if view is None:
+                return
+            result = results[index]
+            summary = summaries.get(result["sessionId"]) or {
+                "id": result["sessionId"],
+                "messageCount": _get_history_index().session_count(result["sessionId"])
+            }
+            _HistoryBrowser(view).open_session(summary, result["messageIndex"])
 
-            html_blocks = [
-                "<div style='font-family:-apple-system; font-size:12px;'>",
-                "<h3>전체 대화 목록</h3>"
-            ]
-            for idx, session in enumerate(sessions):
-                session_id = session.get("id", "")
-                updated_at = session.get("updatedAt", "")
-                html_blocks.append(
-                    "<div style='margin-top:12px; font-weight:600;'>"
-                    "session: {} (updated: {})</div>".format(
-                        html.escape(session_id), html.escape(updated_at)
-                    )
-                )
-                messages = session.get("messages", [])
-                for message in messages:
-                    role = message.get("role", "unknown")
-                    content = message.get("content", "")
-                    created_at = message.get("createdAt", "")
-                    html_blocks.append(_message_html(role, created_at, content))
-                if idx != len(sessions) - 1:
-                    html_blocks.append("<hr>")
-            html_blocks.append("</div>")
-            html_content = "".join(html_blocks)
-            sublime.set_timeout(
-                lambda: _show_history_popup(self.window.active_view(), html_content), 0
+        self.window.show_quick_panel(items, on_select)
+
+
+class AiAgentShowAllHistoryPopupCommand(sublime_plugin.WindowCommand):
+    def run(self):
+        view = self.window.active_view()
+        if view is None:
+            return
+        _HistoryBrowser(view).open()
+
+
+def _format_stats(stats):
+    return ["{}: {}\n".format(key, stats[key]) for key in sorted(stats)]
+
+
+class AiAgentShowPoolStatsCommand(sublime_plugin.WindowCommand):
+    def run(self):
+        backends = _get_backends()
+        lines = []
+        for backend in backends.backends:
+            lines.append("\n[연결 풀 상태] {}\n".format(backend.name))
+            lines.extend(_format_stats(backend.pool.stats()))
+            lines.append("\n[서버 상태] {}\n".format(backend.name))
+            lines.extend(_format_stats(backend.stats()))
+            channel = backend.mux_channel()
+            if channel is not None:
+                lines.append("\n[멀티플렉스 채널] {}\n".format(backend.name))
+                lines.extend(_format_stats(channel.stats()))
+        lines.append("\n[서버 라우팅]\n")
+        routing = backends.stats()
+        routing["queued"] = len(_get_deferred_commands())
+        routing["queueExpired"] = _get_deferred_commands().expired
+        lines.extend(_format_stats(routing))
+        lines.append("\n[출력 패널 렌더링]\n")
+        lines.extend(_format_stats(_get_renderer(self.window).stats()))
+        lines.append("\n[컨텍스트 업로드]\n")
+        lines.extend(_format_stats(_context_uploader.stats()))
+        lines.append("\n[세션 컨텍스트]\n")
+        lines.extend(_format_stats(_session_contexts.stats()))
+        lines.append("\n[대화 기록 캐시]\n")
+        lines.extend(_format_stats(_get_session_cache().stats()))
+        lines.append("\n[대화 기록 검색 인덱스]\n")
+        lines.extend(_format_stats(_get_history_index().stats()))
+        lines.append("\n[스트림 디코더]\n")
+        lines.extend(_format_stats(_ndjson_stats()))
+        lines.append("\n[리뷰/편집 결과 캐시]\n")
+        lines.extend(_format_stats(_get_result_cache().stats()))
+        lines.append("\n[세션 기록 전송 큐]\n")
+        lines.extend(_format_stats(_get_session_writer().stats()))
+        _show_output_panel(self.window, "".join(lines))
+
+
+class AiAgentShowMetricsCommand(sublime_plugin.WindowCommand):
+    def run(self):
+        recorder = _get_metrics_recorder()
+        records, summary = recorder.summary()
+        if not records:
+            sublime.status_message("기록된 요청 지표가 없습니다.")
+            return
+        counts = collections.Counter((r["kind"], r["status"]) for r in records)
+        lines = ["\n[요청 지표] 최근 {}건\n".format(len(records))]
+        lines.extend(
+            "  {} / {}: {}\n".format(kind, status, count)
+            for (kind, status), count in sorted(counts.items())
+        )
+        lines.append("  {:<14}{:>10}{:>10}{:>10}{:>10}\n".format("", "p50", "p90", "p99", "max"))
+        for key in METRIC_KEYS:
+            if key not in summary:
+                continue
+            row = summary[key]
+            lines.append("  {:<14}{:>10.1f}{:>10.1f}{:>10.1f}{:>10.1f}\n".format(
+                key, row["p50"], row["p90"], row["p99"], row["max"]
+            ))
+        reused = [r["reused"] for r in records if r.get("reused") is not None]
+        if reused:
+            lines.append("  연결 재사용: {}/{}\n".format(sum(reused), len(reused)))
+        malformed = sum(r.get("malformed", 0) for r in records)
+        if malformed:
+            lines.append("  잘못된 스트림 레코드: {}건\n".format(malformed))
+        if recorder.log_path:
+            lines.append("  로그: {}\n".format(recorder.log_path))
+        _show_output_panel(self.window, "".join(lines))
+
+
+class AiAgentClearHistoryCacheCommand(sublime_plugin.WindowCommand):
+    def run(self):
+        _get_session_cache().clear()
+        sublime.status_message("대화 기록 캐시를 비웠습니다.")
+
+
+class AiAgentClearResultCacheCommand(sublime_plugin.WindowCommand):
+    def run(self):
+        _get_result_cache().clear()
+        sublime.status_message("리뷰/편집 결과 캐시를 비웠습니다.")
+
+
+class AiAgentCancelCommand(sublime_plugin.WindowCommand):
+    def run(self):
+        view = self.window.active_view()
+        manager = _get_request_manager()
+        cancelled = manager.cancel(view_id=view.id()) if view else 0
+        state = _view_states.get(view.id()) if view else None
+        if state is not None and state.edit_preview is not None:
+            state.edit_preview.close()
+        if not cancelled:
+            cancelled = manager.cancel(window_id=self.window.id())
+        if cancelled:
+            _show_output_panel(self.window, "\n[취소됨] 요청 {}건을 중단했습니다.\n".format(cancelled))
+        else:
+            sublime.status_message("진행 중인 에이전트 요청이 없습니다.")
+
+
+if hasattr(sublime_plugin, "TextChangeListener"):
+    class AiAgentEditJournalListener(sublime_plugin.TextChangeListener):
+        @classmethod
+        def is_applicable(cls, buffer):
+            return True
+
+        def on_text_changed(self, changes):
+            view = self.buffer.primary_view()
+            if view is None:
+                return
+            _record_text_changes(
+                self.buffer.id(),
+                view.change_count(),
+                [(change.a.pt, change.b.pt, len(change.str)) for change in changes]
             )
 
-        threading.Thread(target=worker, daemon=True).start()
+
+class AiAgentViewStateListener(sublime_plugin.EventListener):
+    def on_close(self, view):
+        state = _view_states.get(view.id())
+        if state is not None and state.diff_preview is not None:
+            state.diff_preview.close()
+        _drop_view_state(view)
+        if not any(other.buffer_id() == view.buffer_id() for other in _all_views(view)):
+            _edit_journals.pop(view.buffer_id(), None)
+
+
+def _all_views(closing):
+    views = []
+    for window in sublime.windows():
+        views.extend(v for v in window.views() if v.id() != closing.id())
+    return views
+
+
+class AiAgentServerStatusListener(sublime_plugin.EventListener):
+    def on_activated(self, view):
+        if _backends is not None:
+            _update_server_status(view)
+
+
+class AiAgentRendererListener(sublime_plugin.EventListener):
+    def on_pre_close_window(self, window):
+        with _renderers_lock:
+            _renderers.pop(window.id(), None)
+
+
+def plugin_loaded():
+    global _health_monitor
+    _get_session_writer()
+    _health_monitor = _HealthMonitor(
+        _get_backends(), interval=float(_setting("health_check_interval", 30))
+    )
+    _health_monitor.start()
+
+
+def plugin_unloaded():
+    if _health_monitor is not None:
+        _health_monitor.stop()
+    if _history_index is not None:
+        _history_index.save(force=True)
+    if _request_manager is not None:
+        _request_manager.shutdown()
+    if _backends is not None:
+        _backends.close()